@@ -1,7 +1,13 @@
+import os
+import threading
+import time
+
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool  # PoolError
 import click
-from flask import g, current_app
+from flask import abort, g, current_app, jsonify
 from flask.cli import with_appcontext
 
 # Database Configuration (Matches your docker-compose.yml)
@@ -10,26 +16,182 @@ DB_NAME = "flaskdb"
 DB_USER = "user"
 DB_PASS = "password"
 
-def get_db():
-    """Connects to the PostgreSQL database."""
-    if 'db' not in g:
+# Raw psycopg2 pool; a request waits up to DB_POOL_TIMEOUT seconds for a free connection
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Up to ``maxconn`` connections are opened on demand and kept open between
+    requests (psycopg2's own ThreadedConnectionPool closes everything above
+    ``minconn`` when it is returned). When all are in use, callers wait
+    instead of failing.
+    """
+
+    def __init__(self, maxconn, timeout, **connect_kwargs):
+        self._connect_kwargs = connect_kwargs
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.stats = {"connects": 0, "checkouts": 0, "in_use": 0, "timeouts": 0, "discarded": 0, "wait_seconds": 0.0}
+
+    def getconn(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise psycopg2.pool.PoolError(f"no connection available within {self.timeout}s")
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
         try:
-            g.db = psycopg2.connect(
+            if conn is None:
+                conn = psycopg2.connect(**self._connect_kwargs)
+                with self._lock:
+                    self.stats["connects"] += 1
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.stats["checkouts"] += 1
+            self.stats["in_use"] += 1
+            self.stats["wait_seconds"] += time.monotonic() - started
+        return conn
+
+    def putconn(self, conn):
+        # Never hand a connection with an open or failed transaction to the next request
+        keep = not conn.closed
+        if keep:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:  # server connection lost
+                keep = False
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    keep = False
+        if not keep:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+        with self._lock:
+            if keep:
+                self._idle.append(conn)
+            self.stats["in_use"] -= 1
+            self.stats["discarded"] += int(not keep)
+        self._slots.release()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, idle=len(self._idle))
+        stats["max"] = self.maxconn
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide psycopg2 pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                DB_POOL_MAX,
+                DB_POOL_TIMEOUT,
                 host=DB_HOST,
                 database=DB_NAME,
                 user=DB_USER,
                 password=DB_PASS
             )
+    return _pool
+
+
+def get_db():
+    """Borrows a pooled connection to the PostgreSQL database for this request."""
+    if 'db' not in g:
+        try:
+            g.db = get_pool().getconn()
         except Exception as e:
             print(f"Error connecting to database: {e}")
             return None
     return g.db
 
 def close_db(e=None):
-    """Closes the connection after the request ends."""
+    """Returns the connection to the pool after the request ends."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().putconn(db)
+
+
+def sqlalchemy_engine_options(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for a service, read from DB_POOL_* variables.
+
+    Every service (web, chatbot, reporting) calls this with its own
+    environment, so each can be sized separately.
+    """
+    options = {"pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1"}
+    if not database_uri.startswith("sqlite"):  # SQLite's default pools take no sizing
+        options.update(
+            pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+            max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+            pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+            pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        )
+    return options
+
+
+def register_pool_metrics(app, db):
+    """Count SQLAlchemy connects/checkouts and serve both pools at /metrics/db-pool.
+
+    The endpoint exists only with DB_POOL_METRICS=1 and answers logged-in
+    admins only. Apps without a LoginManager (the reporting service) cannot
+    tell who is asking, so they answer 404. The check runs per request
+    because create_app() sets up Flask-Login after this is called.
+    """
+    from sqlalchemy import event
+    from flask_login import current_user
+
+    if os.environ.get("DB_POOL_METRICS", "0") != "1":
+        return
+
+    counters = {"connects": 0, "checkouts": 0}
+    counters_lock = threading.Lock()
+
+    def _count(name):
+        def listener(*args):
+            with counters_lock:
+                counters[name] += 1
+        return listener
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "connect", _count("connects"))
+    event.listen(engine, "checkout", _count("checkouts"))
+
+    @app.route('/metrics/db-pool')
+    def db_pool_metrics():
+        if getattr(current_app, 'login_manager', None) is None:
+            abort(404)
+        if not current_user.is_authenticated:
+            abort(401)
+        if current_user.role != 'admin':
+            abort(403)
+        pool = engine.pool
+        sqlalchemy_stats = dict(counters, pool=pool.__class__.__name__, status=pool.status())
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, name):
+                sqlalchemy_stats[name] = getattr(pool, name)()
+        return jsonify({
+            "sqlalchemy": sqlalchemy_stats,
+            "psycopg2": _pool.snapshot() if _pool is not None else None,
+        })
 
 def init_db():
     """Creates tables for ALL modules."""
@@ -5,6 +5,8 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 class Project(db.Model):
     __tablename__ = 'projects'
+    # Projects are looked up by name (registration, developer portal)
+    __table_args__ = (db.Index('uq_projects_name', 'name', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     
@@ -94,6 +96,18 @@ class TribunalClaim(db.Model):
 
 class Defect(db.Model):
     __tablename__ = 'defects'
+    # Hot paths; created by migrate_indexes.py on existing databases and
+    # checked with 'flask module3 check-query-plans'
+    __table_args__ = (
+        # Pins of a project (scan_path IS NULL) and house scans of a project
+        db.Index('ix_defects_project_pins', 'project_id', 'created_at',
+                 postgresql_where=db.text('scan_path IS NULL'), sqlite_where=db.text('scan_path IS NULL')),
+        db.Index('ix_defects_project_scans', 'project_id', 'created_at',
+                 postgresql_where=db.text('scan_path IS NOT NULL'), sqlite_where=db.text('scan_path IS NOT NULL')),
+        # Every defect of a project, newest id first (keyset pages)
+        db.Index('ix_defects_project_id', 'project_id', 'id'),
+        db.Index('ix_defects_user_created', 'user_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=True)
@@ -143,10 +157,128 @@ class Defect(db.Model):
 class DefectImage(db.Model):
     __tablename__ = 'defect_images'
     id = db.Column(db.Integer, primary_key=True)
-    defect_id = db.Column(db.Integer, db.ForeignKey('defects.id'), nullable=False)
+    defect_id = db.Column(db.Integer, db.ForeignKey('defects.id'), nullable=False, index=True)
     image_path = db.Column(db.String(500), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Filled in by app/utils/image_derivatives.py once the upload is committed
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    derivatives = db.Column(db.JSON)  # {'thumb': {'jpeg': path, 'webp': path, 'width', 'height'}, 'medium': {...}}
+
+    def variant(self, size, webp=False):
+        """Relative path of a derivative, or the original while none exists."""
+        entry = (self.derivatives or {}).get(size)
+        if not entry:
+            return self.image_path
+        return entry['webp'] if webp else entry['jpeg']
+
+class Blob(db.Model):
+    """A content-addressed upload, shared by every record that references its path."""
+    __tablename__ = 'blobs'
+    digest = db.Column(db.String(64), primary_key=True)  # sha256 hex
+    path = db.Column(db.String(500), unique=True, nullable=False, index=True)  # Relative to static/
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    unreferenced_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Last drop to zero refs; NULL while referenced
+
+    @classmethod
+    def store(cls, file_storage, static_root):
+        """Save an uploaded file into the blob store and return its relative path.
+
+        The blob row is flushed straight away so reference counting sees it
+        when the referencing record is inserted in the same transaction.
+        """
+        import os
+        from werkzeug.utils import secure_filename
+        from app.utils.blob_store import write_blob
+        _, ext = os.path.splitext(secure_filename(file_storage.filename or ''))
+        path, digest, size, _ = write_blob(file_storage.stream, static_root, ext)
+        return cls.register(digest, path, size)
+
+    @classmethod
+    def register(cls, digest, path, size):
+        """Ensure a row exists for a file already placed in the store."""
+        if db.session.get(cls, digest) is None:
+            db.session.add(cls(digest=digest, path=path, size=size, ref_count=0))
+            db.session.flush()
+        return path
+
+class UploadSession(db.Model):
+    """A resumable upload in progress; parts are appended at ``received``."""
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    expected_sha256 = db.Column(db.String(64))
+    status = db.Column(db.String(20), nullable=False, default='uploading')  # uploading / complete
+    blob_path = db.Column(db.String(500))  # Set once complete
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.total_size,
+            'offset': self.received,
+            'status': self.status,
+            'path': self.blob_path,
+        }
+
+class ModelManifest(db.Model):
+    """Summary of an uploaded GLB, computed once at upload time."""
+    __tablename__ = 'model_manifests'
+    id = db.Column(db.Integer, primary_key=True)
+    model_path = db.Column(db.String(500), unique=True, nullable=False, index=True)  # Relative to static/
+
+    file_size = db.Column(db.BigInteger)
+    bbox_min = db.Column(db.JSON)
+    bbox_max = db.Column(db.JSON)
+    up_axis = db.Column(db.String(4))
+    node_count = db.Column(db.Integer)
+    mesh_count = db.Column(db.Integer)
+    triangle_count = db.Column(db.BigInteger)
+    vertex_count = db.Column(db.BigInteger)
+    snapshot_count = db.Column(db.Integer)
+    textures = db.Column(db.JSON)
+    buffers = db.Column(db.JSON)
+    details = db.Column(db.JSON)  # Full manifest as produced by build_manifest
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @classmethod
+    def record(cls, model_path, file_path):
+        """Compute the manifest for *file_path* and upsert it (caller commits)."""
+        from app.utils.glb_manifest import build_manifest
+        data = build_manifest(file_path)
+        manifest = cls.query.filter_by(model_path=model_path).first() or cls(model_path=model_path)
+        for field in ('file_size', 'bbox_min', 'bbox_max', 'up_axis', 'node_count', 'mesh_count',
+                      'triangle_count', 'vertex_count', 'snapshot_count', 'textures', 'buffers'):
+            setattr(manifest, field, data[field])
+        manifest.details = data
+        db.session.add(manifest)
+        return manifest
+
+    def to_dict(self):
+        return {
+            'file_size': self.file_size,
+            'bbox_min': self.bbox_min,
+            'bbox_max': self.bbox_max,
+            'up_axis': self.up_axis,
+            'node_count': self.node_count,
+            'mesh_count': self.mesh_count,
+            'triangle_count': self.triangle_count,
+            'vertex_count': self.vertex_count,
+            'snapshot_count': self.snapshot_count,
+            'texture_count': len(self.textures or []),
+        }
+
 class GeneratedReport(db.Model):
     __tablename__ = 'generated_reports'
     id = db.Column(db.Integer, primary_key=True)
@@ -165,3 +297,284 @@ class ChatHistory(db.Model):
     user_message = db.Column(db.Text)
     bot_response = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Defect statuses that make a project count as in progress
+PROCESSING_STATUSES = ('in_progress', 'locked', 'Processing')
+
+# Work-order buckets shown on the developer portal
+STATUS_BUCKETS = {
+    'new': ('Reported', 'draft', 'New', 'Pending'),
+    'in_progress': ('in_progress', 'Processing', 'locked', 'Under Review'),
+    'completed': ('completed', 'Fixed'),
+}
+
+class ProjectSummary(db.Model):
+    """Defect counts and latest house scan of one project.
+
+    Kept current in the same flush as every defect change by the hooks at
+    the end of this module; 'flask module3 rebuild-project-summaries'
+    recomputes all rows from the defects.
+    """
+    __tablename__ = 'project_summary'
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True)
+
+    defect_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)    # status 'completed'
+    processing_count = db.Column(db.Integer, nullable=False, default=0)   # PROCESSING_STATUSES
+    rejected_count = db.Column(db.Integer, nullable=False, default=0)     # status 'rejected'
+    new_count = db.Column(db.Integer, nullable=False, default=0)          # STATUS_BUCKETS['new']
+    in_progress_count = db.Column(db.Integer, nullable=False, default=0)  # STATUS_BUCKETS['in_progress']
+    resolved_count = db.Column(db.Integer, nullable=False, default=0)     # STATUS_BUCKETS['completed']
+
+    # Newest defect with a scan_path (a house scan upload)
+    latest_scan_id = db.Column(db.Integer)
+    latest_scan_path = db.Column(db.String(500))
+    latest_scan_at = db.Column(db.DateTime)
+
+
+# --- Blob reference counting ---
+# Paths on these columns count as references to a blob. Counts are adjusted
+# in the same flush as the change, so ORM cascades (project -> defects ->
+# images) are covered; paths outside the blob store simply match no row.
+from sqlalchemy import case, event, inspect
+
+_BLOB_REFERENCES = ((Defect, 'scan_path'), (DefectImage, 'image_path'), (Project, 'master_model_path'))
+
+
+def _adjust_blob_refs(connection, path, delta):
+    if path:
+        blobs = Blob.__table__
+        connection.execute(
+            blobs.update()
+            .where(blobs.c.path == path)
+            .values(
+                ref_count=blobs.c.ref_count + delta,
+                # gc-blobs measures its grace period from here
+                unreferenced_at=case((blobs.c.ref_count + delta <= 0, datetime.utcnow()), else_=None),
+            )
+        )
+
+
+def _track_blob_refs(model, column):
+    @event.listens_for(model, 'after_insert')
+    def _after_insert(mapper, connection, target):
+        _adjust_blob_refs(connection, getattr(target, column), 1)
+
+    @event.listens_for(model, 'before_delete')
+    def _before_delete(mapper, connection, target):
+        _adjust_blob_refs(connection, getattr(target, column), -1)
+
+    @event.listens_for(model, 'after_update')
+    def _after_update(mapper, connection, target):
+        history = inspect(target).attrs[column].history
+        if history.has_changes():
+            for old in history.deleted:
+                _adjust_blob_refs(connection, old, -1)
+            for new in history.added:
+                _adjust_blob_refs(connection, new, 1)
+
+
+for _model, _column in _BLOB_REFERENCES:
+    _track_blob_refs(_model, _column)
+
+
+# --- Image derivatives ---
+# New defect photos are queued for thumbnail/medium generation once the
+# transaction that adds them commits, whichever route saved them.
+from flask import current_app, has_app_context
+from sqlalchemy.orm import Session, object_session
+
+
+@event.listens_for(DefectImage, 'after_insert')
+def _defer_image_derivatives(mapper, connection, target):
+    if target.image_path and target.derivatives is None:
+        object_session(target).info.setdefault('pending_derivatives', set()).add(target.image_path)
+
+
+@event.listens_for(Session, 'after_commit')
+def _queue_image_derivatives(session):
+    paths = session.info.pop('pending_derivatives', None)
+    if paths and has_app_context():
+        from app.utils.image_derivatives import queue_derivatives
+        queue_derivatives(current_app._get_current_object(), paths)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_image_derivatives(session):
+    session.info.pop('pending_derivatives', None)
+
+
+# --- Project summaries ---
+# Every defect insert, update and delete adjusts its project's summary row
+# in the same transaction, so ORM cascades are covered. A status change is
+# a counter update. Anything that may move the latest house scan, or a
+# project without a row yet, has its row recomputed from its defects once
+# the flush has written every change.
+from sqlalchemy import case, func, select
+
+# Summary counter -> defect statuses it counts
+_SUMMARY_COUNTERS = {
+    'completed_count': ('completed',),
+    'processing_count': PROCESSING_STATUSES,
+    'rejected_count': ('rejected',),
+    'new_count': STATUS_BUCKETS['new'],
+    'in_progress_count': STATUS_BUCKETS['in_progress'],
+    'resolved_count': STATUS_BUCKETS['completed'],
+}
+# First key of pg_advisory_xact_lock(space, project_id) for summary rebuilds
+_SUMMARY_LOCK_SPACE = 7301
+
+
+def compute_project_summary(connection, project_id):
+    """Summary column values of *project_id*, counted from its defects."""
+    defects = Defect.__table__
+    counts = connection.execute(
+        select(
+            func.count(defects.c.id),
+            *[func.coalesce(func.sum(case((defects.c.status.in_(statuses), 1), else_=0)), 0)
+              for statuses in _SUMMARY_COUNTERS.values()],
+        ).where(defects.c.project_id == project_id)
+    ).one()
+    scan = connection.execute(
+        select(defects.c.id, defects.c.scan_path, defects.c.created_at)
+        .where(defects.c.project_id == project_id, defects.c.scan_path.isnot(None))
+        .order_by(defects.c.created_at.desc().nulls_last(), defects.c.id.desc())
+        .limit(1)
+    ).first()
+
+    values = dict(zip(['defect_count', *_SUMMARY_COUNTERS], counts))
+    values.update(
+        latest_scan_id=scan.id if scan else None,
+        latest_scan_path=scan.scan_path if scan else None,
+        latest_scan_at=scan.created_at if scan else None,
+    )
+    return values
+
+
+def _lock_project_summary(connection, project_id):
+    """Serialize writers of *project_id*'s summary until this transaction ends.
+
+    The advisory lock orders rebuilds even while the row does not exist;
+    the row lock makes a rebuild wait for (and count the defects of) a
+    transaction that has already adjusted the counters, and makes later
+    adjustments wait for the rebuilt row. SQLite has a single writer.
+    """
+    summary = ProjectSummary.__table__
+    if connection.dialect.name == 'postgresql':
+        connection.execute(select(func.pg_advisory_xact_lock(_SUMMARY_LOCK_SPACE, project_id)))
+    connection.execute(select(summary.c.project_id).where(summary.c.project_id == project_id).with_for_update())
+
+
+def _upsert(connection, table, key, values):
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).values(**key, **values)
+        connection.execute(statement.on_conflict_do_update(index_elements=list(key), set_=values))
+        return
+    updated = connection.execute(
+        table.update().where(*[table.c[name] == value for name, value in key.items()]).values(values)
+    )
+    if not updated.rowcount:
+        connection.execute(table.insert().values(**key, **values))
+
+
+def rebuild_project_summary(connection, project_id):
+    """Recompute the summary row of *project_id* from its defects."""
+    _lock_project_summary(connection, project_id)
+    values = compute_project_summary(connection, project_id)
+    _upsert(connection, ProjectSummary.__table__, {'project_id': project_id}, values)
+
+
+def _rebuild_after_flush(target, *project_ids):
+    pending = object_session(target).info.setdefault('pending_summaries', set())
+    pending.update(project_id for project_id in project_ids if project_id is not None)
+
+
+def _adjust_summary(connection, target, project_id, status, delta):
+    summary = ProjectSummary.__table__
+    values = {'defect_count': summary.c.defect_count + delta}
+    for name, statuses in _SUMMARY_COUNTERS.items():
+        if status in statuses:
+            values[name] = summary.c[name] + delta
+    updated = connection.execute(summary.update().where(summary.c.project_id == project_id).values(values))
+    if not updated.rowcount:
+        _rebuild_after_flush(target, project_id)
+
+
+def _previous(target, column):
+    """``(value before this flush, known)`` of *column*."""
+    history = inspect(target).attrs[column].history
+    if not history.has_changes():
+        return getattr(target, column), True
+    if history.deleted:
+        return history.deleted[0], True
+    return None, False
+
+
+@event.listens_for(Project, 'after_insert')
+def _create_project_summary(mapper, connection, target):
+    connection.execute(ProjectSummary.__table__.insert().values(project_id=target.id))
+
+
+@event.listens_for(Project, 'before_delete')
+def _delete_project_summary(mapper, connection, target):
+    summary = ProjectSummary.__table__
+    connection.execute(summary.delete().where(summary.c.project_id == target.id))
+    object_session(target).info.get('pending_summaries', set()).discard(target.id)
+
+
+@event.listens_for(Defect, 'after_insert')
+def _summary_defect_inserted(mapper, connection, target):
+    if target.project_id is None:
+        return
+    if target.scan_path:
+        _rebuild_after_flush(target, target.project_id)
+    else:
+        _adjust_summary(connection, target, target.project_id, target.status, 1)
+
+
+@event.listens_for(Defect, 'before_delete')
+def _summary_defect_deleted(mapper, connection, target):
+    project_id, project_known = _previous(target, 'project_id')
+    status, status_known = _previous(target, 'status')
+    if project_known and status_known and not target.scan_path:
+        if project_id is not None:
+            _adjust_summary(connection, target, project_id, status, -1)
+    else:
+        _rebuild_after_flush(target, project_id, target.project_id)
+
+
+@event.listens_for(Defect, 'after_update')
+def _summary_defect_updated(mapper, connection, target):
+    state = inspect(target)
+    changed = {column for column in ('project_id', 'status', 'scan_path', 'created_at')
+               if state.attrs[column].history.has_changes()}
+    if not changed:
+        return
+    old_project_id, _ = _previous(target, 'project_id')
+    old_status, status_known = _previous(target, 'status')
+    if changed == {'status'} and status_known and not target.scan_path:
+        if target.project_id is not None:
+            _adjust_summary(connection, target, target.project_id, old_status, -1)
+            _adjust_summary(connection, target, target.project_id, target.status, 1)
+    else:
+        _rebuild_after_flush(target, old_project_id, target.project_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _rebuild_pending_summaries(session, flush_context):
+    project_ids = session.info.pop('pending_summaries', None)
+    if project_ids:
+        connection = session.connection()
+        for project_id in sorted(project_ids):
+            rebuild_project_summary(connection, project_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending_summaries(session):
+    session.info.pop('pending_summaries', None)
@@ -1,14 +1,28 @@
 import os
+import hashlib
+import threading
+import uuid
 from datetime import datetime
+import click
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from app.module3.extensions import db
-from app.models import Defect, Project, DefectImage
+from app.models import Defect, Project, DefectImage, ModelManifest, Blob, User, UploadSession
+from app.utils.blob_store import CHUNK_SIZE, IMMUTABLE_CACHE_CONTROL, adopt_file, file_sha256, is_blob_path, orphan_files
+from app.utils.scan_preparation import queue_scan_preparation
 
 # Define the Blueprint
 bp = Blueprint('module2', __name__, url_prefix='/module2')
 
+def _free_project_name(name):
+    # Project names are unique; number a fallback name that is already taken
+    candidate, n = name, 1
+    while Project.query.filter_by(name=candidate).first():
+        n += 1
+        candidate = f"{name} {n}"
+    return candidate
+
 @bp.route('/insert_defect', methods=['GET', 'POST'])
 @login_required
 def insert_defect():
@@ -19,17 +33,15 @@ def insert_defect():
             lidar_path = None
             
             if lidar_file and lidar_file.filename:
-                # Save the new file
-                filename = secure_filename(lidar_file.filename)
-                # Ensure uploads directory exists
-                upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-                os.makedirs(upload_folder, exist_ok=True)
-                
-                # Save file
-                file_full_path = os.path.join(upload_folder, filename)
-                lidar_file.save(file_full_path)
-                lidar_path = f"uploads/{filename}"
-                
+                # Store by content hash so re-uploads and same-named files never collide
+                lidar_path = Blob.store(lidar_file, os.path.join(current_app.root_path, 'static'))
+            elif request.form.get('upload_id'):
+                # Scan already sent through the resumable upload endpoints
+                upload = UploadSession.query.get(request.form['upload_id'])
+                if not upload or upload.status != 'complete' or upload.user_id != current_user.id:
+                    raise ValueError("Scan upload is missing or incomplete")
+                lidar_path = upload.blob_path
+            
             # 2. Get Coordinates from Form
             try:
                 x = float(request.form.get('x', 0))
@@ -45,7 +57,7 @@ def insert_defect():
             if not project_id:
                 # Auto-create project for unlinked user (fallback)
                 from datetime import datetime
-                project_name = f"{current_user.full_name or current_user.email}'s Park"
+                project_name = _free_project_name(f"{current_user.full_name or current_user.email}'s Park")
                 
                 new_project = Project(
                     name=project_name
@@ -75,23 +87,17 @@ def insert_defect():
             uploaded_images = request.files.getlist('images')
             for img_file in uploaded_images:
                 if img_file and img_file.filename:
-                    img_filename = secure_filename(img_file.filename)
-                    # Use unique names
-                    from datetime import datetime
-                    time_prefix = datetime.now().strftime('%Y%m%d%H%M%S_')
-                    img_filename = time_prefix + img_filename
-                    upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-                    os.makedirs(upload_folder, exist_ok=True)
-                    
-                    img_full_path = os.path.join(upload_folder, img_filename)
-                    img_file.save(img_full_path)
-                    
+                    img_path = Blob.store(img_file, os.path.join(current_app.root_path, 'static'))
                     db.session.add(DefectImage(
                         defect_id=new_defect.id,
-                        image_path=f"uploads/{img_filename}"
+                        image_path=img_path
                     ))
             
             db.session.commit()
+
+            if lidar_path:
+                # LOD variants and the manifest are built off the request
+                queue_scan_preparation(current_app._get_current_object(), lidar_path)
             
             # 5. Trigger the success message
             flash('Defect claim submitted successfully!', 'success')
@@ -129,6 +135,146 @@ def insert_defect():
                           model_url=model_url, 
                           scan_id=project_id) # scan_id -> project_id in template logic eventually
 
+# --- Resumable uploads ---
+# POST /uploads               {filename, size, sha256?} -> {upload_id, offset}
+# PUT  /uploads/<id>?offset=N raw bytes of the next part
+# GET  /uploads/<id>          current offset, to resume after a dropped connection
+# POST /uploads/<id>/complete verify, move into the blob store
+# Each part is a short request streamed straight to disk, so no worker is
+# held for the whole transfer and nothing is buffered in memory.
+
+UPLOAD_PART_MAX = 16 * 1024 * 1024
+UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024
+
+# Running sha256 per upload while parts arrive in order on this process;
+# anything else (restart, another worker) falls back to hashing the file.
+_upload_hashers = {}
+_upload_hashers_lock = threading.Lock()
+
+def _partial_path(upload_id):
+    folder = os.path.join(current_app.instance_path, 'uploads', 'partial')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{upload_id}.part")
+
+def _own_upload(upload_id, for_update=False):
+    query = UploadSession.query
+    if for_update:
+        query = query.with_for_update()
+    upload = query.filter_by(id=upload_id).first()
+    if not upload or upload.user_id != current_user.id:
+        return None
+    return upload
+
+@bp.route('/uploads', methods=['POST'])
+@login_required
+def upload_init():
+    data = request.get_json(silent=True) or request.form
+    filename = secure_filename(data.get('filename') or '')
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        size = -1
+    if not filename or size < 0 or size > current_app.config.get('UPLOAD_MAX_SIZE', UPLOAD_MAX_SIZE):
+        return jsonify({'status': 'error', 'message': 'filename and a valid size are required'}), 400
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        filename=filename,
+        total_size=size,
+        received=0,
+        expected_sha256=(data.get('sha256') or '').lower() or None,
+    )
+    db.session.add(upload)
+    db.session.commit()
+    open(_partial_path(upload.id), 'wb').close()
+    with _upload_hashers_lock:
+        _upload_hashers[upload.id] = (0, hashlib.sha256())
+
+    payload = upload.to_dict()
+    payload['part_size'] = UPLOAD_PART_MAX
+    return jsonify(payload), 201
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    upload = _own_upload(upload_id)
+    if not upload:
+        return jsonify({'status': 'error', 'message': 'Unknown upload'}), 404
+    return jsonify(upload.to_dict())
+
+@bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_part(upload_id):
+    upload = _own_upload(upload_id, for_update=True)
+    if not upload:
+        return jsonify({'status': 'error', 'message': 'Unknown upload'}), 404
+    if upload.status != 'uploading':
+        return jsonify(upload.to_dict()), 409
+
+    offset = request.args.get('offset', type=int)
+    if offset != upload.received:
+        # Client is out of step (e.g. a retried part); tell it where to resume
+        db.session.rollback()
+        return jsonify(upload.to_dict()), 409
+
+    limit = min(UPLOAD_PART_MAX, upload.total_size - offset)
+    with _upload_hashers_lock:
+        cached = _upload_hashers.get(upload_id)
+    hasher = cached[1].copy() if cached and cached[0] == offset else None
+
+    written = 0
+    with open(_partial_path(upload_id), 'r+b') as out:
+        out.seek(offset)
+        for chunk in iter(lambda: request.stream.read(CHUNK_SIZE), b''):
+            written += len(chunk)
+            if written > limit:
+                db.session.rollback()
+                return jsonify({'status': 'error', 'message': 'Part exceeds the upload size or part limit'}), 413
+            out.write(chunk)
+            if hasher:
+                hasher.update(chunk)
+
+    upload.received = offset + written
+    db.session.commit()
+    with _upload_hashers_lock:
+        if hasher:
+            _upload_hashers[upload_id] = (upload.received, hasher)
+        else:
+            _upload_hashers.pop(upload_id, None)
+    return jsonify(upload.to_dict())
+
+@bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def upload_complete(upload_id):
+    upload = _own_upload(upload_id, for_update=True)
+    if not upload:
+        return jsonify({'status': 'error', 'message': 'Unknown upload'}), 404
+    if upload.status == 'complete':
+        return jsonify(upload.to_dict())
+    if upload.received != upload.total_size:
+        db.session.rollback()
+        return jsonify(upload.to_dict()), 409
+
+    part_path = _partial_path(upload_id)
+    with open(part_path, 'r+b') as fh:
+        fh.truncate(upload.total_size)  # Drop bytes from parts that failed mid-way
+    with _upload_hashers_lock:
+        cached = _upload_hashers.pop(upload_id, None)
+    digest = cached[1].hexdigest() if cached and cached[0] == upload.total_size else file_sha256(part_path)
+    if upload.expected_sha256 and upload.expected_sha256 != digest:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': 'Checksum mismatch', 'sha256': digest}), 422
+
+    static_root = os.path.join(current_app.root_path, 'static')
+    _, ext = os.path.splitext(upload.filename)
+    blob_path, _ = adopt_file(part_path, static_root, digest, ext)
+    Blob.register(digest, blob_path, upload.total_size)
+    upload.status = 'complete'
+    upload.blob_path = blob_path
+    db.session.commit()
+    return jsonify(upload.to_dict())
+
 @bp.route('/api/defect/add', methods=['POST'])
 def api_add_defect():
     try:
@@ -142,13 +288,8 @@ def api_add_defect():
             return jsonify({'status': 'error', 'message': 'No selected file'}), 400
             
         if file:
-            # 2. Save File
-            filename = secure_filename(file.filename)
-            upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-            os.makedirs(upload_folder, exist_ok=True)
-            
-            file_path = os.path.join(upload_folder, filename)
-            file.save(file_path)
+            # 2. Save File (content-addressed, shared with identical uploads)
+            image_path = Blob.store(file, os.path.join(current_app.root_path, 'static'))
             
             # 3. Handle User Association
             user_id = request.form.get('user_id')
@@ -163,7 +304,7 @@ def api_add_defect():
             # Auto-create project for API calls if missing
             if user and not project_id:
                 from datetime import datetime
-                project_name = f"{user.full_name or user.email}'s Project ({datetime.now().strftime('%H%M%S')})"
+                project_name = _free_project_name(f"{user.full_name or user.email}'s Project ({datetime.now().strftime('%H%M%S')})")
                 new_project = Project(name=project_name)
                 db.session.add(new_project)
                 db.session.flush()
@@ -178,13 +319,12 @@ def api_add_defect():
                 description=request.form.get('description'),
                 location=request.form.get('location'),
                 status='Reported',
-                x_coord=0, y_coord=0, z_coord=0,
-                image_path=f"uploads/{filename}" # Save image path
+                x_coord=0, y_coord=0, z_coord=0
             )
             
             db.session.add(new_defect)
             db.session.flush() # Get ID
-            
+            db.session.add(DefectImage(defect_id=new_defect.id, image_path=image_path))
 
             db.session.commit()
             
@@ -197,4 +337,72 @@ def api_add_defect():
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({'status': 'error', 'message': str(e)}), 500
\ No newline at end of file
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@bp.after_app_request
+def cache_blobs_forever(response):
+    """Blob URLs change whenever their content does, so they never need revalidating."""
+    if response.status_code == 200 and request.path.startswith('/static/') and is_blob_path(request.path[len('/static/'):]):
+        response.cache_control.max_age = None
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+# --- CLI ---
+
+@bp.cli.command('gc-blobs')
+@click.option('--grace-hours', type=float, default=24, show_default=True,
+              help='Keep blobs unreferenced for less than this, and completed uploads not yet used')
+def gc_blobs_command(grace_hours):
+    """Delete stored uploads that no record references any more.
+
+    A completed resumable upload keeps its blob alive until it expires, so a
+    scan is not collected between ``/complete`` and ``insert_defect``.
+    """
+    import time
+    from datetime import timedelta
+    from app.utils.glb_lod import remove_lods
+    from app.utils.glb_tiles import remove_tiles
+    from app.utils.image_derivatives import remove_derivatives
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    static_root = os.path.join(current_app.root_path, 'static')
+    removed = 0
+    pending = db.session.query(UploadSession.blob_path).filter(
+        UploadSession.blob_path != None, UploadSession.updated_at >= cutoff
+    )
+    unreferenced = Blob.query.filter(
+        Blob.ref_count <= 0, Blob.unreferenced_at < cutoff, Blob.path.not_in(pending)
+    )
+    for blob in unreferenced.all():
+        file_path = os.path.join(static_root, blob.path)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        remove_lods(file_path)
+        remove_tiles(file_path)
+        remove_derivatives(file_path)
+        ModelManifest.query.filter_by(model_path=blob.path).delete()
+        db.session.delete(blob)
+        removed += 1
+
+    # Files moved into the store by requests that rolled back before their row committed
+    known_paths = {path for (path,) in db.session.query(Blob.path)}
+    orphans = 0
+    for relative_path, file_path in orphan_files(static_root, known_paths, time.time() - grace_hours * 3600):
+        os.remove(file_path)
+        if relative_path:
+            remove_lods(file_path)
+            remove_tiles(file_path)
+            remove_derivatives(file_path)
+            ModelManifest.query.filter_by(model_path=relative_path).delete()
+        orphans += 1
+
+    # Abandoned resumable uploads, and completed ones that expired unused
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in stale:
+        part_path = _partial_path(upload.id)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        db.session.delete(upload)
+    db.session.commit()
+    click.echo(f"Removed {removed} unreferenced blobs, {orphans} orphaned files and {len(stale)} expired uploads.")
@@ -0,0 +1,252 @@
+"""Aggregate and paginated queries behind the module 3 listing pages.
+
+Each listing is served by a fixed number of SQL statements. Per-project
+defect counts and the latest house scan are read from ``project_summary``,
+one row per project kept current as defects change (see app/models.py).
+Rows are created with their project, and by migrate_project_summaries.py
+or 'flask module3 rebuild-project-summaries' for older projects. Readers
+never write: a project still without a row has its values counted from its
+defects for that read only.
+
+Defect lists are paged by keyset: newest first by id, continuing below the
+last id shown. The cost of a page does not depend on how deep into the
+list it is.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import String, cast, func, select
+from sqlalchemy.orm import aliased
+
+from app.module3.extensions import db
+from app.models import STATUS_BUCKETS, Defect, DefectImage, Project, ProjectSummary, compute_project_summary
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def project_status(total, completed, processing, rejected):
+    """Rollup status of a project from its defect status counts."""
+    if not total:
+        return 'New'
+    if completed == total:
+        return 'Completed'
+    if processing:
+        return 'Processing'
+    if rejected:
+        return 'Action Required'
+    return 'Pending'
+
+
+def _with_summaries(query):
+    """Run *query* (``Project, ProjectSummary`` outer join), counting missing summaries.
+
+    A missing summary is returned as a transient ``ProjectSummary`` that is
+    never added to the session.
+    """
+    rows = query.all()
+    if all(summary is not None for _, summary in rows):
+        return rows
+    connection = db.session.connection()
+    return [
+        (project, summary if summary is not None
+         else ProjectSummary(project_id=project.id, **compute_project_summary(connection, project.id)))
+        for project, summary in rows
+    ]
+
+
+def _summaries(project_filter=None):
+    query = db.session.query(Project, ProjectSummary).outerjoin(
+        ProjectSummary, ProjectSummary.project_id == Project.id
+    )
+    if project_filter is not None:
+        query = query.filter(project_filter)
+    return _with_summaries(query.order_by(Project.id))
+
+
+def project_listing(project_filter=None):
+    """Projects matching *project_filter* with their defect rollup.
+
+    Yields ``(project, total, completed, processing, rejected,
+    latest_scan_id, latest_scan_path)`` ordered by project id. The latest
+    scan is the newest defect with a ``scan_path`` (a house scan upload).
+    """
+    return [
+        (project, summary.defect_count, summary.completed_count, summary.processing_count,
+         summary.rejected_count, summary.latest_scan_id, summary.latest_scan_path)
+        for project, summary in _summaries(project_filter)
+    ]
+
+
+def project_summary(project_id):
+    """The ``ProjectSummary`` of one project, or ``None`` if it does not exist."""
+    rows = _summaries(Project.id == project_id)
+    return rows[0][1] if rows else None
+
+
+def project_defect_counts():
+    """``[(project name, defect count)]`` for every project."""
+    return [(project.name, summary.defect_count) for project, summary in _summaries()]
+
+
+def project_bucket_counts(summary):
+    """``status_bucket_counts()`` of a whole project, from its summary."""
+    return {
+        'new': summary.new_count,
+        'in_progress': summary.in_progress_count,
+        'completed': summary.resolved_count,
+        'total': summary.defect_count,
+    }
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+def defect_filters(project_id=None, status=None, severity=None, date_from=None, date_to=None):
+    """SQL conditions for the listing filters.
+
+    *status* is a bucket name from ``STATUS_BUCKETS`` or a literal status;
+    dates are ``YYYY-MM-DD`` and both ends are inclusive. Empty or malformed
+    values are ignored.
+    """
+    conditions = []
+    if project_id:
+        conditions.append(Defect.project_id == project_id)
+    if status:
+        bucket = STATUS_BUCKETS.get(status)
+        conditions.append(Defect.status.in_(bucket) if bucket else Defect.status == status)
+    if severity:
+        conditions.append(Defect.severity == severity)
+    start = _parse_date(date_from)
+    if start:
+        conditions.append(Defect.created_at >= start)
+    end = _parse_date(date_to)
+    if end:
+        conditions.append(Defect.created_at < end + timedelta(days=1))
+    return conditions
+
+
+def status_bucket_counts(conditions=()):
+    """Defects per ``STATUS_BUCKETS`` bucket, plus ``total``, from one GROUP BY."""
+    counts = dict.fromkeys(STATUS_BUCKETS, 0)
+    counts['total'] = 0
+    rows = db.session.query(Defect.status, func.count(Defect.id)).filter(*conditions).group_by(Defect.status)
+    for status, count in rows:
+        counts['total'] += count
+        for bucket, statuses in STATUS_BUCKETS.items():
+            if status in statuses:
+                counts[bucket] += count
+                break
+    return counts
+
+
+def page_size(value):
+    """Requested page size, clamped to ``1..MAX_PAGE_SIZE``."""
+    return max(1, min(value or PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def keyset_query(query, before_id=None, limit=PAGE_SIZE):
+    """*query* restricted to one page, newest first, below *before_id*.
+
+    One row more than *limit* is selected so the caller can tell whether
+    another page follows.
+    """
+    if before_id:
+        query = query.filter(Defect.id < before_id)
+    return query.order_by(Defect.id.desc()).limit(limit + 1)
+
+
+def keyset_page(query, before_id=None, limit=PAGE_SIZE):
+    """One page of a Defect *query*, newest first, below *before_id*.
+
+    *query* may select Defect entities or columns including ``Defect.id``.
+    Returns ``(rows, next_before_id)``; the latter is ``None`` on the last
+    page.
+    """
+    rows = keyset_query(query, before_id, limit).all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+def defect_count(conditions=()):
+    return db.session.query(func.count(Defect.id)).filter(*conditions).scalar()
+
+
+def case_page(conditions=(), before_id=None, limit=PAGE_SIZE):
+    """One keyset page of defects as plain rows, with their project name.
+
+    Only the columns the case listings render are selected; no Defect
+    objects are built and no relationships are loaded.
+    """
+    query = (
+        db.session.query(
+            Defect.id,
+            Defect.location,
+            Defect.description,
+            Defect.status,
+            Defect.severity,
+            Defect.element,
+            Defect.scan_path,
+            Defect.project_id,
+            Project.name.label('project_name'),
+        )
+        .outerjoin(Project, Project.id == Defect.project_id)
+        .filter(*conditions)
+    )
+    return keyset_page(query, before_id, limit)
+
+
+def first_image_ids(defect_ids):
+    """``{defect id: id of its first image}`` for *defect_ids*, in one query."""
+    if not defect_ids:
+        return {}
+    return dict(
+        db.session.query(DefectImage.defect_id, func.min(DefectImage.id))
+        .filter(DefectImage.defect_id.in_(defect_ids))
+        .group_by(DefectImage.defect_id)
+        .all()
+    )
+
+
+def pin_query(*conditions):
+    """Column rows of the defects matching *conditions*, with their first image.
+
+    Selects only what the 3D viewer's pin payload needs, in the order
+    ``_pin_serializer()`` unpacks it. ``created_at`` comes back as its
+    ``YYYY-MM-DD`` text. The first image (lowest id) is joined through a
+    correlated lookup on ``defect_images.defect_id``, so no Defect objects
+    or image collections are built.
+    """
+    candidate = aliased(DefectImage)
+    first_image_id = (
+        select(candidate.id)
+        .where(candidate.defect_id == Defect.id)
+        .order_by(candidate.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return (
+        db.session.query(
+            Defect.id,
+            Defect.x_coord,
+            Defect.y_coord,
+            Defect.z_coord,
+            Defect.element,
+            Defect.location,
+            Defect.defect_type,
+            Defect.severity,
+            Defect.status,
+            Defect.description,
+            func.substr(cast(Defect.created_at, String), 1, 10).label('created_at'),
+            Defect.notes,
+            DefectImage.id.label('image_id'),
+            DefectImage.image_path,
+        )
+        .outerjoin(DefectImage, DefectImage.id == first_image_id)
+        .filter(*conditions)
+        .order_by(Defect.id)
+    )
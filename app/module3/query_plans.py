@@ -0,0 +1,100 @@
+"""EXPLAIN check that the hot defect queries are served by indexes.
+
+Each hot query is built the way the route noted next to it builds it.
+``check_query_plans()`` asks the database for its plan and flags any full
+table scan of ``defects``, ``defect_images`` or ``projects``.
+
+PostgreSQL plans a sequential scan of a small table even when a usable
+index exists, so sequential scans are disabled for the EXPLAIN. A
+``Seq Scan`` left in the plan then means no index fits the query. SQLite
+reports ``SCAN <table>`` (without an index) for the same case.
+"""
+import json
+
+from app.module3.extensions import db
+from app.models import Defect, DefectImage, Project
+from app.module3.queries import PAGE_SIZE, keyset_query, pin_query
+
+CHECKED_TABLES = ('defects', 'defect_images', 'projects')
+
+
+def _sample_ids():
+    project_id = db.session.query(db.func.min(Project.id)).scalar() or 1
+    user_id = db.session.query(db.func.min(Defect.user_id)).scalar() or 1
+    return project_id, user_id
+
+
+def _hot_queries():
+    project_id, user_id = _sample_ids()
+    return [
+        # api_project_defects
+        ('project pins', pin_query(Defect.project_id == project_id, Defect.scan_path == None)),
+        # visualize
+        ('latest project scan', Defect.query.filter_by(project_id=project_id)
+            .filter(Defect.scan_path != None).order_by(Defect.created_at.desc()).limit(1)),
+        # developer_portal
+        ('project defect page', keyset_query(Defect.query.filter(Defect.project_id == project_id),
+                                             before_id=1_000_000, limit=PAGE_SIZE)),
+        # dashboard
+        ('user defects', Defect.query.filter_by(user_id=user_id).order_by(Defect.created_at.desc())),
+        # auth.register, developer_portal
+        ('project by name', Project.query.filter_by(name='sample').limit(1)),
+        # selectinload(Defect.images)
+        ('defect images', DefectImage.query.filter(DefectImage.defect_id.in_([1, 2, 3]))),
+    ]
+
+
+def _statement_sql(query):
+    statement = getattr(query, 'statement', query)
+    return str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+
+
+def _postgres_plan(conn, sql):
+    conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    plan = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}').scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    lines, full_scans = [], []
+
+    def walk(node, depth):
+        relation = node.get('Relation Name')
+        label = node['Node Type'] + (f" on {relation}" if relation else '')
+        if node.get('Index Name'):
+            label += f" using {node['Index Name']}"
+        lines.append('  ' * depth + label)
+        if node['Node Type'] == 'Seq Scan' and relation in CHECKED_TABLES:
+            full_scans.append(relation)
+        for child in node.get('Plans', ()):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines, full_scans
+
+
+def _sqlite_plan(conn, sql):
+    lines, full_scans = [], []
+    for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}'):
+        detail = row[-1]
+        lines.append(detail)
+        words = detail.split()
+        if words[:1] == ['SCAN'] and len(words) > 1 and words[1] in CHECKED_TABLES and 'INDEX' not in detail:
+            full_scans.append(words[1])
+    return lines, full_scans
+
+
+def explain(query):
+    """``(plan lines, tables read by a full scan)`` for *query*."""
+    sql = _statement_sql(query)
+    planner = _postgres_plan if db.engine.dialect.name == 'postgresql' else _sqlite_plan
+    with db.engine.connect() as conn:
+        with conn.begin() as transaction:
+            try:
+                return planner(conn, sql)
+            finally:
+                transaction.rollback()
+
+
+def check_query_plans():
+    """``[(name, plan lines, full scans)]`` for every hot query."""
+    return [(name, *explain(query)) for name, query in _hot_queries()]
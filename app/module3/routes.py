@@ -1,10 +1,26 @@
+import itertools
+import math
 import os
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, send_from_directory
+from urllib.parse import quote as url_quote
+import click
+from flask import Blueprint, abort, render_template, request, redirect, url_for, flash, current_app, jsonify, send_from_directory, stream_with_context
 from flask_login import login_required, current_user
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
 import requests
 from werkzeug.utils import secure_filename
 from app.module3.extensions import db
-from app.models import Defect, Project, User
+from app.models import Defect, DefectImage, Project, ProjectSummary, User, ModelManifest, Blob, rebuild_project_summary
+from app.module3 import spatial_index
+from app.module3.query_plans import check_query_plans
+from app.module3.queries import (
+    case_page, defect_count, defect_filters, first_image_ids, keyset_page, page_size, project_bucket_counts,
+    pin_query, project_defect_counts, project_listing, project_status, project_summary, status_bucket_counts,
+)
+from app.utils.glb_lod import available_lods, resolve_lod
+from app.utils.glb_tiles import build_tiles, load_tileset, tiles_dir
+from app.utils.image_derivatives import SIZES as IMAGE_SIZES, queue_derivatives
+from app.utils import json_stream, pin_buffer
 
 bp = Blueprint('module3', __name__, url_prefix='/module3')
 
@@ -21,76 +37,88 @@ def list_projects():
     # Since 'Projects' means Housing Areas now, if user is homeowner, show their project.
     # If developer, show their projects.
     
-    projects_list = []
-    
     if current_user.role == 'user':
-        projects_set = set()
-        user_defects = Defect.query.filter_by(user_id=current_user.id).all()
-        for d in user_defects:
-            if d.project_id:
-                p = Project.query.get(d.project_id)
-                if p: projects_set.add(p)
-                
-        if current_user.project_id:
-             p = Project.query.get(current_user.project_id)
-             # Only show project on first login if it has a developer master model
-             # If user uploaded a scan themselves, it gets handled in user_defects loop above
-             if p and p.master_model_path:
-                 projects_set.add(p)
-             
-        projects_query = list(projects_set)
+        # Projects the homeowner reported defects in, plus their own project
+        # once the developer has published its master model
+        user_projects = db.session.query(Defect.project_id).filter(Defect.user_id == current_user.id)
+        rows = project_listing(or_(
+            Project.id.in_(user_projects),
+            and_(Project.id == current_user.project_id,
+                 Project.master_model_path.isnot(None), Project.master_model_path != ''),
+        ))
     elif current_user.role == 'developer':
-         projects_query = Project.query.filter_by(developer_name=current_user.company_name).all() # Or similar logic
-         if not projects_query: # Fallback to all if name match not precise or null
-              projects_query = Project.query.all()
+         rows = project_listing(Project.developer_name == current_user.company_name) # Or similar logic
+         if not rows: # Fallback to all if name match not precise or null
+              rows = project_listing()
     else:
-         projects_query = Project.query.all()
-    
-    
-    for proj in projects_query:
-        if not proj: continue
-        
-        # Calculate Project Status
-        defects = Defect.query.filter_by(project_id=proj.id).all()
-        status = 'New'
-        
-        if not defects:
-            status = 'New'
-        else:
-            statuses = [d.status for d in defects]
-            if all(s == 'completed' for s in statuses):
-                status = 'Completed'
-            elif any(s in ['in_progress', 'locked', 'Processing'] for s in statuses):
-                status = 'Processing'
-            elif any(s == 'rejected' for s in statuses):
-                status = 'Action Required' 
-            else:
-                status = 'Pending'
+         rows = project_listing()
 
+    projects_list = []
+    for proj, total, completed, processing, rejected, scan_id, scan_path in rows:
         # Determine Model Path and House Scan Fallback
         model_path = proj.master_model_path
         house_scan_id = None
-        
-        if not model_path:
+        if not model_path and scan_id is not None:
             # Fallback to the latest house scan (a defect with a scan_path)
-            latest_scan = Defect.query.filter_by(project_id=proj.id).filter(Defect.scan_path != None).order_by(Defect.created_at.desc()).first()
-            if latest_scan:
-                model_path = latest_scan.scan_path
-                house_scan_id = latest_scan.id
+            model_path = scan_path
+            house_scan_id = scan_id
 
         projects_list.append({
             'id': proj.id,
             'name': proj.name,
             'created_at': proj.created_at,
-            'defect_count': len(defects),
+            'defect_count': total,
             'model_path': model_path,
             'house_scan_id': house_scan_id,
-            'status': status,
+            'status': project_status(total, completed, processing, rejected),
             'metadata': None 
         })
         
+    # Attach stored model manifests in one query
+    model_paths = [p['model_path'] for p in projects_list if p['model_path']]
+    if model_paths:
+        manifests = {m.model_path: m for m in ModelManifest.query.filter(ModelManifest.model_path.in_(model_paths))}
+        for p in projects_list:
+            manifest = manifests.get(p['model_path'])
+            if manifest:
+                p['metadata'] = manifest.to_dict()
+        
     return render_template('module3/projects.html', projects=projects_list)
 
+def _model_lod(file_path):
+    """LOD level requested via ?lod=N, or the coarsest one for Save-Data clients."""
+    if 'lod' in request.args:
+        return request.args.get('lod', 0, type=int)
+    if request.headers.get('Save-Data', '').lower() == 'on':
+        return available_lods(file_path)[-1]
+    return 0
+
+def _send_model(file_path):
+    if not os.path.exists(file_path):
+        return "Model file not found", 404
+    file_path = str(resolve_lod(file_path, _model_lod(file_path)))
+    response = send_from_directory(os.path.dirname(file_path), os.path.basename(file_path))
+    response.vary.add('Save-Data')
+    return response
+
+def _model_bounds(model_path):
+    """Stored bounding box for camera framing before the model arrives."""
+    if not model_path:
+        return None
+    manifest = ModelManifest.query.filter_by(model_path=model_path).first()
+    if not manifest or manifest.bbox_min is None:
+        return None
+    return {'min': manifest.bbox_min, 'max': manifest.bbox_max}
+
+def _preview_model_url(endpoint, model_path, **values):
+    """URL of the coarsest LOD for first paint, when variants exist."""
+    if not model_path:
+        return None
+    levels = available_lods(os.path.join(current_app.root_path, 'static', model_path))
+    if len(levels) < 2:
+        return None
+    return url_for(endpoint, lod=levels[-1], **values)
+
 @bp.route('/visualize/<int:project_id>')
 @login_required
 def visualize(project_id):
@@ -101,12 +129,19 @@ def visualize(project_id):
     model_url = url_for('module3.serve_model', project_id=project_id) if project.master_model_path else None
     
     # Fallback to the latest house scan for this project if no master model
+    preview_model_url = _preview_model_url('module3.serve_model', project.master_model_path, project_id=project_id)
+    tileset_url = None
+    if project.master_model_path and load_tileset(os.path.join(current_app.root_path, 'static', project.master_model_path)):
+        tileset_url = url_for('module3.serve_model_tile', project_id=project_id, filename='tileset.json')
+    model_bounds = _model_bounds(project.master_model_path)
     house_scan_id = None
     if not model_url:
-        latest_scan = Defect.query.filter_by(project_id=project.id).filter(Defect.scan_path != None).order_by(Defect.created_at.desc()).first()
-        if latest_scan:
-            model_url = url_for('module3.serve_defect_model', defect_id=latest_scan.id)
-            house_scan_id = latest_scan.id
+        summary = project_summary(project.id)
+        if summary and summary.latest_scan_id:
+            model_url = url_for('module3.serve_defect_model', defect_id=summary.latest_scan_id)
+            preview_model_url = _preview_model_url('module3.serve_defect_model', summary.latest_scan_path, defect_id=summary.latest_scan_id)
+            model_bounds = _model_bounds(summary.latest_scan_path)
+            house_scan_id = summary.latest_scan_id
 
     return render_template(
         'module3/visualize.html', 
@@ -114,6 +149,9 @@ def visualize(project_id):
         scan_id=project_id,
         house_scan_id=house_scan_id,
         model_url=model_url,
+        preview_model_url=preview_model_url,
+        tileset_url=tileset_url,
+        model_bounds=model_bounds,
         project_name=project.name
     )
 
@@ -124,15 +162,40 @@ def serve_model(project_id):
     if not project.master_model_path:
         return "No model uploaded", 404
         
-    import os
     file_path = os.path.join(current_app.root_path, 'static', project.master_model_path)
-    
-    if os.path.exists(file_path):
-        directory = os.path.dirname(file_path)
-        filename = os.path.basename(file_path)
-        return send_from_directory(directory, filename)
-        
-    return "Model file not found", 404
+    return _send_model(file_path)
+
+@bp.route('/model/<int:project_id>/tiles/<path:filename>')
+@login_required
+def serve_model_tile(project_id, filename):
+    project = Project.query.get_or_404(project_id)
+    if not project.master_model_path:
+        return "No model uploaded", 404
+    directory = tiles_dir(os.path.join(current_app.root_path, 'static', project.master_model_path))
+    return send_from_directory(directory, filename)
+
+@bp.route('/images/<int:image_id>/<size>')
+@login_required
+def defect_image(image_id, size):
+    """A defect photo at ``thumb``/``medium`` size, WebP when the browser accepts it."""
+    if size not in IMAGE_SIZES:
+        return "Unknown image size", 404
+    image = DefectImage.query.get_or_404(image_id)
+    webp = 'image/webp' in request.accept_mimetypes
+    relative_path = image.variant(size, webp=webp)
+    response = send_from_directory(os.path.join(current_app.root_path, 'static'), relative_path)
+    response.vary.add('Accept')
+    if relative_path != image.image_path:
+        # Variants are never rewritten; the original is only a stand-in until they exist
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = 31536000
+        response.cache_control.private = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+def _image_url(image, size):
+    return url_for('module3.defect_image', image_id=image.id, size=size)
 
 @bp.route('/visualize_defect/<int:defect_id>')
 @login_required
@@ -149,6 +212,8 @@ def visualize_defect(defect_id):
         scan_id=defect.project_id if defect.project else None, # Pass project ID for other generic API calls
         house_scan_id=defect.id,
         model_url=model_url,
+        preview_model_url=_preview_model_url('module3.serve_defect_model', defect.scan_path, defect_id=defect_id),
+        model_bounds=_model_bounds(defect.scan_path),
         project_name=defect.project.name if defect.project else 'No Project'
     )
 
@@ -159,15 +224,8 @@ def serve_defect_model(defect_id):
     if not defect.scan_path:
         return "No model uploaded", 404
         
-    import os
     file_path = os.path.join(current_app.root_path, 'static', defect.scan_path)
-    
-    if os.path.exists(file_path):
-        directory = os.path.dirname(file_path)
-        filename = os.path.basename(file_path)
-        return send_from_directory(directory, filename)
-        
-    return "Model file not found", 404
+    return _send_model(file_path)
 
 # --- Dashboard & User Routes ---
 
@@ -268,45 +326,50 @@ def dashboard():
 @login_required
 def developer_portal():
     selected_project_name = request.args.get('project_name')
-    
+    filters = {
+        'status': request.args.get('status', ''),
+        'severity': request.args.get('severity', ''),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+
     # Group defects by Project
-    from sqlalchemy import func
-    
-    # Get all projects
-    projects_query = Project.query.all()
-    
-    projects_data = []
-    for p in projects_query:
-        # Count active defects
-        count = Defect.query.filter_by(project_id=p.id).count()
-        projects_data.append({
-            'project_name': p.name,
-            'active_count': count
-        })
-            
+    projects_data = [
+        {'project_name': name, 'active_count': count}
+        for name, count in project_defect_counts()
+    ]
+
     if not selected_project_name and projects_data:
         selected_project_name = projects_data[0]['project_name']
-        
+
     # Fetch Defects
-    defects = []
-    stats = {'new': 0, 'in_progress': 0, 'completed': 0, 'current_project': selected_project_name or "All Projects"}
-    
-    defects_query = []
+    scope = []
+    target_project = None
     if selected_project_name:
-         target_project = Project.query.filter_by(name=selected_project_name).first()
-         if target_project:
-             defects_query = Defect.query.filter_by(project_id=target_project.id).order_by(Defect.created_at.desc()).all()
+        target_project = Project.query.filter_by(name=selected_project_name).first()
+        if target_project is None:
+            # Filtering on a NULL id would list every project-less defect
+            abort(404)
+        scope.append(Defect.project_id == target_project.id)
+
+    # Stats cover the whole project; the filters only narrow the task list
+    if target_project:
+        stats = project_bucket_counts(project_summary(target_project.id))
     else:
-         defects_query = Defect.query.order_by(Defect.created_at.desc()).all()
-
-    for d in defects_query:
-        if d.status in ['Reported', 'draft', 'New', 'Pending']:
-            stats['new'] += 1
-        elif d.status in ['in_progress', 'Processing', 'locked', 'Under Review']:
-            stats['in_progress'] += 1
-        elif d.status in ['completed', 'Fixed']:
-            stats['completed'] += 1
-            
+        stats = status_bucket_counts(scope)
+    stats['current_project'] = selected_project_name or "All Projects"
+
+    query = Defect.query.filter(*scope, *defect_filters(**filters)).options(
+        selectinload(Defect.user), selectinload(Defect.project), selectinload(Defect.images)
+    )
+    page, next_before_id = keyset_page(
+        query,
+        before_id=request.args.get('before_id', type=int),
+        limit=page_size(request.args.get('limit', type=int)),
+    )
+
+    defects = []
+    for d in page:
         defects.append({
             'id': d.id,
             'full_name': d.user.full_name if d.user else "Unknown",
@@ -317,30 +380,106 @@ def developer_portal():
             'project_name': d.project.name if d.project else "Unknown",
             'severity': d.severity,
             'status': d.status,
-            'images': [img.image_path for img in d.images] if d.images else []
+            'images': [
+                {'thumb': _image_url(img, 'thumb'), 'full': url_for('static', filename=img.image_path)}
+                for img in d.images
+            ] if d.images else []
         })
 
-    return render_template('developer_portal.html', projects=projects_data, stats=stats, defects=defects)
+    return render_template(
+        'developer_portal.html',
+        projects=projects_data,
+        stats=stats,
+        defects=defects,
+        filters=filters,
+        next_before_id=next_before_id,
+        is_first_page=not request.args.get('before_id'),
+    )
+
+def _case_filters():
+    return {
+        'project_id': request.args.get('project_id', type=int),
+        'status': request.args.get('status', ''),
+        'severity': request.args.get('severity', ''),
+    }
+
+def _case_page(conditions):
+    return case_page(
+        conditions,
+        before_id=request.args.get('before_id', type=int),
+        limit=page_size(request.args.get('limit', type=int)),
+    )
+
+def _case_payload(row):
+    return {
+        'id': row.id,
+        'unit_no': row.location or "N/A",
+        'project_name': row.project_name or "Unknown Project",
+        'description': row.description,
+        'status': row.status,
+        'filename': row.scan_path if row.scan_path else None,
+        'scan_id': row.project_id
+    }
+
+def _evidence_payload(row, image_ids):
+    # Mock an AI Confidence score based on severity for demonstration
+    confidence = 85
+    if row.severity == 'High':
+        confidence = 94
+    elif row.severity == 'Low':
+        confidence = 72
+
+    # Get the first image if it exists
+    image_id = image_ids.get(row.id)
+    image_url = url_for('module3.defect_image', image_id=image_id, size='medium') if image_id else None
+
+    return {
+        'id': row.id,
+        'unit_no': row.location or "N/A",
+        'project_name': row.project_name or "Unknown Project",
+        'description': row.description,
+        'element': row.element or 'Unknown',
+        'severity': row.severity or 'Medium',
+        'status': row.status,
+        'image_url': image_url,
+        'confidence': confidence,
+        'scan_id': row.project_id
+    }
+
+def _case_list_response(cases, next_before_id, fragment_template):
+    payload = {'cases': cases, 'next_before_id': next_before_id}
+    # The page's "Load more" asks for the rendered markup as well
+    if request.args.get('fragment'):
+        payload['html'] = render_template(fragment_template, cases=cases)
+    return jsonify(payload)
+
+def _case_filter_options():
+    return db.session.query(Project.id, Project.name).order_by(Project.name).all()
 
 @bp.route('/lawyer_dashboard')
 @login_required
 def lawyer_dashboard():
-    # Fetch all defects for the lawyer view
-    all_defects = Defect.query.order_by(Defect.created_at.desc()).all()
-    
-    cases = []
-    for d in all_defects:
-        cases.append({
-            'id': d.id,
-            'unit_no': d.location or "N/A",
-            'project_name': d.project.name if d.project else "Unknown Project",
-            'description': d.description,
-            'status': d.status,
-            'filename': d.scan_path if d.scan_path else None,
-            'scan_id': d.project_id
-        })
-        
-    return render_template('module3/lawyer_dashboard.html', user=(current_user.firm_name or current_user.full_name), cases=cases)
+    filters = _case_filters()
+    conditions = defect_filters(**filters)
+    rows, next_before_id = _case_page(conditions)
+
+    return render_template(
+        'module3/lawyer_dashboard.html',
+        user=(current_user.firm_name or current_user.full_name),
+        cases=[_case_payload(row) for row in rows],
+        total=defect_count(conditions),
+        filters=filters,
+        projects=_case_filter_options(),
+        next_before_id=next_before_id,
+    )
+
+@bp.route('/api/cases')
+@login_required
+def api_cases():
+    rows, next_before_id = _case_page(defect_filters(**_case_filters()))
+    return _case_list_response(
+        [_case_payload(row) for row in rows], next_before_id, 'module3/_case_rows.html'
+    )
 
 @bp.route('/update_status/<int:id>/<string:new_status>')
 @login_required
@@ -358,34 +497,29 @@ def update_status(id, new_status):
 @login_required
 def evidence_report():
     # Only fetch defects that are pins (no scan_path) 
-    defect_pins = Defect.query.filter(Defect.scan_path == None).order_by(Defect.created_at.desc()).all()
-    
-    cases = []
-    for d in defect_pins:
-        # Mock an AI Confidence score based on severity for demonstration
-        confidence = 85
-        if d.severity == 'High':
-            confidence = 94
-        elif d.severity == 'Low':
-            confidence = 72
-            
-        # Get the first image if it exists
-        image_url = url_for('static', filename=d.images[0].image_path) if d.images else None
-        
-        cases.append({
-            'id': d.id,
-            'unit_no': d.location or "N/A",
-            'project_name': d.project.name if d.project else "Unknown Project",
-            'description': d.description,
-            'element': d.element or 'Unknown',
-            'severity': d.severity or 'Medium',
-            'status': d.status,
-            'image_url': image_url,
-            'confidence': confidence,
-            'scan_id': d.project_id
-        })
-        
-    return render_template('module3/evidence_report.html', user=current_user.full_name, cases=cases)
+    filters = _case_filters()
+    conditions = [Defect.scan_path == None, *defect_filters(**filters)]
+    rows, next_before_id = _case_page(conditions)
+    image_ids = first_image_ids([row.id for row in rows])
+
+    return render_template(
+        'module3/evidence_report.html',
+        user=current_user.full_name,
+        cases=[_evidence_payload(row, image_ids) for row in rows],
+        total=defect_count(conditions),
+        filters=filters,
+        projects=_case_filter_options(),
+        next_before_id=next_before_id,
+    )
+
+@bp.route('/api/evidence')
+@login_required
+def api_evidence():
+    rows, next_before_id = _case_page([Defect.scan_path == None, *defect_filters(**_case_filters())])
+    image_ids = first_image_ids([row.id for row in rows])
+    return _case_list_response(
+        [_evidence_payload(row, image_ids) for row in rows], next_before_id, 'module3/_evidence_cards.html'
+    )
 
 @bp.route('/validate_all', methods=['POST'])
 @login_required
@@ -394,27 +528,132 @@ def validate_all():
     return redirect(url_for('module3.lawyer_dashboard'))
 # --- API Routes for 3D Visualizer ---
 
+# Rows per database fetch and per encoded chunk of the pin array
+PIN_BATCH_SIZE = 2000
+_URL_SENTINEL = 987654321
+
+def _pin_url_parts():
+    """``(static prefix, thumbnail URL head, thumbnail URL tail)`` for pin images."""
+    static_prefix = url_for('static', filename='_')[:-1]
+    thumb_head, thumb_tail = url_for(
+        'module3.defect_image', image_id=_URL_SENTINEL, size='thumb'
+    ).split(str(_URL_SENTINEL))
+    return static_prefix, thumb_head, thumb_tail
+
+def _quote_image_path(image_path):
+    return url_quote(image_path, safe="!$&'()*+,/:;=@")
+
+def _pin_serializer():
+    """Row of pin_query() -> pin payload for the 3D viewer.
+
+    url_for() per pin dominated large responses, so the image URLs are built
+    from prefixes resolved once, quoting the path like the static route does.
+    """
+    static_prefix, thumb_head, thumb_tail = _pin_url_parts()
+
+    def payload(row):
+        (defect_id, x, y, z, element, location, defect_type, severity, status, description,
+         created_at, notes, image_id, image_path) = row
+        return {
+            'defectId': defect_id,
+            'x': x or 0.0,
+            'y': y or 0.0,
+            'z': z or 0.0,
+            'element': element or 'Unknown',
+            'location': location or '',
+            'defect_type': defect_type or 'Unknown',
+            'severity': severity or 'Medium',
+            'status': status or 'Reported',
+            'description': description or '',
+            'created_at': created_at,
+            'imageUrl': static_prefix + _quote_image_path(image_path) if image_id else None,
+            'imageThumbUrl': f"{thumb_head}{image_id}{thumb_tail}" if image_id else None,
+            'notes': notes or ''
+        }
+    return payload
+
+def _pin_response(query):
+    """JSON array of pins; streamed in chunks once it exceeds one batch."""
+    payload = _pin_serializer()
+    # Plain Core rows: no ORM loading step per row
+    result = db.session.connection().execute(query.statement.execution_options(yield_per=PIN_BATCH_SIZE))
+    partitions = result.partitions(PIN_BATCH_SIZE)
+    first = [payload(row) for row in next(partitions, [])]
+    if len(first) < PIN_BATCH_SIZE:
+        result.close()
+        return current_app.response_class(json_stream.dumps(first), mimetype='application/json')
+    batches = itertools.chain([first], ([payload(row) for row in rows] for rows in partitions))
+    return current_app.response_class(
+        stream_with_context(json_stream.iter_array(batches)), mimetype='application/json'
+    )
+
+def _wants_pin_buffer():
+    """Whether the client asked for the packed pin layout (?format=bin or Accept)."""
+    if request.args.get('format') == 'bin':
+        return True
+    accepted = request.accept_mimetypes
+    return accepted.best_match(['application/json', pin_buffer.MIMETYPE]) == pin_buffer.MIMETYPE
+
+def _pin_buffer_response(query):
+    """Pins in the packed layout of app/utils/pin_buffer.py.
+
+    The side-table carries the text columns, with the same defaults as the
+    JSON payload, and the pieces the viewer joins image URLs from. Falls
+    back to the JSON array if severity or status cannot be coded in a byte.
+    """
+    rows = db.session.connection().execute(query.statement).all()
+    columns = list(zip(*rows)) or [()] * len(query.statement.selected_columns)
+    (ids, xs, ys, zs, elements, locations, defect_types, severities, statuses, descriptions,
+     created_ats, notes, image_ids, image_paths) = columns
+    static_prefix, thumb_head, thumb_tail = _pin_url_parts()
+    table = {
+        'imageUrl': static_prefix,
+        'imageThumbUrl': [thumb_head, thumb_tail],
+        'element': [value or 'Unknown' for value in elements],
+        'location': [value or '' for value in locations],
+        'defect_type': [value or 'Unknown' for value in defect_types],
+        'description': [value or '' for value in descriptions],
+        'created_at': list(created_ats),
+        'notes': [value or '' for value in notes],
+        'imagePath': [_quote_image_path(path) if image_id else None
+                      for image_id, path in zip(image_ids, image_paths)],
+    }
+    try:
+        body = pin_buffer.encode(
+            ids,
+            [(x or 0.0, y or 0.0, z or 0.0) for x, y, z in zip(xs, ys, zs)],
+            [image_id or 0 for image_id in image_ids],
+            [value or 'Medium' for value in severities],
+            [value or 'Reported' for value in statuses],
+            table,
+        )
+    except ValueError:
+        payload = _pin_serializer()
+        return current_app.response_class(json_stream.dumps([payload(row) for row in rows]),
+                                          mimetype='application/json')
+    return current_app.response_class(body, mimetype=pin_buffer.MIMETYPE)
+
+def _pin_grid(project_id):
+    cell_size = float(current_app.config.get('PIN_GRID_CELL_SIZE', spatial_index.DEFAULT_CELL_SIZE))
+    return spatial_index.get_pin_grid(project_id, cell_size)
+
+def _nearby_pins(project_id, x, y, z, exclude_id=None):
+    radius = float(current_app.config.get('PIN_DUPLICATE_RADIUS', 0.25))
+    return [
+        {'defectId': pin_id, 'distance': round(distance, 4)}
+        for pin_id, distance in _pin_grid(project_id).query_radius((x, y, z), radius)
+        if pin_id != exclude_id
+    ]
+
 @bp.route('/api/scans/<int:project_id>/defects', methods=['GET', 'POST'])
 @login_required
 def api_project_defects(project_id):
     if request.method == 'GET':
         # Only fetch actual pinpoints, excluding the parent house scan records
-        defects = Defect.query.filter_by(project_id=project_id).filter(Defect.scan_path == None).all()
-        return jsonify([{
-            'defectId': d.id,
-            'x': d.x_coord or 0.0,
-            'y': d.y_coord or 0.0,
-            'z': d.z_coord or 0.0,
-            'element': d.element or 'Unknown',
-            'location': d.location or '',
-            'defect_type': d.defect_type or 'Unknown',
-            'severity': d.severity or 'Medium',
-            'status': d.status or 'Reported',
-            'description': d.description or '',
-            'created_at': d.created_at.strftime('%Y-%m-%d') if d.created_at else None,
-            'imageUrl': url_for('static', filename=d.images[0].image_path) if d.images else None,
-            'notes': d.notes if hasattr(d, 'notes') and d.notes else ''
-        } for d in defects])
+        query = pin_query(Defect.project_id == project_id, Defect.scan_path == None)
+        response = _pin_buffer_response(query) if _wants_pin_buffer() else _pin_response(query)
+        response.vary.add('Accept')
+        return response
         
     if request.method == 'POST':
         if request.is_json:
@@ -441,31 +680,58 @@ def api_project_defects(project_id):
             db.session.commit()
             
             if request.files:
-                import uuid, os
-                from werkzeug.utils import secure_filename
-                from app.models import DefectImage
                 files = request.files.getlist('images')
                 for file in files:
                     if file and file.filename != '':
-                        filename = secure_filename(file.filename)
-                        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-                        upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'defects')
-                        os.makedirs(upload_folder, exist_ok=True)
-                        
-                        file_path = os.path.join(upload_folder, unique_filename)
-                        file.save(file_path)
-                        
-                        relative_path = f"uploads/defects/{unique_filename}"
+                        relative_path = Blob.store(file, os.path.join(current_app.root_path, 'static'))
                         defect_image = DefectImage(defect_id=new_defect.id, image_path=relative_path)
                         db.session.add(defect_image)
                 db.session.commit()
             
-            return jsonify(new_defect.to_dict()), 201
+            spatial_index.pin_saved(new_defect)
+            payload = new_defect.to_dict()
+            payload['nearby'] = _nearby_pins(project_id, new_defect.x_coord, new_defect.y_coord,
+                                             new_defect.z_coord, exclude_id=new_defect.id)
+            return jsonify(payload), 201
         except Exception as e:
             db.session.rollback()
             print(f"ERROR saving defect: {str(e)}")
             return jsonify({'error': str(e)}), 500
 
+@bp.route('/api/scans/<int:project_id>/defects/region', methods=['GET'])
+@login_required
+def api_project_defects_region(project_id):
+    """Pins inside a bounding box (min_x..max_z) or a sphere (x, y, z, radius)."""
+    args = request.args
+
+    def number(name):
+        value = float(args[name])
+        if not math.isfinite(value):
+            raise ValueError(f"{name} must be finite")
+        return value
+
+    try:
+        if 'radius' in args:
+            center = (number('x'), number('y'), number('z'))
+            hits = _pin_grid(project_id).query_radius(center, number('radius'))
+            pin_ids = [pin_id for pin_id, _ in hits]
+        else:
+            lo = (number('min_x'), number('min_y'), number('min_z'))
+            hi = (number('max_x'), number('max_y'), number('max_z'))
+            pin_ids = _pin_grid(project_id).query_box(lo, hi)
+    # OverflowError: finite values whose sphere bounds or grid cells overflow
+    except (KeyError, ValueError, OverflowError):
+        return jsonify({'error': 'Provide min_x..max_z or x, y, z and radius'}), 400
+
+    if not pin_ids:
+        return jsonify([])
+    rows = pin_query(Defect.id.in_(pin_ids)).all()
+    # Radius results keep nearest-first ordering
+    rank = {pin_id: i for i, pin_id in enumerate(pin_ids)}
+    rows.sort(key=lambda row: rank[row.id])
+    payload = _pin_serializer()
+    return current_app.response_class(json_stream.dumps([payload(row) for row in rows]), mimetype='application/json')
+
 @bp.route('/api/defects/<int:defect_id>', methods=['GET', 'PUT', 'DELETE'])
 @login_required
 def api_update_defect(defect_id):
@@ -483,7 +749,9 @@ def api_update_defect(defect_id):
             'y': defect.y_coord,
             'z': defect.z_coord,
             'status': defect.status,
+            'imageUrl': _image_url(defect.images[0], 'medium') if defect.images else None,
             'imageUrls': [url_for('static', filename=img.image_path) for img in defect.images] if defect.images else [],
+            'imageThumbUrls': [_image_url(img, 'thumb') for img in defect.images],
             'notes': defect.notes if hasattr(defect, 'notes') else ''
         })
 
@@ -501,30 +769,22 @@ def api_update_defect(defect_id):
         if 'notes' in data and hasattr(defect, 'notes'): defect.notes = data['notes']
         
         if request.files:
-            import uuid, os
-            from werkzeug.utils import secure_filename
-            from app.models import DefectImage
             files = request.files.getlist('images')
             for file in files:
                 if file and file.filename != '':
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{uuid.uuid4().hex}_{filename}"
-                    upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'defects')
-                    os.makedirs(upload_folder, exist_ok=True)
-                    
-                    file_path = os.path.join(upload_folder, unique_filename)
-                    file.save(file_path)
-                    
-                    relative_path = f"uploads/defects/{unique_filename}"
+                    relative_path = Blob.store(file, os.path.join(current_app.root_path, 'static'))
                     defect_image = DefectImage(defect_id=defect.id, image_path=relative_path)
                     db.session.add(defect_image)
                     
         db.session.commit()
+        spatial_index.pin_saved(defect)
         return jsonify(defect.to_dict())
 
     if request.method == 'DELETE':
+        project_id = defect.project_id
         db.session.delete(defect)
         db.session.commit()
+        spatial_index.pin_removed(project_id, defect_id)
         return jsonify({'message': 'Deleted'})
 
 @bp.route('/delete_project/<int:project_id>', methods=['POST'])
@@ -545,6 +805,7 @@ def delete_project(project_id):
         db.session.delete(d)
     
     db.session.commit()
+    spatial_index.invalidate(project_id)
     
     flash(f"All data and scans for '{project.name}' have been cleared.", "success")
         
@@ -563,8 +824,10 @@ def delete_defect(defect_id):
     # Delete related logs first
 
     
+    project_id = defect.project_id
     db.session.delete(defect)
     db.session.commit()
+    spatial_index.pin_removed(project_id, defect_id)
     
     flash("Defect deleted successfully.", "success")
     return redirect(url_for('module3.dashboard'))
@@ -612,3 +875,85 @@ def download_report(report_type):
     except requests.exceptions.RequestException as e:
         flash(f"Error communicating with reporting service: {str(e)}", "danger")
         return redirect(request.referrer or url_for('module3.dashboard_homeowner'))
+
+
+# --- CLI ---
+
+@bp.cli.command('build-tiles')
+@click.option('--project-id', type=int, help='Only tile this project (default: every project with a master model)')
+@click.option('--max-triangles', type=int, default=100_000, show_default=True, help='Triangle budget per tile')
+def build_tiles_command(project_id, max_triangles):
+    """Split master models into spatial tiles for progressive loading."""
+    query = Project.query.filter(Project.master_model_path != None)
+    if project_id:
+        query = query.filter(Project.id == project_id)
+    for project in query.all():
+        model_path = os.path.join(current_app.root_path, 'static', project.master_model_path)
+        if not os.path.exists(model_path):
+            click.echo(f"[SKIP] {project.name}: {project.master_model_path} not found")
+            continue
+        try:
+            tileset = build_tiles(model_path, max_triangles=max_triangles)
+        except ValueError as e:
+            click.echo(f"[SKIP] {project.name}: {e}")
+            continue
+        click.echo(f"[OK] {project.name}: {len(tileset['tiles'])} tiles")
+
+@bp.cli.command('build-manifests')
+@click.option('--force', is_flag=True, help='Recompute manifests that already exist')
+def build_manifests_command(force):
+    """Record model manifests for project master models and house scans."""
+    paths = {p.master_model_path for p in Project.query.filter(Project.master_model_path != None)}
+    paths |= {d.scan_path for d in Defect.query.filter(Defect.scan_path != None)}
+    existing = {m.model_path for m in ModelManifest.query.with_entities(ModelManifest.model_path)}
+    for model_path in sorted(paths):
+        if model_path in existing and not force:
+            continue
+        file_path = os.path.join(current_app.root_path, 'static', model_path)
+        if not model_path.lower().endswith('.glb') or not os.path.exists(file_path):
+            continue
+        try:
+            ModelManifest.record(model_path, file_path)
+            db.session.commit()
+            click.echo(f"[OK] {model_path}")
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"[SKIP] {model_path}: {e}")
+
+@bp.cli.command('build-image-derivatives')
+@click.option('--force', is_flag=True, help='Rebuild images that already have derivatives')
+def build_image_derivatives_command(force):
+    """Create thumbnail/medium JPEG and WebP variants for stored defect photos."""
+    query = DefectImage.query.with_entities(DefectImage.image_path).distinct()
+    if not force:
+        query = query.filter(DefectImage.derivatives == None)
+    paths = [path for (path,) in query]
+    futures = queue_derivatives(current_app._get_current_object(), paths)
+    for future in futures:
+        future.result()
+    click.echo(f"Processed {len(paths)} images.")
+
+@bp.cli.command('rebuild-project-summaries')
+def rebuild_project_summaries_command():
+    """Recompute every project_summary row from the defects."""
+    connection = db.session.connection()
+    project_ids = [project_id for (project_id,) in db.session.query(Project.id).order_by(Project.id)]
+    ProjectSummary.query.filter(ProjectSummary.project_id.notin_(project_ids)).delete(synchronize_session=False)
+    for project_id in project_ids:
+        rebuild_project_summary(connection, project_id)
+    db.session.commit()
+    click.echo(f"Rebuilt {len(project_ids)} project summaries.")
+
+@bp.cli.command('check-query-plans')
+def check_query_plans_command():
+    """EXPLAIN the hot defect queries and fail if any scans a whole table."""
+    failed = False
+    for name, plan, full_scans in check_query_plans():
+        click.echo(f"[{'FAIL' if full_scans else 'OK'}] {name}")
+        for line in plan:
+            click.echo(f"    {line}")
+        if full_scans:
+            click.echo(f"    full scan of: {', '.join(full_scans)}")
+            failed = True
+    if failed:
+        raise SystemExit(1)
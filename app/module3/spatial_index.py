@@ -0,0 +1,160 @@
+"""Per-project spatial index over defect pin coordinates.
+
+Pins are bucketed into a uniform 3D grid hash so box and radius queries
+only visit the cells they overlap. Each project's grid is built lazily from
+the database and kept in sync by the pin API routes in this process. Other
+worker processes notice changes through a cheap (count, max(updated_at))
+token and rebuild their copy on the next query.
+"""
+import math
+import threading
+from collections import defaultdict
+
+from sqlalchemy import func
+
+from app.models import Defect
+
+DEFAULT_CELL_SIZE = 1.0
+
+
+class PinGrid:
+    """Uniform grid hash of pin id -> (x, y, z)."""
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = float(cell_size)
+        self.cells = defaultdict(set)
+        self.points = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, x, y, z):
+        size = self.cell_size
+        return (math.floor(x / size), math.floor(y / size), math.floor(z / size))
+
+    def add(self, pin_id, x, y, z):
+        self.remove(pin_id)
+        self.points[pin_id] = (x, y, z)
+        self.cells[self._cell(x, y, z)].add(pin_id)
+
+    def remove(self, pin_id):
+        point = self.points.pop(pin_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(pin_id)
+            if not members:
+                del self.cells[cell]
+
+    def _cells_in_box(self, lo, hi):
+        lo_cell, hi_cell = self._cell(*lo), self._cell(*hi)
+        span = [hi_cell[axis] - lo_cell[axis] + 1 for axis in range(3)]
+        # A huge box touches more grid cells than there are occupied cells;
+        # scanning the occupied ones is cheaper then.
+        if span[0] * span[1] * span[2] > len(self.cells):
+            return [
+                cell for cell in self.cells
+                if all(lo_cell[axis] <= cell[axis] <= hi_cell[axis] for axis in range(3))
+            ]
+        return [
+            (i, j, k)
+            for i in range(lo_cell[0], hi_cell[0] + 1)
+            for j in range(lo_cell[1], hi_cell[1] + 1)
+            for k in range(lo_cell[2], hi_cell[2] + 1)
+        ]
+
+    def query_box(self, lo, hi):
+        """Ids of pins inside the axis-aligned box [lo, hi]."""
+        found = []
+        for cell in self._cells_in_box(lo, hi):
+            for pin_id in self.cells.get(cell, ()):
+                x, y, z = self.points[pin_id]
+                if lo[0] <= x <= hi[0] and lo[1] <= y <= hi[1] and lo[2] <= z <= hi[2]:
+                    found.append(pin_id)
+        return found
+
+    def query_radius(self, center, radius):
+        """(id, distance) of pins within *radius* of *center*, nearest first."""
+        lo = tuple(c - radius for c in center)
+        hi = tuple(c + radius for c in center)
+        found = []
+        for pin_id in self.query_box(lo, hi):
+            distance = math.dist(center, self.points[pin_id])
+            if distance <= radius:
+                found.append((pin_id, distance))
+        found.sort(key=lambda item: (item[1], item[0]))
+        return found
+
+
+_indexes = {}  # project_id -> (token, PinGrid)
+_lock = threading.Lock()
+
+
+def _pins_query(project_id):
+    return Defect.query.filter(
+        Defect.project_id == project_id,
+        Defect.scan_path == None,  # noqa: E711
+        Defect.x_coord != None,  # noqa: E711
+    )
+
+
+def _project_token(project_id):
+    row = _pins_query(project_id).with_entities(func.count(Defect.id), func.max(Defect.updated_at)).one()
+    return tuple(row)
+
+
+def _build(project_id, cell_size):
+    grid = PinGrid(cell_size)
+    rows = _pins_query(project_id).with_entities(Defect.id, Defect.x_coord, Defect.y_coord, Defect.z_coord)
+    for pin_id, x, y, z in rows:
+        grid.add(pin_id, x, y or 0.0, z or 0.0)
+    return grid
+
+
+def get_pin_grid(project_id, cell_size=DEFAULT_CELL_SIZE):
+    """Return an up-to-date grid for *project_id*, rebuilding it if stale."""
+    token = _project_token(project_id)
+    with _lock:
+        cached = _indexes.get(project_id)
+        if cached and cached[0] == token and cached[1].cell_size == cell_size:
+            return cached[1]
+
+    grid = _build(project_id, cell_size)
+    with _lock:
+        _indexes[project_id] = (token, grid)
+    return grid
+
+
+def pin_saved(defect):
+    """Record a committed insert/update of *defect* in its project's grid."""
+    if defect.project_id is None or defect.scan_path or defect.x_coord is None:
+        return
+    with _lock:
+        cached = _indexes.get(defect.project_id)
+    if cached is None:
+        return
+
+    token = _project_token(defect.project_id)
+    with _lock:
+        cached[1].add(defect.id, defect.x_coord, defect.y_coord or 0.0, defect.z_coord or 0.0)
+        _indexes[defect.project_id] = (token, cached[1])
+
+
+def pin_removed(project_id, defect_id):
+    """Drop a committed delete from the project's grid."""
+    with _lock:
+        cached = _indexes.get(project_id)
+    if cached is None:
+        return
+
+    token = _project_token(project_id)
+    with _lock:
+        cached[1].remove(defect_id)
+        _indexes[project_id] = (token, cached[1])
+
+
+def invalidate(project_id):
+    with _lock:
+        _indexes.pop(project_id, None)
@@ -137,11 +137,11 @@ const PBR_RECIPES = {
 };
 
 // ==================== PBR MATERIAL APPLICATION ====================
-function applyPBRMaterials(scene) {
+function applyPBRMaterials(scene, meshes) {
     console.log('Applying PBR materials to scene...');
     let materialsApplied = 0;
 
-    scene.meshes.forEach(mesh => {
+    (meshes || scene.meshes).forEach(mesh => {
         if (!mesh || mesh.name === '__root__' || mesh.name.toLowerCase().includes('snapshot')) {
             return;
         }
@@ -263,66 +263,238 @@ let modelBounds = { min: null, max: null, size: null };
 // Load 3D model
 let rootMesh = null;
 let snapshotMeshes = [];
-if (window.APP_CONFIG.modelUrl) {
-    console.log('Loading model from: ' + window.APP_CONFIG.modelUrl);
-    BABYLON.SceneLoader.ImportMeshAsync('', window.APP_CONFIG.modelUrl, '', scene, null, '.glb')
-        .then(function (result) {
-            console.log('Model loaded successfully, meshes:', result.meshes.length);
-            loadedMeshes = result.meshes;
-            modelLoaded = true;
+function onModelLoaded(result) {
+    console.log('Model loaded successfully, meshes:', result.meshes.length);
+    loadedMeshes = result.meshes;
+    modelLoaded = true;
+
+    // Update mesh count
+    document.getElementById('meshCount').textContent = result.meshes.length;
+
+    // Find Snapshot meshes
+    result.meshes.forEach(mesh => {
+        if (mesh.name === '__root__') {
+            rootMesh = mesh;
+        }
 
-            // Update mesh count
-            document.getElementById('meshCount').textContent = result.meshes.length;
+        if (mesh.name && mesh.name.toLowerCase().includes('snapshot')) {
+            mesh.computeWorldMatrix(true);
+            snapshotMeshes.push({
+                mesh: mesh,
+                name: mesh.name,
+                position: mesh.absolutePosition.clone()
+            });
+            mesh.isVisible = false;
+            console.log('Found Snapshot mesh:', mesh.name, 'at', mesh.absolutePosition.x.toFixed(2), mesh.absolutePosition.y.toFixed(2), mesh.absolutePosition.z.toFixed(2));
+        }
+    });
 
-            // Find Snapshot meshes
-            result.meshes.forEach(mesh => {
-                if (mesh.name === '__root__') {
-                    rootMesh = mesh;
-                }
+    // Apply PBR materials to all meshes
+    applyPBRMaterials(scene);
+
+    console.log('Total Snapshot meshes found:', snapshotMeshes.length);
+
+    // Center camera on model
+    if (result.meshes.length > 0) {
+        let min = new BABYLON.Vector3(Number.MAX_VALUE, Number.MAX_VALUE, Number.MAX_VALUE);
+        let max = new BABYLON.Vector3(-Number.MAX_VALUE, -Number.MAX_VALUE, -Number.MAX_VALUE);
+        result.meshes.forEach(mesh => {
+            if (mesh.getBoundingInfo && mesh.name !== '__root__' && !mesh.name.toLowerCase().includes('snapshot')) {
+                mesh.computeWorldMatrix(true);
+                const boundingInfo = mesh.getBoundingInfo();
+                min = BABYLON.Vector3.Minimize(min, boundingInfo.boundingBox.minimumWorld);
+                max = BABYLON.Vector3.Maximize(max, boundingInfo.boundingBox.maximumWorld);
+            }
+        });
+        modelCenter = min.add(max).scale(0.5);
+        const size = max.subtract(min);
+        modelBounds = { min, max, size };
 
-                if (mesh.name && mesh.name.toLowerCase().includes('snapshot')) {
-                    mesh.computeWorldMatrix(true);
-                    snapshotMeshes.push({
-                        mesh: mesh,
-                        name: mesh.name,
-                        position: mesh.absolutePosition.clone()
-                    });
-                    mesh.isVisible = false;
-                    console.log('Found Snapshot mesh:', mesh.name, 'at', mesh.absolutePosition.x.toFixed(2), mesh.absolutePosition.y.toFixed(2), mesh.absolutePosition.z.toFixed(2));
-                }
+        // Update model size display
+        document.getElementById('modelSize').textContent =
+            `${size.x.toFixed(1)} x ${size.y.toFixed(1)} x ${size.z.toFixed(1)}`;
+
+        camera.target = modelCenter;
+        camera.radius = size.length() * 1.5;
+        console.log('Camera centered at:', modelCenter, 'radius:', camera.radius);
+
+        createMarkersFromSnapshots();
+        loadDefects();
+    }
+}
+
+// Replace the low-detail preview with the full-resolution model once it arrives.
+// Camera, markers and defects stay as they are; only the meshes are swapped.
+function swapInFullModel(result) {
+    const previous = loadedMeshes;
+    loadedMeshes = result.meshes;
+    snapshotMeshes = [];
+    result.meshes.forEach(mesh => {
+        if (mesh.name === '__root__') {
+            rootMesh = mesh;
+        }
+        if (mesh.name && mesh.name.toLowerCase().includes('snapshot')) {
+            mesh.computeWorldMatrix(true);
+            snapshotMeshes.push({ mesh: mesh, name: mesh.name, position: mesh.absolutePosition.clone() });
+            mesh.isVisible = false;
+        }
+    });
+    previous.forEach(mesh => mesh.dispose());
+    applyPBRMaterials(scene, result.meshes);
+
+    if (xrayMode) {
+        xrayMode = false;
+        toggleXRay();
+    }
+    if (wireframeMode) {
+        wireframeMode = false;
+        toggleWireframe();
+    }
+    document.getElementById('meshCount').textContent = result.meshes.length;
+    console.log('Full-resolution model loaded, meshes:', result.meshes.length);
+}
+
+function importModel(url) {
+    console.log('Loading model from: ' + url);
+    return BABYLON.SceneLoader.ImportMeshAsync('', url, '', scene, null, '.glb');
+}
+
+// Server-side bounds are in glTF space; the glTF loader mirrors X when
+// importing into Babylon's left-handed scene.
+function gltfBoxToScene(lo, hi) {
+    return {
+        min: new BABYLON.Vector3(-hi[0], lo[1], lo[2]),
+        max: new BABYLON.Vector3(-lo[0], hi[1], hi[2])
+    };
+}
+
+// Frame the camera from the stored model manifest so the view is already
+// right while the geometry downloads.
+function frameStoredBounds(bounds) {
+    const { min, max } = gltfBoxToScene(bounds.min, bounds.max);
+    modelCenter = min.add(max).scale(0.5);
+    const size = max.subtract(min);
+    modelBounds = { min, max, size };
+    document.getElementById('modelSize').textContent =
+        `${size.x.toFixed(1)} x ${size.y.toFixed(1)} x ${size.z.toFixed(1)}`;
+    camera.target = modelCenter;
+    camera.radius = size.length() * 1.5;
+}
+
+if (window.APP_CONFIG.modelBounds) {
+    frameStoredBounds(window.APP_CONFIG.modelBounds);
+}
+
+// ==================== TILED MODEL STREAMING ====================
+// Large master models are split server-side into an octree of small GLB
+// tiles. Tiles within reach of the camera are fetched nearest-first, a few at
+// a time, and more are requested as the camera moves.
+const TILE_CONCURRENCY = 4;
+const TILE_LOAD_DISTANCE = 2.0; // in multiples of the camera radius
+
+function loadTileset(tilesetUrl) {
+    const baseUrl = tilesetUrl.substring(0, tilesetUrl.lastIndexOf('/') + 1);
+
+    fetch(tilesetUrl)
+        .then(response => response.json())
+        .then(tileset => {
+            const pending = tileset.tiles.map(tile => {
+                const { min, max } = gltfBoxToScene(tile.min, tile.max);
+                return {
+                    uri: tile.uri,
+                    center: min.add(max).scale(0.5),
+                    radius: max.subtract(min).length() / 2
+                };
             });
+            let inFlight = 0;
 
-            // Apply PBR materials to all meshes
-            applyPBRMaterials(scene);
-
-            console.log('Total Snapshot meshes found:', snapshotMeshes.length);
-
-            // Center camera on model
-            if (result.meshes.length > 0) {
-                let min = new BABYLON.Vector3(Number.MAX_VALUE, Number.MAX_VALUE, Number.MAX_VALUE);
-                let max = new BABYLON.Vector3(-Number.MAX_VALUE, -Number.MAX_VALUE, -Number.MAX_VALUE);
-                result.meshes.forEach(mesh => {
-                    if (mesh.getBoundingInfo && mesh.name !== '__root__' && !mesh.name.toLowerCase().includes('snapshot')) {
-                        mesh.computeWorldMatrix(true);
-                        const boundingInfo = mesh.getBoundingInfo();
-                        min = BABYLON.Vector3.Minimize(min, boundingInfo.boundingBox.minimumWorld);
-                        max = BABYLON.Vector3.Maximize(max, boundingInfo.boundingBox.maximumWorld);
-                    }
-                });
-                modelCenter = min.add(max).scale(0.5);
-                const size = max.subtract(min);
-                modelBounds = { min, max, size };
+            if (tileset.min && tileset.max) {
+                frameStoredBounds({ min: tileset.min, max: tileset.max });
+            }
+            modelLoaded = true;
 
-                // Update model size display
-                document.getElementById('modelSize').textContent =
-                    `${size.x.toFixed(1)} x ${size.y.toFixed(1)} x ${size.z.toFixed(1)}`;
+            function loadNextTiles() {
+                while (inFlight < TILE_CONCURRENCY && pending.length) {
+                    const eye = camera.position;
+                    const reach = camera.radius * TILE_LOAD_DISTANCE;
+                    let best = -1;
+                    let bestDistance = Infinity;
+                    pending.forEach((tile, index) => {
+                        const distance = BABYLON.Vector3.Distance(eye, tile.center) - tile.radius;
+                        if (distance < bestDistance) {
+                            best = index;
+                            bestDistance = distance;
+                        }
+                    });
+                    if (bestDistance > reach) {
+                        return;
+                    }
+                    const tile = pending.splice(best, 1)[0];
+                    inFlight++;
+                    importModel(baseUrl + tile.uri)
+                        .then(result => {
+                            loadedMeshes = loadedMeshes.concat(result.meshes);
+                            applyPBRMaterials(scene, result.meshes);
+                            if (xrayMode || wireframeMode) {
+                                result.meshes.forEach(mesh => {
+                                    if (!mesh.material) return;
+                                    if (xrayMode) {
+                                        mesh.material.alpha = 0.15;
+                                        mesh.material.backFaceCulling = false;
+                                    }
+                                    mesh.material.wireframe = wireframeMode;
+                                });
+                            }
+                            document.getElementById('meshCount').textContent = loadedMeshes.length;
+                        })
+                        .catch(error => console.error('Error loading tile ' + tile.uri + ':', error))
+                        .finally(() => {
+                            inFlight--;
+                            loadNextTiles();
+                        });
+                }
+            }
 
-                camera.target = modelCenter;
-                camera.radius = size.length() * 1.5;
-                console.log('Camera centered at:', modelCenter, 'radius:', camera.radius);
+            // Snapshot nodes live in the base tile; load them before geometry.
+            importModel(baseUrl + tileset.base)
+                .then(result => {
+                    loadedMeshes = loadedMeshes.concat(result.meshes);
+                    result.meshes.forEach(mesh => {
+                        if (mesh.name && mesh.name.toLowerCase().includes('snapshot')) {
+                            mesh.computeWorldMatrix(true);
+                            snapshotMeshes.push({ mesh: mesh, name: mesh.name, position: mesh.absolutePosition.clone() });
+                            mesh.isVisible = false;
+                        }
+                    });
+                    applyPBRMaterials(scene, result.meshes);
+                })
+                .catch(error => console.error('Error loading base tile:', error))
+                .finally(() => {
+                    createMarkersFromSnapshots();
+                    loadDefects();
+                    loadNextTiles();
+                    camera.onViewMatrixChangedObservable.add(loadNextTiles);
+                });
+        })
+        .catch(function (error) {
+            console.error('Error loading tileset, falling back to full model:', error);
+            importModel(window.APP_CONFIG.modelUrl).then(onModelLoaded).catch(() => loadDefects());
+        });
+}
 
-                createMarkersFromSnapshots();
-                loadDefects();
+if (window.APP_CONFIG.tilesetUrl) {
+    loadTileset(window.APP_CONFIG.tilesetUrl);
+} else if (window.APP_CONFIG.modelUrl) {
+    const previewUrl = window.APP_CONFIG.previewModelUrl;
+    importModel(previewUrl || window.APP_CONFIG.modelUrl)
+        .then(function (result) {
+            onModelLoaded(result);
+            if (previewUrl) {
+                importModel(window.APP_CONFIG.modelUrl)
+                    .then(swapInFullModel)
+                    .catch(function (error) {
+                        console.error('Error loading full-resolution model, keeping preview:', error);
+                    });
             }
         })
         .catch(function (error) {
@@ -334,14 +506,72 @@ if (window.APP_CONFIG.modelUrl) {
     loadDefects();
 }
 
+const PIN_BUFFER_TYPE = 'application/vnd.pcd.pins';
+
+// Packed pin list (see app/utils/pin_buffer.py) -> the same objects as the JSON payload.
+// The Float32Array of interleaved x, y, z is kept on the result as `positions`.
+function decodePinBuffer(buffer) {
+    const header = new DataView(buffer, 0, 16);
+    const magic = String.fromCharCode(header.getUint8(0), header.getUint8(1), header.getUint8(2), header.getUint8(3));
+    if (magic !== 'PINS' || header.getUint16(4, true) !== 1) {
+        throw new Error('Unsupported pin buffer');
+    }
+    const count = header.getUint32(8, true);
+    const tableLength = header.getUint32(12, true);
+
+    let offset = 16;
+    const ids = new Uint32Array(buffer, offset, count);
+    offset += count * 4;
+    const positions = new Float32Array(buffer, offset, count * 3);
+    offset += count * 12;
+    const imageIds = new Uint32Array(buffer, offset, count);
+    offset += count * 4;
+    const severity = new Uint8Array(buffer, offset, count);
+    offset += count;
+    const status = new Uint8Array(buffer, offset, count);
+    offset += count;
+    const table = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, offset, tableLength)));
+
+    const [thumbHead, thumbTail] = table.imageThumbUrl;
+    const pins = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const imageId = imageIds[i];
+        pins[i] = {
+            defectId: ids[i],
+            x: positions[i * 3],
+            y: positions[i * 3 + 1],
+            z: positions[i * 3 + 2],
+            element: table.element[i],
+            location: table.location[i],
+            defect_type: table.defect_type[i],
+            severity: table.severity[severity[i]],
+            status: table.status[status[i]],
+            description: table.description[i],
+            created_at: table.created_at[i],
+            imageUrl: imageId ? table.imageUrl + table.imagePath[i] : null,
+            imageThumbUrl: imageId ? thumbHead + imageId + thumbTail : null,
+            notes: table.notes[i]
+        };
+    }
+    pins.positions = positions;
+    return pins;
+}
+
 // Fetch and render defects
 function loadDefects() {
     let url = '/module3/api/scans/' + window.APP_CONFIG.scanId + '/defects';
     if (window.APP_CONFIG.houseScanId) {
         url += '?house_scan_id=' + window.APP_CONFIG.houseScanId;
     }
-    fetch(url)
-        .then(response => response.json())
+    // Ask for the packed pin layout; the server may still answer with JSON
+    fetch(url, { headers: { 'Accept': PIN_BUFFER_TYPE + ', application/json;q=0.9' } })
+        .then(response => {
+            const type = response.headers.get('Content-Type') || '';
+            if (type.startsWith(PIN_BUFFER_TYPE)) {
+                return response.arrayBuffer().then(decodePinBuffer);
+            }
+            return response.json();
+        })
         .then(defects => {
             defectsData = defects;
             filteredDefects = [...defects];
@@ -400,7 +630,7 @@ function renderDefectList(defects) {
                         <div class="defect-meta-label">Image</div>
                         <div id="defect-img-${d.defectId}" class="defect-meta-value">
                             ${d.imageUrl
-            ? '<img src="' + d.imageUrl + '" class="defect-thumbnail" onclick="event.stopPropagation(); window.open(\'' + d.imageUrl + '\', \'_blank\')" alt="Defect Image" style="margin-bottom: 5px;">'
+            ? '<img src="' + (d.imageThumbUrl || d.imageUrl) + '" loading="lazy" class="defect-thumbnail" onclick="event.stopPropagation(); window.open(\'' + d.imageUrl + '\', \'_blank\')" alt="Defect Image" style="margin-bottom: 5px;">'
             : '<span class="no-image">No image attached</span>'
         }
                         </div>
@@ -0,0 +1,130 @@
+"""Content-addressed file storage for uploads.
+
+Uploads are hashed while they stream to a temporary file and then moved to
+``uploads/blobs/<aa>/<bb>/<sha256><ext>`` under the static folder. Identical
+content is stored once, and because a blob's URL changes whenever its
+content does, served blobs can be cached forever.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+BLOB_DIR = 'uploads/blobs'
+CHUNK_SIZE = 1024 * 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# <sha256><ext>; derived files (<sha256>.thumb.jpg, <sha256>.lod1.glb, ...) carry a second suffix
+_BLOB_NAME = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def blob_relative_path(digest, ext=''):
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+
+def is_blob_path(relative_path):
+    return bool(relative_path) and relative_path.replace('\\', '/').startswith(BLOB_DIR + '/')
+
+
+def write_blob(stream, static_root, ext=''):
+    """Stream *stream* into the store and return ``(relative_path, digest, size, created)``.
+
+    ``created`` is False when a blob with the same content already existed;
+    the temporary copy is discarded in that case.
+    """
+    tmp_dir = os.path.join(static_root, BLOB_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+
+        relative_path = blob_relative_path(digest.hexdigest(), ext)
+        final_path = os.path.join(static_root, relative_path)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            _touch(final_path)
+            return relative_path, digest.hexdigest(), size, False
+
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, final_path)
+        return relative_path, digest.hexdigest(), size, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _touch(path):
+    # Reset a reused file's age so orphan_files() spares it until its new row commits
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def adopt_file(src_path, static_root, digest, ext=''):
+    """Move an already-hashed file (e.g. a finished resumable upload) into the store."""
+    relative_path = blob_relative_path(digest, ext)
+    final_path = os.path.join(static_root, relative_path)
+    if os.path.exists(final_path):
+        os.remove(src_path)
+        _touch(final_path)
+        return relative_path, False
+
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.chmod(src_path, 0o644)
+    try:
+        os.replace(src_path, final_path)
+    except OSError:
+        # Partial uploads may live on another filesystem (instance folder)
+        tmp_path = f"{final_path}.{os.getpid()}.tmp"
+        shutil.move(src_path, tmp_path)
+        os.replace(tmp_path, final_path)
+    return relative_path, True
+
+
+def orphan_files(static_root, known_paths, older_than):
+    """Store files with no ``Blob`` row, last written before *older_than* (a timestamp).
+
+    A file is moved into the store before its row is committed, so a
+    rolled-back request leaves the file behind. Yields the relative paths of
+    such blobs and the full paths of stale temporary files; files younger
+    than *older_than* may still be waiting for their row.
+    """
+    store = os.path.join(static_root, BLOB_DIR)
+    for folder, dirs, files in os.walk(store):
+        # Tile sets of a blob live in <sha256>.tiles/ and go with the blob
+        dirs[:] = [name for name in dirs if not name.endswith('.tiles')]
+        in_tmp = os.path.abspath(folder) == os.path.abspath(os.path.join(store, 'tmp'))
+        for name in files:
+            full_path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(full_path) >= older_than:
+                    continue
+            except OSError:
+                continue
+            if in_tmp:
+                yield None, full_path
+                continue
+            if not _BLOB_NAME.match(name):
+                continue
+            relative_path = os.path.relpath(full_path, static_root).replace(os.sep, '/')
+            if relative_path not in known_paths:
+                yield relative_path, full_path
@@ -0,0 +1,238 @@
+"""Bounding-volume hierarchy over mesh bounds for building-element attribution."""
+
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .glb_snapshot import open_glb, read_accessor, read_gltf_json, world_node_matrices
+except ImportError:  # executed directly as a CLI script
+    from glb_snapshot import open_glb, read_accessor, read_gltf_json, world_node_matrices
+
+LEAF_SIZE = 4
+
+# The eight corners of a unit box, used to transform AABBs into world space.
+_CORNER_SELECT = np.array(
+    [[(i >> 0) & 1, (i >> 1) & 1, (i >> 2) & 1] for i in range(8)], dtype=bool
+)
+
+
+def element_label(node: Dict[str, Any], mesh: Dict[str, Any], mesh_index: int) -> str:
+    """Element name for a mesh node, e.g. ``IfcWall`` for ``IfcWall/Wall-042``."""
+    name = node.get("name") or mesh.get("name") or f"mesh_{mesh_index}"
+    return name.split("/")[0]
+
+
+def transform_boxes(mins: np.ndarray, maxs: np.ndarray, matrices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Transform (N, 3) local AABBs by (N, 4, 4) matrices into world-space AABBs."""
+    corners = np.where(_CORNER_SELECT[None, :, :], maxs[:, None, :], mins[:, None, :])
+    world = np.einsum("nij,nkj->nki", matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+    return world.min(axis=1), world.max(axis=1)
+
+
+def mesh_primitive_boxes(
+    document: Dict[str, Any],
+    glb_file: Optional[Path | str] = None,
+    world_matrices: Optional[np.ndarray] = None,
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Return element labels and world AABBs for every mesh primitive instance.
+
+    Bounds come from the POSITION accessor ``min``/``max`` (mandatory in
+    glTF 2.0). Accessors that omit them are decoded from the binary chunk,
+    which requires *glb_file*; primitives that still have no bounds are
+    skipped.
+    """
+    nodes = document.get("nodes") or []
+    meshes = document.get("meshes") or []
+    accessors = document.get("accessors") or []
+    if world_matrices is None:
+        world_matrices = world_node_matrices(nodes)
+
+    labels: List[str] = []
+    node_rows: List[int] = []
+    box_mins: List[Sequence[float]] = []
+    box_maxs: List[Sequence[float]] = []
+    missing: List[Tuple[int, int]] = []  # (output row, accessor index)
+
+    for node_index, node in enumerate(nodes):
+        mesh_index = node.get("mesh")
+        if mesh_index is None or "Snapshot" in (node.get("name") or ""):
+            continue
+        mesh = meshes[mesh_index]
+        label = element_label(node, mesh, mesh_index)
+        for primitive in mesh.get("primitives") or []:
+            position = (primitive.get("attributes") or {}).get("POSITION")
+            if position is None:
+                continue
+            accessor = accessors[position]
+            if "min" in accessor and "max" in accessor:
+                box_mins.append(accessor["min"][:3])
+                box_maxs.append(accessor["max"][:3])
+            else:
+                missing.append((len(labels), position))
+                box_mins.append((np.nan,) * 3)
+                box_maxs.append((np.nan,) * 3)
+            labels.append(label)
+            node_rows.append(node_index)
+
+    mins = np.asarray(box_mins, dtype=float).reshape(-1, 3)
+    maxs = np.asarray(box_maxs, dtype=float).reshape(-1, 3)
+
+    if missing and glb_file is not None:
+        with open_glb(glb_file) as (_, binary):
+            for row, accessor_index in missing:
+                positions = read_accessor(document, binary, accessor_index).astype(float)
+                if len(positions):
+                    mins[row] = positions.min(axis=0)
+                    maxs[row] = positions.max(axis=0)
+
+    valid = ~np.isnan(mins).any(axis=1)
+    if not valid.all():
+        labels = [label for label, keep in zip(labels, valid) if keep]
+        node_rows = [row for row, keep in zip(node_rows, valid) if keep]
+        mins, maxs = mins[valid], maxs[valid]
+
+    if not labels:
+        return [], np.zeros((0, 3)), np.zeros((0, 3))
+    world_mins, world_maxs = transform_boxes(mins, maxs, world_matrices[np.asarray(node_rows)])
+    return labels, world_mins, world_maxs
+
+
+@dataclass
+class ElementIndex:
+    """Flat-array BVH over labelled AABBs.
+
+    Nodes are stored in parallel arrays (root first); a node is a leaf when
+    ``left[i] == -1`` and then covers ``order[start[i]:start[i] + count[i]]``.
+    """
+
+    labels: List[str]
+    mins: np.ndarray
+    maxs: np.ndarray
+    order: np.ndarray
+    node_min: np.ndarray
+    node_max: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+    start: np.ndarray
+    count: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @classmethod
+    def build(cls, labels: List[str], mins: np.ndarray, maxs: np.ndarray, leaf_size: int = LEAF_SIZE) -> "ElementIndex":
+        total = len(labels)
+        order = np.arange(total)
+        centroids = (mins + maxs) * 0.5
+
+        node_min: List[np.ndarray] = []
+        node_max: List[np.ndarray] = []
+        left: List[int] = []
+        right: List[int] = []
+        start: List[int] = []
+        count: List[int] = []
+
+        def new_node(lo: int, hi: int) -> int:
+            members = order[lo:hi]
+            node_min.append(mins[members].min(axis=0))
+            node_max.append(maxs[members].max(axis=0))
+            left.append(-1)
+            right.append(-1)
+            start.append(lo)
+            count.append(hi - lo)
+            return len(left) - 1
+
+        if total:
+            stack = [(new_node(0, total), 0, total)]
+            while stack:
+                node, lo, hi = stack.pop()
+                if hi - lo <= leaf_size:
+                    continue
+                members = order[lo:hi]
+                spread = centroids[members].max(axis=0) - centroids[members].min(axis=0)
+                axis = int(np.argmax(spread))
+                mid = (hi - lo) // 2
+                partition = np.argpartition(centroids[members, axis], mid)
+                order[lo:hi] = members[partition]
+                left_child = new_node(lo, lo + mid)
+                right_child = new_node(lo + mid, hi)
+                left[node], right[node] = left_child, right_child
+                stack.append((left_child, lo, lo + mid))
+                stack.append((right_child, lo + mid, hi))
+
+        return cls(
+            labels=list(labels),
+            mins=mins,
+            maxs=maxs,
+            order=order,
+            node_min=np.asarray(node_min, dtype=float).reshape(-1, 3),
+            node_max=np.asarray(node_max, dtype=float).reshape(-1, 3),
+            left=np.asarray(left, dtype=np.int64),
+            right=np.asarray(right, dtype=np.int64),
+            start=np.asarray(start, dtype=np.int64),
+            count=np.asarray(count, dtype=np.int64),
+        )
+
+    @classmethod
+    def from_gltf(
+        cls,
+        document: Dict[str, Any],
+        glb_file: Optional[Path | str] = None,
+        world_matrices: Optional[np.ndarray] = None,
+    ) -> "ElementIndex":
+        labels, mins, maxs = mesh_primitive_boxes(document, glb_file, world_matrices)
+        return cls.build(labels, mins, maxs)
+
+    @classmethod
+    def from_glb(cls, glb_file: Path | str) -> "ElementIndex":
+        return cls.from_gltf(read_gltf_json(glb_file), glb_file)
+
+    def _box_distance(self, point: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        gap = np.maximum(np.maximum(lo - point, point - hi), 0.0)
+        return np.sqrt((gap * gap).sum(axis=-1))
+
+    def nearest(self, point: Sequence[float], max_distance: Optional[float] = None) -> Optional[str]:
+        """Label of the element containing *point*, or the nearest one.
+
+        When several boxes contain the point (a wall inside a storey proxy,
+        say) the smallest one wins.
+        """
+        if not len(self.labels):
+            return None
+        point = np.asarray(point, dtype=float)
+
+        best_index = -1
+        best_distance = np.inf
+        best_volume = np.inf
+        heap = [(0.0, 0)]
+        while heap:
+            node_distance, node = heapq.heappop(heap)
+            if node_distance > best_distance:
+                break
+            if self.left[node] == -1:
+                members = self.order[self.start[node]:self.start[node] + self.count[node]]
+                distances = self._box_distance(point, self.mins[members], self.maxs[members])
+                volumes = np.prod(self.maxs[members] - self.mins[members], axis=1)
+                pick = np.lexsort((volumes, distances))[0]
+                distance, volume = float(distances[pick]), float(volumes[pick])
+                if distance < best_distance or (distance == best_distance and volume < best_volume):
+                    best_index, best_distance, best_volume = int(members[pick]), distance, volume
+                continue
+            children = (self.left[node], self.right[node])
+            child_distances = self._box_distance(point, self.node_min[list(children)], self.node_max[list(children)])
+            for child, distance in zip(children, child_distances):
+                if distance <= best_distance:
+                    heapq.heappush(heap, (float(distance), int(child)))
+
+        if best_index < 0 or (max_distance is not None and best_distance > max_distance):
+            return None
+        return self.labels[best_index]
+
+    def nearest_elements(self, points: Sequence[Sequence[float]], max_distance: Optional[float] = None) -> List[Optional[str]]:
+        return [self.nearest(point, max_distance) for point in points]
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Model manifest: the summary of a GLB that listing pages and the viewer need.
+
+Everything comes from the JSON chunk except texture dimensions, which are
+read from the first bytes of each embedded image (PNG/JPEG/WebP headers),
+so building a manifest never decodes geometry or pixels.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .element_bvh import mesh_primitive_boxes
+    from .glb_snapshot import extract_snapshots_from_nodes, open_glb, world_node_matrices
+except ImportError:  # executed directly as a CLI script
+    from element_bvh import mesh_primitive_boxes
+    from glb_snapshot import extract_snapshots_from_nodes, open_glb, world_node_matrices
+
+MANIFEST_VERSION = 1
+
+# Root rotation exporters add when converting a Z-up scene to glTF's Y-up.
+_Z_UP_ROTATIONS = ((-0.7071068, 0.0, 0.0, 0.7071068), (0.7071068, 0.0, 0.0, -0.7071068))
+
+
+def image_dimensions(data: memoryview) -> Optional[Tuple[int, int]]:
+    """(width, height) from a PNG, JPEG or WebP header, or ``None``."""
+    header = bytes(data[:32])
+    if header.startswith(b"\x89PNG\r\n\x1a\n") and len(header) >= 24:
+        return struct.unpack(">II", header[16:24])
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP" and len(header) >= 30:
+        chunk = header[12:16]
+        if chunk == b"VP8X":
+            width = 1 + int.from_bytes(header[24:27], "little")
+            height = 1 + int.from_bytes(header[27:30], "little")
+            return width, height
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(header[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        return None
+    if header[:2] == b"\xff\xd8":
+        offset = 2
+        while offset + 9 <= len(data):
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                offset += 2
+                continue
+            length = struct.unpack(">H", bytes(data[offset + 2:offset + 4]))[0]
+            # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", bytes(data[offset + 5:offset + 9]))
+                return width, height
+            offset += 2 + length
+    return None
+
+
+def _primitive_counts(primitive: Dict[str, Any], accessors: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """(triangles, vertices) drawn by one primitive."""
+    position = (primitive.get("attributes") or {}).get("POSITION")
+    vertices = accessors[position]["count"] if position is not None else 0
+    elements = accessors[primitive["indices"]]["count"] if "indices" in primitive else vertices
+    mode = primitive.get("mode", 4)
+    if mode == 4:
+        triangles = elements // 3
+    elif mode in (5, 6):
+        triangles = max(elements - 2, 0)
+    else:
+        triangles = 0
+    return triangles, vertices
+
+
+def _up_axis(document: Dict[str, Any]) -> str:
+    extras = (document.get("asset") or {}).get("extras") or {}
+    declared = extras.get("upAxis") or extras.get("up_axis")
+    if isinstance(declared, str) and declared:
+        return declared.upper()
+
+    nodes = document.get("nodes") or []
+    scenes = document.get("scenes") or []
+    scene = scenes[document.get("scene", 0)] if scenes else {"nodes": range(len(nodes))}
+    for index in scene.get("nodes") or []:
+        rotation = nodes[index].get("rotation")
+        if rotation and any(np.allclose(rotation, candidate, atol=1e-3) for candidate in _Z_UP_ROTATIONS):
+            return "Z"
+    return "Y"
+
+
+def build_manifest(glb_file: Path | str) -> Dict[str, Any]:
+    """Summarise *glb_file* as a JSON-serialisable dict."""
+    path = Path(glb_file)
+    with open_glb(path) as (document, binary):
+        nodes = document.get("nodes") or []
+        meshes = document.get("meshes") or []
+        accessors = document.get("accessors") or []
+        views = document.get("bufferViews") or []
+        world = world_node_matrices(nodes)
+
+        triangles = vertices = primitives = 0
+        for node in nodes:
+            mesh_index = node.get("mesh")
+            if mesh_index is None:
+                continue
+            for primitive in meshes[mesh_index].get("primitives") or []:
+                primitive_triangles, primitive_vertices = _primitive_counts(primitive, accessors)
+                triangles += primitive_triangles
+                vertices += primitive_vertices
+                primitives += 1
+
+        _, box_mins, box_maxs = mesh_primitive_boxes(document, path, world)
+        bbox_min = box_mins.min(axis=0).tolist() if len(box_mins) else None
+        bbox_max = box_maxs.max(axis=0).tolist() if len(box_maxs) else None
+
+        textures = []
+        for index, image in enumerate(document.get("images") or []):
+            entry: Dict[str, Any] = {"index": index, "name": image.get("name"), "mime_type": image.get("mimeType")}
+            if "bufferView" in image:
+                view = views[image["bufferView"]]
+                start = view.get("byteOffset", 0)
+                entry["bytes"] = view["byteLength"]
+                dimensions = image_dimensions(binary[start:start + view["byteLength"]])
+                if dimensions:
+                    entry["width"], entry["height"] = dimensions
+            else:
+                entry["uri"] = image.get("uri", "")[:200]
+            textures.append(entry)
+
+        buffers = [
+            {"index": index, "byte_length": buffer.get("byteLength", 0), "embedded": "uri" not in buffer}
+            for index, buffer in enumerate(document.get("buffers") or [])
+        ]
+
+        return {
+            "version": MANIFEST_VERSION,
+            "file_size": os.path.getsize(path),
+            "generator": (document.get("asset") or {}).get("generator"),
+            "bbox_min": bbox_min,
+            "bbox_max": bbox_max,
+            "up_axis": _up_axis(document),
+            "node_count": len(nodes),
+            "mesh_count": len(meshes),
+            "primitive_count": primitives,
+            "triangle_count": triangles,
+            "vertex_count": vertices,
+            "material_count": len(document.get("materials") or []),
+            "textures": textures,
+            "buffers": buffers,
+            "snapshot_count": len(extract_snapshots_from_nodes(nodes, world)),
+        }
+
+
+def cli(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Print the model manifest of a GLB file.")
+    parser.add_argument("glb", type=Path, help="Path to the GLB file")
+    args = parser.parse_args(argv)
+    print(json.dumps(build_manifest(args.glb), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(cli())
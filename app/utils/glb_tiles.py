@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""Split a large GLB into an octree of spatial tiles for progressive loading.
+
+Triangles are assigned to octree leaves by their world-space centroid, so a
+single huge scan mesh is split as readily as a park of separate houses.
+Every leaf becomes a small GLB whose nodes keep the source node's world
+matrix, so vertex data is copied without re-transforming normals or
+tangents. Snapshot nodes and non-triangle geometry go into ``base.glb``,
+which the viewer loads first. Embedded images are written once as separate
+files and referenced by URI from every tile that uses them.
+
+Output lives in ``<name>.tiles/`` next to the source::
+
+    tileset.json   bounds and per-tile bounding boxes (glTF world space)
+    base.glb       snapshot nodes and other small geometry
+    tile_<id>.glb  one file per octree leaf
+    image_<n>.*    shared textures
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .glb_lod import (
+        ARRAY_BUFFER,
+        ELEMENT_ARRAY_BUFFER,
+        TRIANGLES,
+        UNSIGNED_INT,
+        UNSIGNED_SHORT,
+        _BinaryWriter,
+        _check_supported,
+        write_glb,
+    )
+    from .glb_snapshot import open_glb, read_accessor, world_node_matrices
+except ImportError:  # executed directly as a CLI script
+    from glb_lod import (
+        ARRAY_BUFFER,
+        ELEMENT_ARRAY_BUFFER,
+        TRIANGLES,
+        UNSIGNED_INT,
+        UNSIGNED_SHORT,
+        _BinaryWriter,
+        _check_supported,
+        write_glb,
+    )
+    from glb_snapshot import open_glb, read_accessor, world_node_matrices
+
+TILESET_VERSION = 1
+MAX_TILE_TRIANGLES = 100_000
+MAX_DEPTH = 6
+
+IMAGE_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp", "image/ktx2": ".ktx2"}
+
+
+def tiles_dir(glb_file: Path | str) -> Path:
+    path = Path(glb_file)
+    return path.with_name(f"{path.stem}.tiles")
+
+
+def load_tileset(glb_file: Path | str) -> Optional[Dict[str, Any]]:
+    """The tileset for *glb_file*, or ``None`` if missing or built from an older file."""
+    try:
+        with open(tiles_dir(glb_file) / "tileset.json", "r", encoding="utf-8") as fh:
+            tileset = json.load(fh)
+        stat = os.stat(glb_file)
+    except (OSError, json.JSONDecodeError):
+        return None
+    source = tileset.get("source") or {}
+    if (
+        tileset.get("version") != TILESET_VERSION
+        or source.get("size") != stat.st_size
+        or source.get("mtime_ns") != stat.st_mtime_ns
+    ):
+        return None
+    return tileset
+
+
+def build_octree(centroids: np.ndarray, lo: np.ndarray, hi: np.ndarray, max_triangles: int = MAX_TILE_TRIANGLES,
+                 max_depth: int = MAX_DEPTH) -> List[Tuple[str, np.ndarray]]:
+    """Return ``(tile_id, triangle_indices)`` for every non-empty leaf.
+
+    Tile ids are the octant path from the root, e.g. ``"0"`` for a model
+    small enough to fit one tile and ``"0527"`` three levels down.
+    """
+    leaves: List[Tuple[str, np.ndarray]] = []
+    stack = [("0", np.arange(len(centroids)), lo, hi, 0)]
+    while stack:
+        tile_id, members, box_lo, box_hi, depth = stack.pop()
+        if len(members) <= max_triangles or depth >= max_depth:
+            leaves.append((tile_id, members))
+            continue
+        mid = (box_lo + box_hi) * 0.5
+        above = centroids[members] >= mid
+        octant = above[:, 0] * 1 + above[:, 1] * 2 + above[:, 2] * 4
+        for child in range(8):
+            selected = members[octant == child]
+            if not len(selected):
+                continue
+            upper = np.array([(child >> axis) & 1 for axis in range(3)], dtype=bool)
+            child_lo = np.where(upper, mid, box_lo)
+            child_hi = np.where(upper, box_hi, mid)
+            stack.append((f"{tile_id}{child}", selected, child_lo, child_hi, depth + 1))
+    leaves.sort(key=lambda leaf: leaf[0])
+    return leaves
+
+
+class _TileBuilder:
+    """Assembles one tile GLB from slices of the source document."""
+
+    def __init__(self, source: Dict[str, Any], image_uris: Dict[int, str]):
+        self.source = source
+        self.image_uris = image_uris
+        self.writer = _BinaryWriter()
+        self.document: Dict[str, Any] = {
+            "asset": {"version": "2.0", "generator": "pcd glb_tiles"},
+            "scene": 0,
+            "scenes": [{"nodes": []}],
+            "nodes": [],
+            "meshes": [],
+            "accessors": [],
+        }
+        for key in ("extensionsUsed", "extensionsRequired"):
+            if source.get(key):
+                self.document[key] = list(source[key])
+        self._maps: Dict[str, Dict[int, int]] = {"materials": {}, "textures": {}, "images": {}, "samplers": {}}
+
+    def _copy(self, kind: str, index: int) -> Tuple[int, Optional[Dict[str, Any]]]:
+        mapping = self._maps[kind]
+        if index in mapping:
+            return mapping[index], None
+        entry = copy.deepcopy(self.source[kind][index])
+        items = self.document.setdefault(kind, [])
+        items.append(entry)
+        mapping[index] = len(items) - 1
+        return mapping[index], entry
+
+    def _image(self, index: int) -> int:
+        new_index, entry = self._copy("images", index)
+        if entry is not None and index in self.image_uris:
+            entry.pop("bufferView", None)
+            entry.pop("mimeType", None)
+            entry["uri"] = self.image_uris[index]
+        return new_index
+
+    def _texture(self, index: int) -> int:
+        new_index, entry = self._copy("textures", index)
+        if entry is not None:
+            if "source" in entry:
+                entry["source"] = self._image(entry["source"])
+            if "sampler" in entry:
+                entry["sampler"] = self._copy("samplers", entry["sampler"])[0]
+            for extension in (entry.get("extensions") or {}).values():
+                if isinstance(extension, dict) and "source" in extension:
+                    extension["source"] = self._image(extension["source"])
+        return new_index
+
+    def _remap_texture_refs(self, value: Any) -> None:
+        if not isinstance(value, dict):
+            return
+        for key, child in value.items():
+            if isinstance(child, dict):
+                if key.endswith("Texture") and "index" in child:
+                    child["index"] = self._texture(child["index"])
+                self._remap_texture_refs(child)
+
+    def _material(self, index: int) -> int:
+        new_index, entry = self._copy("materials", index)
+        if entry is not None:
+            self._remap_texture_refs(entry)
+        return new_index
+
+    def _accessor(self, values: np.ndarray, template: Dict[str, Any], target: int, bounds: bool) -> int:
+        accessor = {k: v for k, v in template.items() if k not in ("bufferView", "byteOffset", "sparse", "min", "max")}
+        data = np.ascontiguousarray(values).astype(values.dtype.newbyteorder("<")).tobytes()
+        accessor.update({"bufferView": self.writer.add_view(data, target=target), "count": len(values)})
+        if bounds and len(values):
+            accessor["min"] = values.min(axis=0).tolist()
+            accessor["max"] = values.max(axis=0).tolist()
+        self.document["accessors"].append(accessor)
+        return len(self.document["accessors"]) - 1
+
+    def add_node(self, name: Optional[str], matrix: np.ndarray, primitives: List[Dict[str, Any]],
+                 extras: Any = None) -> None:
+        """*primitives* items: ``source`` primitive, ``attributes`` {name: values}, ``indices`` or None."""
+        node: Dict[str, Any] = {}
+        if name:
+            node["name"] = name
+        if extras is not None:
+            node["extras"] = copy.deepcopy(extras)
+        if not np.allclose(matrix, np.eye(4)):
+            node["matrix"] = matrix.flatten(order="F").tolist()
+
+        if primitives:
+            mesh_primitives = []
+            for item in primitives:
+                source = item["source"]
+                primitive: Dict[str, Any] = {"attributes": {}}
+                for attribute, values in item["attributes"].items():
+                    template = self.source["accessors"][source["attributes"][attribute]]
+                    primitive["attributes"][attribute] = self._accessor(values, template, ARRAY_BUFFER, True)
+                indices = item.get("indices")
+                if indices is not None:
+                    wide = len(next(iter(item["attributes"].values()))) >= 0xFFFF
+                    component, dtype = (UNSIGNED_INT, np.uint32) if wide else (UNSIGNED_SHORT, np.uint16)
+                    template = {"componentType": component, "type": "SCALAR"}
+                    primitive["indices"] = self._accessor(
+                        indices.reshape(-1, 1).astype(dtype), template, ELEMENT_ARRAY_BUFFER, False
+                    )
+                if "material" in source:
+                    primitive["material"] = self._material(source["material"])
+                if "mode" in source:
+                    primitive["mode"] = source["mode"]
+                mesh_primitives.append(primitive)
+            self.document["meshes"].append({"name": name, "primitives": mesh_primitives} if name else {"primitives": mesh_primitives})
+            node["mesh"] = len(self.document["meshes"]) - 1
+
+        self.document["nodes"].append(node)
+        self.document["scenes"][0]["nodes"].append(len(self.document["nodes"]) - 1)
+
+    def finish(self) -> Tuple[Dict[str, Any], bytes]:
+        binary = self.writer.getvalue()
+        if self.writer.views:
+            self.document["bufferViews"] = self.writer.views
+            self.document["buffers"] = [{"byteLength": len(binary)}]
+        if not self.document["meshes"]:
+            self.document.pop("meshes")
+        if not self.document["accessors"]:
+            self.document.pop("accessors")
+        return self.document, binary
+
+
+def _write_images(document: Dict[str, Any], binary: memoryview, target_dir: Path) -> Dict[int, str]:
+    uris: Dict[int, str] = {}
+    views = document.get("bufferViews") or []
+    for index, image in enumerate(document.get("images") or []):
+        if "bufferView" not in image:
+            continue
+        view = views[image["bufferView"]]
+        start = view.get("byteOffset", 0)
+        name = f"image_{index}{IMAGE_EXTENSIONS.get(image.get('mimeType'), '.bin')}"
+        with open(target_dir / name, "wb") as fh:
+            fh.write(binary[start:start + view["byteLength"]])
+        uris[index] = name
+    return uris
+
+
+def _is_tileable(primitive: Dict[str, Any]) -> bool:
+    return (
+        primitive.get("mode", TRIANGLES) == TRIANGLES
+        and "POSITION" in (primitive.get("attributes") or {})
+        and not primitive.get("extensions")
+    )
+
+
+def _subset(attributes: Dict[str, np.ndarray], triangles: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    used, local = np.unique(triangles, return_inverse=True)
+    return {name: values[used] for name, values in attributes.items()}, local.reshape(-1, 3)
+
+
+def build_tiles(glb_file: Path | str, max_triangles: int = MAX_TILE_TRIANGLES,
+                max_depth: int = MAX_DEPTH) -> Dict[str, Any]:
+    """Write the tiled copy of *glb_file* and return its tileset manifest.
+
+    The output directory is replaced atomically, so a viewer never sees a
+    half-written tileset. Morph targets, skins and animations are not
+    carried over; tiles are static geometry.
+    """
+    glb_file = Path(glb_file)
+    stat = glb_file.stat()
+    final_dir = tiles_dir(glb_file)
+    work_dir = final_dir.with_name(f"{final_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    work_dir.mkdir(parents=True)
+
+    try:
+        with open_glb(glb_file) as (document, binary):
+            _check_supported(document)
+            nodes = document.get("nodes") or []
+            meshes = document.get("meshes") or []
+            world = world_node_matrices(nodes)
+            image_uris = _write_images(document, binary, work_dir)
+
+            accessor_cache: Dict[int, np.ndarray] = {}
+
+            def accessor(index: int) -> np.ndarray:
+                if index not in accessor_cache:
+                    accessor_cache[index] = read_accessor(document, binary, index)
+                return accessor_cache[index]
+
+            def primitive_data(primitive: Dict[str, Any]) -> Tuple[Dict[str, np.ndarray], Optional[np.ndarray]]:
+                attributes = {name: accessor(index) for name, index in primitive["attributes"].items()}
+                indices = accessor(primitive["indices"]).reshape(-1).astype(np.int64) if "indices" in primitive else None
+                return attributes, indices
+
+            base = _TileBuilder(document, image_uris)
+            segments = []  # (node index, primitive, attributes, triangles)
+            centroid_parts = []
+            for node_index, node in enumerate(nodes):
+                mesh_index = node.get("mesh")
+                is_snapshot = "Snapshot" in (node.get("name") or "")
+                if mesh_index is None:
+                    if is_snapshot:
+                        base.add_node(node.get("name"), world[node_index], [], node.get("extras"))
+                    continue
+
+                base_primitives = []
+                for primitive in meshes[mesh_index].get("primitives") or []:
+                    attributes, indices = primitive_data(primitive)
+                    if is_snapshot or not _is_tileable(primitive):
+                        base_primitives.append({"source": primitive, "attributes": attributes, "indices": indices})
+                        continue
+                    if indices is None:
+                        indices = np.arange(len(attributes["POSITION"]), dtype=np.int64)
+                    triangles = indices[: len(indices) - len(indices) % 3].reshape(-1, 3)
+                    if not len(triangles):
+                        continue
+                    matrix = world[node_index]
+                    positions = attributes["POSITION"].astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+                    centroid_parts.append(positions[triangles].mean(axis=1))
+                    segments.append((node_index, primitive, attributes, triangles))
+                if base_primitives:
+                    base.add_node(node.get("name"), world[node_index], base_primitives, node.get("extras"))
+
+            base_document, base_binary = base.finish()
+            write_glb(work_dir / "base.glb", base_document, base_binary)
+
+            tiles = []
+            bounds_lo = bounds_hi = None
+            if segments:
+                centroids = np.concatenate(centroid_parts)
+                segment_of = np.repeat(np.arange(len(segments)), [len(s[3]) for s in segments])
+                offsets = np.concatenate(([0], np.cumsum([len(s[3]) for s in segments])))
+                bounds_lo, bounds_hi = centroids.min(axis=0), centroids.max(axis=0)
+                size = float((bounds_hi - bounds_lo).max()) or 1.0
+                cube_hi = bounds_lo + size  # cubic root cell keeps octants well-shaped
+
+                for tile_id, members in build_octree(centroids, bounds_lo, cube_hi, max_triangles, max_depth):
+                    builder = _TileBuilder(document, image_uris)
+                    tile_lo = np.full(3, np.inf)
+                    tile_hi = np.full(3, -np.inf)
+                    members = np.sort(members)
+                    for segment_index in np.unique(segment_of[members]):
+                        node_index, primitive, attributes, triangles = segments[segment_index]
+                        selected = members[segment_of[members] == segment_index] - offsets[segment_index]
+                        sub_attributes, sub_triangles = _subset(attributes, triangles[selected])
+                        matrix = world[node_index]
+                        positions = sub_attributes["POSITION"].astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+                        tile_lo = np.minimum(tile_lo, positions.min(axis=0))
+                        tile_hi = np.maximum(tile_hi, positions.max(axis=0))
+                        builder.add_node(
+                            nodes[node_index].get("name"), matrix,
+                            [{"source": primitive, "attributes": sub_attributes, "indices": sub_triangles}],
+                        )
+                    tile_document, tile_binary = builder.finish()
+                    uri = f"tile_{tile_id}.glb"
+                    write_glb(work_dir / uri, tile_document, tile_binary)
+                    tiles.append({
+                        "id": tile_id,
+                        "uri": uri,
+                        "min": tile_lo.tolist(),
+                        "max": tile_hi.tolist(),
+                        "triangles": int(len(members)),
+                        "bytes": (work_dir / uri).stat().st_size,
+                    })
+                bounds_lo = np.min([tile["min"] for tile in tiles], axis=0)
+                bounds_hi = np.max([tile["max"] for tile in tiles], axis=0)
+
+        tileset = {
+            "version": TILESET_VERSION,
+            "source": {"name": glb_file.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+            "min": bounds_lo.tolist() if bounds_lo is not None else None,
+            "max": bounds_hi.tolist() if bounds_hi is not None else None,
+            "base": "base.glb",
+            "tiles": tiles,
+        }
+        with open(work_dir / "tileset.json", "w", encoding="utf-8") as fh:
+            json.dump(tileset, fh)
+
+        stale_dir = final_dir.with_name(f"{final_dir.name}.old-{os.getpid()}")
+        if final_dir.exists():
+            os.replace(final_dir, stale_dir)
+        os.replace(work_dir, final_dir)
+        shutil.rmtree(stale_dir, ignore_errors=True)
+        return tileset
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+
+def remove_tiles(glb_file: Path | str) -> None:
+    shutil.rmtree(tiles_dir(glb_file), ignore_errors=True)
+
+
+def cli(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Split a GLB file into an octree of spatial tiles.")
+    parser.add_argument("glb", type=Path, help="Path to the GLB file")
+    parser.add_argument("--max-triangles", type=int, default=MAX_TILE_TRIANGLES, help="Triangle budget per tile")
+    parser.add_argument("--max-depth", type=int, default=MAX_DEPTH, help="Maximum octree depth")
+    args = parser.parse_args(argv)
+
+    tileset = build_tiles(args.glb, args.max_triangles, args.max_depth)
+    print(f"Wrote {len(tileset['tiles'])} tiles to {tiles_dir(args.glb)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(cli())
@@ -0,0 +1,124 @@
+"""Thumbnail and medium-size variants of uploaded defect photos.
+
+Each variant is EXIF-oriented, stripped of metadata and written as both
+JPEG and WebP next to the original (``<name>.thumb.jpg``,
+``<name>.thumb.webp``, ...). Originals live in the content-addressed blob
+store, so a variant never changes once written.
+
+Generation runs on a small background thread pool after the upload is
+committed; ``DefectImage.derivatives`` stays NULL until it finishes and the
+image routes fall back to the original meanwhile.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest side in pixels
+SIZES = {'thumb': 320, 'medium': 1280}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 78
+EXIF_ORIENTATION = 0x0112
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_path(image_path, size, fmt):
+    """``uploads/blobs/ab/cd/<digest>.jpg`` -> ``.../<digest>.thumb.webp``."""
+    root, _ = os.path.splitext(image_path)
+    return f"{root}.{size}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def _flatten(image):
+    """RGB version of an RGB/RGBA image for JPEG, with transparency on white."""
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def generate_derivatives(static_root, image_path):
+    """Write every size/format of *image_path* and describe them.
+
+    Returns ``{'width', 'height', 'variants': {size: {'jpeg', 'webp',
+    'width', 'height'}}}`` or ``None`` if the file is not an image Pillow can
+    read. Existing variant files are reused.
+    """
+    source = os.path.join(static_root, image_path)
+    try:
+        with Image.open(source) as opened:
+            width, height = opened.size
+            if opened.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):  # rotated by 90 degrees
+                width, height = height, width
+            opened.draft('RGB', (max(SIZES.values()),) * 2)  # JPEG: decode at reduced scale
+            original = ImageOps.exif_transpose(opened)
+            original.load()
+    except (UnidentifiedImageError, OSError):
+        return None
+    if original.mode not in ('RGB', 'RGBA'):
+        has_alpha = original.mode in ('LA', 'PA') or 'transparency' in original.info
+        original = original.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {}
+    for size, longest in sorted(SIZES.items(), key=lambda item: -item[1]):
+        scaled = original.copy()
+        scaled.thumbnail((longest, longest), Image.LANCZOS)
+        entry = {'width': scaled.width, 'height': scaled.height}
+        for fmt in ('jpeg', 'webp'):
+            relative = variant_path(image_path, size, fmt)
+            entry[fmt] = relative
+            target = os.path.join(static_root, relative)
+            if os.path.exists(target):
+                continue
+            tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if fmt == 'jpeg':
+                _flatten(scaled).save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            else:
+                scaled.save(tmp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+            os.replace(tmp_path, target)
+        variants[size] = entry
+    return {'width': width, 'height': height, 'variants': variants}
+
+
+def remove_derivatives(file_path):
+    """Delete the variants of the original at absolute *file_path*."""
+    for size in SIZES:
+        for fmt in ('jpeg', 'webp'):
+            try:
+                os.remove(variant_path(file_path, size, fmt))
+            except OSError:
+                pass
+
+
+def _process(app, image_path):
+    from app.models import DefectImage
+    from app.module3.extensions import db
+
+    with app.app_context():
+        try:
+            result = generate_derivatives(os.path.join(app.root_path, 'static'), image_path)
+        except Exception:
+            app.logger.exception("Could not build image derivatives for %s", image_path)
+            result = None
+        values = {'derivatives': (result or {}).get('variants', {})}
+        if result:
+            values.update(width=result['width'], height=result['height'])
+        # Blobs are shared, so every row pointing at this file gets the variants
+        DefectImage.query.filter_by(image_path=image_path).update(values, synchronize_session=False)
+        db.session.commit()
+
+
+def queue_derivatives(app, image_paths):
+    """Build variants for *image_paths* in the background; returns the futures."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('IMAGE_DERIVATIVE_WORKERS', 2),
+                thread_name_prefix='image-derivatives',
+            )
+    return [_executor.submit(_process, app, path) for path in sorted(set(image_paths))]
@@ -0,0 +1,35 @@
+"""Fast JSON encoding for large API responses.
+
+orjson is used when it is installed: it encodes lists of flat dicts several
+times faster than the standard library and returns bytes directly. Without
+it, ``json`` with compact separators produces the same documents.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, listed in requirements.txt
+    orjson = None
+
+
+def dumps(value):
+    """*value* as compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def iter_array(batches):
+    """Encode an iterable of lists as one JSON array, one chunk per list."""
+    yield b'['
+    first = True
+    for batch in batches:
+        if not batch:
+            continue
+        if not first:
+            yield b','
+        # Strip the brackets of each encoded batch so the items join into one array
+        yield dumps(batch)[1:-1]
+        first = False
+    yield b']'
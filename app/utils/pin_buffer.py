@@ -0,0 +1,69 @@
+"""Packed binary encoding of the 3D viewer's pin list.
+
+A JSON pin array repeats every key and writes each coordinate as text.
+For large projects the viewer can ask for this layout instead: the numeric
+columns as little-endian arrays it can wrap in typed arrays (the positions
+go straight into an instanced buffer), and the free-text columns as one
+small JSON side-table of per-column lists.
+
+Layout, every array starting on a 4-byte boundary::
+
+    0   4s      magic b'PINS'
+    4   uint16  version (1)
+    6   uint16  reserved (0)
+    8   uint32  pin count n
+    12  uint32  side-table length in bytes
+    16  uint32  defect ids            [n]
+        float32 positions x, y, z     [3n]
+        uint32  first image id        [n]   0 = no image
+        uint8   severity code         [n]   index into table['severity']
+        uint8   status code           [n]   index into table['status']
+        utf-8   JSON side-table
+
+Coordinates are Float32, so they keep about seven significant digits.
+app/static/module3/js/visualize.js (``decodePinBuffer``) reads it back.
+"""
+
+import struct
+
+import numpy as np
+
+from app.utils import json_stream
+
+MIMETYPE = 'application/vnd.pcd.pins'
+MAGIC = b'PINS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+MAX_CODES = 256
+
+
+def _codes(values, column):
+    """uint8 codes for *values* and the list they index."""
+    lookup = {}
+    codes = [lookup.setdefault(value, len(lookup)) for value in values]
+    if len(lookup) > MAX_CODES:
+        raise ValueError(f"{len(lookup)} distinct {column} values do not fit in uint8 codes")
+    return np.array(codes, dtype=np.uint8), list(lookup)
+
+
+def encode(ids, positions, image_ids, severity, status, table):
+    """Pack one column per argument into the binary layout above.
+
+    *positions* holds one ``(x, y, z)`` per pin and *image_ids* uses 0 for
+    pins without an image. *table* is the side-table of text columns; the
+    severity and status value lists are added to it. Raises ``ValueError``
+    if either has more distinct values than a uint8 code can hold.
+    """
+    count = len(ids)
+    severity_codes, table['severity'] = _codes(severity, 'severity')
+    status_codes, table['status'] = _codes(status, 'status')
+    encoded_table = json_stream.dumps(table)
+    return b''.join((
+        HEADER.pack(MAGIC, VERSION, 0, count, len(encoded_table)),
+        np.array(ids, dtype='<u4').tobytes(),
+        np.array(positions, dtype='<f4').reshape(count * 3).tobytes(),
+        np.array(image_ids, dtype='<u4').tobytes(),
+        severity_codes.tobytes(),
+        status_codes.tobytes(),
+        encoded_table,
+    ))
@@ -0,0 +1,75 @@
+"""LOD variants and model manifest of uploaded scans, built in the background.
+
+Decimating a multi-hundred-MB scan takes far longer than an upload request
+should, so ``insert_defect`` only queues the work. Until it finishes the
+viewer serves the full model (``available_lods()`` reports level 0 only)
+and the manifest lookup finds nothing, which every reader already handles.
+
+Each blob is prepared once per process at a time; a path queued again while
+its preparation is running is skipped.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.exc import IntegrityError
+
+from app.module3.extensions import db
+from app.models import ModelManifest
+from app.utils.glb_lod import available_lods, generate_lods
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def prepare_scan(app, scan_path):
+    """Build LOD variants and the manifest of *scan_path* (relative to static/)."""
+    file_path = os.path.join(app.root_path, 'static', scan_path)
+    with app.app_context():
+        # Decimated variants so the viewer can paint a light model first
+        if len(available_lods(file_path)) == 1:
+            try:
+                generate_lods(file_path)
+            except Exception:
+                app.logger.warning("LOD generation skipped for %s", scan_path, exc_info=True)
+        if not ModelManifest.query.filter_by(model_path=scan_path).first():
+            try:
+                ModelManifest.record(scan_path, file_path)
+                db.session.commit()
+            except IntegrityError:
+                # Recorded meanwhile by another worker
+                db.session.rollback()
+            except Exception:
+                db.session.rollback()
+                app.logger.warning("Model manifest skipped for %s", scan_path, exc_info=True)
+
+
+def _run(app, scan_path):
+    try:
+        prepare_scan(app, scan_path)
+    finally:
+        with _executor_lock:
+            _in_flight.discard(scan_path)
+
+
+def queue_scan_preparation(app, scan_path):
+    """Prepare *scan_path* in the background; returns the future, or ``None``.
+
+    ``None`` means there is nothing to do here: the scan is not a GLB or is
+    already being prepared.
+    """
+    global _executor
+    if not scan_path.lower().endswith('.glb'):
+        return None
+    with _executor_lock:
+        if scan_path in _in_flight:
+            return None
+        _in_flight.add(scan_path)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('SCAN_PREPARATION_WORKERS', 1),
+                thread_name_prefix='scan-preparation',
+            )
+    return _executor.submit(_run, app, scan_path)
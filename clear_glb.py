@@ -1,6 +1,8 @@
 from app import create_app
 from app.module3.extensions import db
 from app.models import Project
+from app.utils.glb_lod import remove_lods
+from app.utils.glb_tiles import remove_tiles
 import os
 
 app = create_app()
@@ -22,6 +24,8 @@ with app.app_context():
             if os.path.exists(full_path):
                 try:
                     os.remove(full_path)
+                    remove_lods(full_path)
+                    remove_tiles(full_path)
                     print(f"  [DELETED] {full_path}")
                 except Exception as e:
                     print(f"  [ERROR] Could not delete {full_path}: {e}")
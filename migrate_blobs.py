@@ -0,0 +1,30 @@
+from app import create_app, db
+from datetime import datetime
+
+from sqlalchemy import text
+
+app = create_app()
+
+with app.app_context():
+    print("Starting blob store migration...")
+
+    try:
+        with db.engine.connect() as conn:
+            try:
+                conn.execute(text("ALTER TABLE blobs ADD COLUMN unreferenced_at TIMESTAMP"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_blobs_unreferenced_at ON blobs (unreferenced_at)"))
+                # Start the grace period of blobs already unreferenced now
+                conn.execute(
+                    text("UPDATE blobs SET unreferenced_at = :now WHERE ref_count <= 0"),
+                    {"now": datetime.utcnow()},
+                )
+                conn.commit()
+                print("Added column: unreferenced_at")
+            except Exception as e:
+                conn.rollback()
+                print(f"Skipping unreferenced_at (might exist): {e}")
+
+            print("Migration completed.")
+
+    except Exception as e:
+        print(f"Migration failed: {e}")
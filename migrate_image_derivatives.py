@@ -0,0 +1,27 @@
+from app import create_app, db
+from sqlalchemy import text
+
+app = create_app()
+
+with app.app_context():
+    print("Starting DefectImage derivatives migration...")
+
+    try:
+        with db.engine.connect() as conn:
+            for column, ddl in (
+                ("width", "INTEGER"),
+                ("height", "INTEGER"),
+                ("derivatives", "JSON"),
+            ):
+                try:
+                    conn.execute(text(f"ALTER TABLE defect_images ADD COLUMN {column} {ddl}"))
+                    conn.commit()
+                    print(f"Added column: {column}")
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Skipping {column} (might exist): {e}")
+
+            print("Migration completed. Run 'flask module3 build-image-derivatives' to backfill existing photos.")
+
+    except Exception as e:
+        print(f"Migration failed: {e}")
@@ -0,0 +1,32 @@
+from app import create_app
+from app.module3.extensions import db
+from app.models import Defect, DefectImage, Project
+from sqlalchemy import func
+
+app = create_app()
+
+with app.app_context():
+    print("Starting hot-path index migration...")
+
+    try:
+        duplicates = (
+            db.session.query(Project.name, func.count(Project.id))
+            .group_by(Project.name)
+            .having(func.count(Project.id) > 1)
+            .all()
+        )
+        with db.engine.connect() as conn:
+            # The indexes are declared on the models; create whichever are missing
+            for model in (Project, Defect, DefectImage):
+                for index in sorted(model.__table__.indexes, key=lambda i: i.name):
+                    if index.name == 'uq_projects_name' and duplicates:
+                        print(f"Skipping {index.name}: duplicate project names {[name for name, _ in duplicates]}")
+                        continue
+                    index.create(bind=conn, checkfirst=True)
+                    conn.commit()
+                    print(f"Index ready: {index.name}")
+
+            print("Migration completed. Run 'flask module3 check-query-plans' to confirm the hot queries use them.")
+
+    except Exception as e:
+        print(f"Migration failed: {e}")
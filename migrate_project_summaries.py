@@ -0,0 +1,31 @@
+from app import create_app
+from app.module3.extensions import db
+from app.models import Project, ProjectSummary, rebuild_project_summary
+
+app = create_app()
+
+with app.app_context():
+    print("Starting project summary migration...")
+
+    try:
+        ProjectSummary.__table__.create(bind=db.engine, checkfirst=True)
+
+        # Projects created before the summary hooks have no row yet
+        missing = [
+            project_id for (project_id,) in
+            db.session.query(Project.id)
+            .outerjoin(ProjectSummary, ProjectSummary.project_id == Project.id)
+            .filter(ProjectSummary.project_id == None)
+            .order_by(Project.id)
+        ]
+        connection = db.session.connection()
+        for project_id in missing:
+            rebuild_project_summary(connection, project_id)
+        db.session.commit()
+        print(f"Built {len(missing)} project summaries.")
+
+        print("Migration completed. Run 'flask module3 rebuild-project-summaries' to recount every project.")
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Migration failed: {e}")
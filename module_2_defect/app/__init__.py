@@ -9,6 +9,7 @@ from .upload_data.routes import upload_data_bp
 from .process_data.routes import process_data_bp
 from .defects.routes import defects_bp
 from .developer.routes import developer_bp
+from .jobs.routes import jobs_bp
 
 
 def create_app():
@@ -21,12 +22,16 @@ def create_app():
         # Import models so SQLAlchemy knows about them before creating tables
         from . import models
         db.create_all()
+        # Uploads used to share one latest_upload.json; move it into the uploads table
+        from .upload_data.metadata_store import import_legacy_metadata
+        import_legacy_metadata(os.path.join(app.instance_path, "uploads", "upload_data"))
 
     # register blueprints
     app.register_blueprint(upload_data_bp)
     app.register_blueprint(process_data_bp)
     app.register_blueprint(defects_bp)
     app.register_blueprint(developer_bp)
+    app.register_blueprint(jobs_bp)
 
     @app.route("/")
     def index():
@@ -3,4 +3,16 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///ldms.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Extracted Snapshot records are cached per GLB (see process_data/snapshot_cache.py)
+    SNAPSHOT_CACHE_MAX_ENTRIES = int(os.environ.get('SNAPSHOT_CACHE_MAX_ENTRIES', 32))
+    SNAPSHOT_CACHE_VERIFY_HASH = os.environ.get('SNAPSHOT_CACHE_VERIFY_HASH', '0') == '1'
+
+    # Background jobs (see jobs/runner.py); JOB_WORKERS=0 means one process per core
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 0)) or None
+    JOB_DRIVER_THREADS = int(os.environ.get('JOB_DRIVER_THREADS', 4))
+
+    # How extracted report images are matched to defects: 'greedy' or 'optimal'
+    # (see process_data/image_matching.py)
+    IMAGE_ASSIGNMENT_MODE = os.environ.get('IMAGE_ASSIGNMENT_MODE', 'greedy')
@@ -1,8 +1,9 @@
 from flask import Blueprint, jsonify, request, send_from_directory, abort, render_template, url_for, current_app
 from app.extensions import db
 from app.models import Defect, Scan, DefectImage
+from app.process_data.glb_lod import resolve_lod
+from app.upload_data.metadata_store import load_upload
 import os
-import json
 from datetime import datetime
 
 defects_bp = Blueprint('defects', __name__)
@@ -13,21 +14,12 @@ def list_projects():
     scans = Scan.query.order_by(Scan.created_at.desc()).all()
     
     # Enhance scan data with defect counts and metadata
+    metadata = load_upload()
     projects = []
     for scan in scans:
         # Only count actual defects, not house scans
         defect_count = Defect.query.filter_by(scan_id=scan.id).filter(Defect.scan_path == None).count()
         
-        # Try to load metadata for this scan
-        metadata = None
-        metadata_path = os.path.join(current_app.instance_path, 'uploads', 'upload_data', 'latest_upload.json')
-        if os.path.exists(metadata_path):
-            try:
-                with open(metadata_path, 'r') as f:
-                    metadata = json.load(f)
-            except:
-                pass
-        
         projects.append({
             'id': scan.id,
             'name': scan.name,
@@ -47,14 +39,7 @@ def visualize_scan(scan_id):
     model_url = url_for('defects.serve_model', scan_id=scan_id) if scan.model_path else None
     
     # Try to load upload metadata for project details
-    upload_metadata = None
-    metadata_path = os.path.join(current_app.instance_path, 'uploads', 'upload_data', 'latest_upload.json')
-    if os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, 'r') as f:
-                upload_metadata = json.load(f)
-        except Exception as e:
-            print(f"Error loading upload metadata: {e}")
+    upload_metadata = load_upload()
     
     return render_template('defects/visualization.html', 
                           scan=scan, 
@@ -70,15 +55,8 @@ def get_scan_defects(scan_id):
     defects = Defect.query.filter_by(scan_id=scan_id).filter(Defect.scan_path == None).all()
     
     # Load upload metadata to get the scan date
-    upload_date = None
-    metadata_path = os.path.join(current_app.instance_path, 'uploads', 'upload_data', 'latest_upload.json')
-    if os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, 'r') as f:
-                metadata = json.load(f)
-                upload_date = metadata.get('scan_date')
-        except Exception as e:
-            print(f"Error loading upload metadata: {e}")
+    metadata = load_upload()
+    upload_date = metadata.get('scan_date') if metadata else None
     
     defect_list = [{
         'defectId': d.id,
@@ -212,7 +190,12 @@ def serve_model(scan_id):
     if not scan.model_path:
         abort(404)
     upload_dir = os.path.join(current_app.instance_path, 'uploads', 'upload_data')
-    response = send_from_directory(upload_dir, scan.model_path)
+    model_path = scan.model_path
+    lod = request.args.get('lod', type=int)
+    if lod:
+        # Falls back to the full model if the LOD job has not produced this level
+        model_path = os.path.basename(resolve_lod(os.path.join(upload_dir, model_path), lod))
+    response = send_from_directory(upload_dir, model_path)
     response.headers['Content-Type'] = 'model/gltf-binary'
     return response
 
@@ -244,14 +227,7 @@ def view_project(scan_id):
     model_url = url_for('defects.serve_model', scan_id=scan_id) if scan.model_path else None
     
     # Try to load upload metadata for project details
-    upload_metadata = None
-    metadata_path = os.path.join(current_app.instance_path, 'uploads', 'upload_data', 'latest_upload.json')
-    if os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, 'r') as f:
-                upload_metadata = json.load(f)
-        except Exception as e:
-            print(f"Error loading upload metadata: {e}")
+    upload_metadata = load_upload()
     
     return render_template('defects/project_detail.html', 
                           scan=scan, 
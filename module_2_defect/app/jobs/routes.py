@@ -0,0 +1,36 @@
+import click
+from flask import Blueprint, jsonify, request
+
+from app.models import Job
+
+from .runner import fail_interrupted_jobs
+
+jobs_bp = Blueprint("jobs", __name__)
+
+
+@jobs_bp.route("/jobs", methods=["GET"])
+def list_jobs():
+    """Recent jobs, newest first; ``?status=`` and ``?kind=`` filter."""
+    query = Job.query
+    status = request.args.get("status")
+    if status:
+        query = query.filter(Job.status == status)
+    kind = request.args.get("kind")
+    if kind:
+        query = query.filter(Job.kind == kind)
+    limit = min(request.args.get("limit", 50, type=int) or 50, 200)
+    jobs = query.order_by(Job.id.desc()).limit(limit).all()
+    return jsonify([job.to_dict() for job in jobs])
+
+
+@jobs_bp.route("/jobs/<int:job_id>", methods=["GET"])
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
+
+@jobs_bp.cli.command("fail-interrupted")
+def fail_interrupted_command():
+    """Mark jobs a stopped server left queued/running as failed."""
+    ids = fail_interrupted_jobs()
+    click.echo(f"Marked {len(ids)} interrupted job(s) as failed.")
@@ -0,0 +1,203 @@
+"""Local background job runner.
+
+Jobs are rows in the ``jobs`` table. Each one is driven by a thread in the
+web process, which owns the database session and reports progress, while
+the CPU-heavy steps (GLB parsing, LOD generation, PDF extraction) are sent
+to a process pool sized to the machine, so they neither hold the GIL nor
+block Flask workers.
+
+Pool workers are started from a fork server, never forked from the web
+process: a fork would copy its threads' locks and share its database
+sockets. Each worker imports the app (building its own Flask app and
+engine) and drops any connections it inherited from the fork server.
+
+Handlers are registered with :func:`task` and receive a :class:`JobContext`.
+"""
+
+from __future__ import annotations
+
+import atexit
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.extensions import db
+from app.models import Job
+
+_handlers: Dict[str, Callable[["JobContext"], Optional[dict]]] = {}
+_runners: Dict[int, "JobRunner"] = {}
+_runners_lock = threading.Lock()
+
+
+def _init_worker() -> None:
+    from app import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Process pool for CPU-heavy steps, safe to start from a threaded web process."""
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_init_worker,
+    )
+
+
+def task(kind: str):
+    """Register the decorated function as the handler for jobs of *kind*."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+class JobContext:
+    """What a handler sees of its job: parameters, progress and the pool."""
+
+    def __init__(self, runner: "JobRunner", job: Job):
+        self.runner = runner
+        self.job = job
+        self.params: dict = dict(job.params or {})
+        self.result: dict = {}
+
+    @property
+    def app(self):
+        return self.runner.app
+
+    def progress(self, fraction: float, message: Optional[str] = None) -> None:
+        self.job.progress = max(0.0, min(1.0, fraction))
+        if message is not None:
+            self.job.message = message[:255]
+        db.session.commit()
+
+    def run_parallel(self, calls: Sequence[Tuple[str, Callable, tuple]],
+                     start: float = 0.0, end: float = 1.0) -> Iterator[Tuple[str, Optional[Any], Optional[BaseException]]]:
+        """Run ``(name, fn, args)`` calls on the process pool.
+
+        Yields ``(name, value, error)`` in completion order and advances the
+        job's progress from *start* to *end* as calls finish. A failing call
+        does not cancel the others.
+        """
+        if not calls:
+            return
+        futures: Dict[Future, str] = {
+            self.runner.pool.submit(fn, *args): name for name, fn, args in calls
+        }
+        pending = set(futures)
+        done_count = 0
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                done_count += 1
+                name = futures[future]
+                error = future.exception()
+                self.progress(start + (end - start) * done_count / len(calls),
+                              f"{name} {'failed' if error else 'done'}")
+                yield name, (None if error else future.result()), error
+
+
+class JobRunner:
+    """Per-app runner: a few driver threads plus a shared process pool."""
+
+    def __init__(self, app):
+        self.app = app
+        self.max_workers = app.config.get("JOB_WORKERS") or os.cpu_count() or 1
+        self._drivers = ThreadPoolExecutor(
+            max_workers=app.config.get("JOB_DRIVER_THREADS", 4), thread_name_prefix="job-driver"
+        )
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = process_pool(self.max_workers)
+            return self._pool
+
+    def submit(self, kind: str, params: Optional[dict] = None, start: bool = True) -> Job:
+        """Record a queued job and, unless *start* is False, hand it to a driver.
+
+        Callers that must publish the job id somewhere the handler reads
+        (e.g. upload metadata) submit with ``start=False`` and call
+        :meth:`start` afterwards.
+        """
+        if kind not in _handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = Job(kind=kind, status="queued", progress=0.0, params=params or {})
+        db.session.add(job)
+        db.session.commit()
+        if start:
+            self.start(job.id)
+        return job
+
+    def start(self, job_id: int) -> None:
+        self._drivers.submit(self._run, job_id)
+
+    def _run(self, job_id: int) -> None:
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            if job is None:
+                return
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+
+            context = JobContext(self, job)
+            try:
+                returned = _handlers[job.kind](context)
+                job.result = returned if returned is not None else context.result
+                job.status = "succeeded"
+                job.progress = 1.0
+            except Exception as exc:  # noqa: BLE001
+                db.session.rollback()
+                job = db.session.get(Job, job_id)
+                self.app.logger.exception("Job %s (%s) failed", job_id, job.kind)
+                job.status = "failed"
+                job.error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+                job.result = context.result or None
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            db.session.remove()
+
+    def shutdown(self) -> None:
+        self._drivers.shutdown(wait=False, cancel_futures=True)
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def get_job_runner(app) -> JobRunner:
+    """Return the runner for *app*, creating it on first use."""
+    with _runners_lock:
+        runner = _runners.get(id(app))
+        if runner is None:
+            from . import tasks  # noqa: F401  (registers the handlers)
+
+            runner = JobRunner(app)
+            _runners[id(app)] = runner
+            atexit.register(runner.shutdown)
+        return runner
+
+
+def enqueue(app, kind: str, params: Optional[dict] = None, start: bool = True) -> Job:
+    return get_job_runner(app).submit(kind, params, start=start)
+
+
+def fail_interrupted_jobs() -> List[int]:
+    """Mark jobs left queued/running by a previous process as failed."""
+    stale = Job.query.filter(Job.status.in_(("queued", "running"))).all()
+    for job in stale:
+        job.status = "failed"
+        job.error = "Interrupted by a server restart"
+        job.finished_at = datetime.utcnow()
+    if stale:
+        db.session.commit()
+    return [job.id for job in stale]
@@ -0,0 +1,151 @@
+"""Job handlers for the scan-processing pipeline.
+
+The ``_step_*`` functions run in the worker processes and must stay
+top-level and free of Flask/database access; the handlers run in a driver
+thread inside the app context and merge the step results.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.extensions import db
+from app.models import Defect, DefectImage, Scan
+from app.process_data.glb_lod import generate_lods
+from app.process_data.glb_manifest import build_manifest
+from app.process_data.glb_snapshot import extract_snapshots
+from app.process_data.snapshot_cache import get_snapshot_cache
+from app.upload_data.metadata_store import update_upload
+from app.upload_data.pdf_utils import extract_pdf_images
+
+from .runner import JobContext, task
+
+INSERT_BATCH_SIZE = 5000
+
+# Steps whose failure is logged in the result but does not fail the job.
+OPTIONAL_STEPS = {"manifest", "lods"}
+
+
+def _step_manifest(glb_path: str) -> dict:
+    return build_manifest(glb_path)
+
+
+def _step_snapshots(glb_path: str):
+    stat = os.stat(glb_path)
+    return stat, extract_snapshots(glb_path)
+
+
+def _step_lods(glb_path: str) -> List[str]:
+    return [os.path.basename(path) for path in generate_lods(glb_path)]
+
+
+@task("process_upload")
+def process_upload(ctx: JobContext) -> dict:
+    """Snapshots, manifest, LODs and PDF images for one upload, in parallel."""
+    params = ctx.params
+    glb_path = params["glb_path"]
+    pdf_path: Optional[str] = params.get("pdf_path")
+
+    calls = [
+        ("snapshots", _step_snapshots, (glb_path,)),
+        ("manifest", _step_manifest, (glb_path,)),
+        ("lods", _step_lods, (glb_path,)),
+    ]
+
+    ctx.progress(0.05, "Processing scan")
+    metadata_updates: dict = {}
+    errors: Dict[str, str] = {}
+    for name, value, error in ctx.run_parallel(calls, start=0.05, end=0.7 if pdf_path else 0.95):
+        if error is not None:
+            ctx.app.logger.warning("Step %s of job %s failed: %s", name, ctx.job.id, error)
+            errors[name] = str(error)
+            continue
+        if name == "snapshots":
+            stat, records = value
+            get_snapshot_cache(ctx.app).store(glb_path, records, stat)
+            ctx.result["snapshot_count"] = len(records)
+        elif name == "manifest":
+            metadata_updates["manifest"] = value
+            ctx.result["triangle_count"] = value.get("triangle_count")
+        elif name == "lods":
+            ctx.result["lods"] = value
+
+    if pdf_path:
+        # Page ranges are spread over the whole pool once the GLB steps are done
+        ctx.progress(0.7, "Extracting PDF images")
+        try:
+            images = extract_pdf_images(pdf_path, params["image_dir"], workers=ctx.runner.max_workers,
+                                        executor=ctx.runner.pool)
+        except Exception as exc:  # noqa: BLE001
+            ctx.app.logger.warning("Step pdf_images of job %s failed: %s", ctx.job.id, exc)
+            errors["pdf_images"] = str(exc)
+        else:
+            metadata_updates["images"] = images
+            metadata_updates["image_dir"] = params["image_dir"]
+            ctx.result["image_count"] = len(images)
+            ctx.result["distinct_image_count"] = sum(1 for image in images if not image["duplicate_of"])
+        ctx.progress(0.95, "pdf_images done")
+
+    if errors:
+        ctx.result["errors"] = errors
+    if metadata_updates:
+        update_upload(params["upload_id"], metadata_updates)
+
+    required_failures = sorted(set(errors) - OPTIONAL_STEPS)
+    if required_failures:
+        raise RuntimeError(f"Processing failed: {', '.join(required_failures)}")
+    return ctx.result
+
+
+@task("insert_defects")
+def insert_defects(ctx: JobContext) -> dict:
+    """Insert prepared defect records (and their linked images) for a scan.
+
+    Rows go out as multi-row INSERTs of ``INSERT_BATCH_SIZE`` and the
+    returned ids link the report images. Defects and images commit together
+    at the end: ``ctx.progress()`` commits the session, so it is only called
+    before the first INSERT, and a failed job leaves no partial rows for a
+    retry to duplicate.
+    """
+    params = ctx.params
+    records: List[dict] = params.get("records") or []
+    image_paths: Dict[str, str] = params.get("image_paths") or {}
+    ctx.progress(0.05, f"Saving {len(records)} defects")
+
+    scan = db.session.get(Scan, params["scan_id"])
+    if scan is None:
+        raise LookupError(f"Scan {params['scan_id']} no longer exists")
+    inserted = 0
+    image_rows: List[dict] = []
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        rows = [
+            {
+                "scan_id": scan.id,
+                "snapshot_id": str(rec["defect_id"]),
+                "x": rec["x"],
+                "y": rec["y"],
+                "z": rec["z"],
+                "element": rec.get("element"),
+                "defect_type": rec.get("defect_type", "Unknown"),
+                "severity": rec.get("severity", "Medium"),
+                "description": rec.get("description", ""),
+                "status": "Reported",
+            }
+            for rec in records[start:start + INSERT_BATCH_SIZE]
+        ]
+        result = db.session.execute(
+            insert(Defect).returning(Defect.id, Defect.snapshot_id, sort_by_parameter_order=True), rows
+        )
+        for defect_id, snapshot_id in result:
+            image_path = image_paths.get(snapshot_id)
+            if image_path:
+                image_rows.append({"defect_id": defect_id, "image_path": image_path, "source": "report"})
+        inserted += len(rows)
+
+    if image_rows:
+        db.session.execute(insert(DefectImage), image_rows)
+    db.session.commit()
+    return {"scan_id": scan.id, "inserted": inserted, "images": len(image_rows)}
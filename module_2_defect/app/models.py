@@ -12,8 +12,11 @@ class Scan(db.Model):
 
 class Defect(db.Model):
     __tablename__ = 'defects'
+    # Snapshot names repeat across scans; report images are relinked per scan
+    __table_args__ = (db.Index('ix_defects_scan_snapshot', 'scan_id', 'snapshot_id'),)
     id = db.Column(db.Integer, primary_key=True)
     scan_id = db.Column(db.Integer, db.ForeignKey('scans.id'), nullable=False)
+    snapshot_id = db.Column(db.String(255))  # GLB snapshot the defect was saved from
     x = db.Column(db.Float, nullable=False)
     y = db.Column(db.Float, nullable=False)
     z = db.Column(db.Float, nullable=False)
@@ -34,6 +37,7 @@ class DefectImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     defect_id = db.Column(db.Integer, db.ForeignKey('defects.id'), nullable=False)
     image_path = db.Column(db.String(500), nullable=False)
+    source = db.Column(db.String(20))  # 'report' for images linked from the uploaded PDF
     created_at = db.Column(db.DateTime, default=db.func.now())
 
 # Assignment model removed
@@ -50,4 +54,81 @@ class ActivityLog(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     scan = db.relationship('Scan', backref='activities')
-    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+
+class Job(db.Model):
+    """Background processing job (see app/jobs)."""
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, succeeded, failed
+    progress = db.Column(db.Float, default=0.0)  # 0..1
+    message = db.Column(db.String(255))
+    params = db.Column(db.JSON)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress or 0.0, 3),
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class Upload(db.Model):
+    """One scan upload: its files, processing results and image assignments.
+
+    Read through ``app.upload_data.metadata_store``; ``revision`` is bumped on
+    every write so cached copies can be checked with a single-row query.
+    """
+    __tablename__ = 'uploads'
+    id = db.Column(db.String(64), primary_key=True)  # upload_<timestamp>
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    revision = db.Column(db.Integer, nullable=False, default=1)
+    unit_no = db.Column(db.String(100))
+    notes = db.Column(db.Text)
+    glb_path = db.Column(db.String(500))
+    pdf_path = db.Column(db.String(500))
+    image_dir = db.Column(db.String(500))
+    job_id = db.Column(db.Integer)  # processing Job
+    manifest = db.Column(db.JSON)
+    images = db.Column(db.JSON)  # extracted PDF images (see upload_data/pdf_utils.py)
+    extra = db.Column(db.JSON)  # any other fields, e.g. project_name/address of imported uploads
+
+    assignments = db.relationship('UploadImageAssignment', backref='upload', lazy=True, cascade="all, delete-orphan")
+
+    def to_dict(self):
+        data = dict(self.extra or {})
+        data.update({
+            'id': self.id,
+            'created_at': self.created_at.strftime('%Y%m%d%H%M%S') if self.created_at else None,
+            'unit_no': self.unit_no,
+            'notes': self.notes,
+            'glb_path': self.glb_path,
+            'pdf_path': self.pdf_path,
+            'image_dir': self.image_dir,
+            'job_id': self.job_id,
+            'manifest': self.manifest,
+            'images': self.images or [],
+            'assignments': {'defect_to_image': {a.defect_key: a.image_id for a in self.assignments}},
+        })
+        return data
+
+
+class UploadImageAssignment(db.Model):
+    """Extracted image linked to a defect (snapshot name) of an upload."""
+    __tablename__ = 'upload_image_assignments'
+    upload_id = db.Column(db.String(64), db.ForeignKey('uploads.id'), primary_key=True)
+    defect_key = db.Column(db.String(255), primary_key=True)
+    image_id = db.Column(db.String(64), nullable=False)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Level-of-detail variants for uploaded GLB models.
+
+Each triangle primitive is simplified by vertex clustering: vertices are
+snapped to a uniform grid, every occupied cell keeps the original vertex
+nearest its centroid, and triangles that collapse are dropped. The grid
+resolution is binary-searched per primitive to meet the triangle budget.
+Node hierarchy, materials, textures and snapshot nodes are copied as-is, so
+variants stay compatible with snapshot extraction and marker placement.
+
+Variants are written next to the original as ``<name>.lod<N>.glb``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import math
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .glb_snapshot import (
+        CHUNK_TYPE_BIN,
+        CHUNK_TYPE_JSON,
+        GLB_CHUNK_HEADER,
+        GLB_HEADER,
+        GLB_MAGIC,
+        open_glb,
+        read_accessor,
+    )
+except ImportError:  # executed directly as a CLI script
+    from glb_snapshot import (
+        CHUNK_TYPE_BIN,
+        CHUNK_TYPE_JSON,
+        GLB_CHUNK_HEADER,
+        GLB_HEADER,
+        GLB_MAGIC,
+        open_glb,
+        read_accessor,
+    )
+
+# Triangle budgets for LOD 1, 2, ...; LOD 0 is always the uploaded file.
+LOD_RATIOS = (0.25, 0.05)
+# Primitives this small are copied unchanged (and are the floor for budgets).
+MIN_TRIANGLES = 64
+MAX_GRID = 2048
+
+UNSUPPORTED_EXTENSIONS = {"KHR_draco_mesh_compression", "EXT_meshopt_compression", "KHR_meshopt_compression"}
+
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+TRIANGLES = 4
+
+
+def lod_path(glb_file: Path | str, level: int) -> Path:
+    """``model.glb`` -> ``model.lod<level>.glb`` (level 0 is the original)."""
+    path = Path(glb_file)
+    if level <= 0:
+        return path
+    return path.with_name(f"{path.stem}.lod{level}{path.suffix}")
+
+
+def available_lods(glb_file: Path | str) -> List[int]:
+    """Levels present on disk for *glb_file*, finest first."""
+    levels = [0]
+    level = 1
+    while lod_path(glb_file, level).exists():
+        levels.append(level)
+        level += 1
+    return levels
+
+
+def resolve_lod(glb_file: Path | str, level: int) -> Path:
+    """Path of the requested level, or the coarsest one that exists below it."""
+    levels = available_lods(glb_file)
+    return lod_path(glb_file, max(lvl for lvl in levels if lvl <= max(level, 0)))
+
+
+def remove_lods(glb_file: Path | str) -> None:
+    for level in available_lods(glb_file)[1:]:
+        try:
+            os.remove(lod_path(glb_file, level))
+        except OSError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Vertex clustering
+# ---------------------------------------------------------------------------
+
+
+def _cluster(positions: np.ndarray, triangles: np.ndarray, lo: np.ndarray, extent: np.ndarray,
+             grid: int) -> Tuple[np.ndarray, np.ndarray]:
+    cell = float(extent.max()) / grid
+    dims = np.maximum(np.ceil(extent / cell).astype(np.int64), 1)
+    keys = np.minimum(((positions - lo) / cell).astype(np.int64), dims - 1)
+    flat = (keys[:, 0] * dims[1] + keys[:, 1]) * dims[2] + keys[:, 2]
+    _, inverse = np.unique(flat, return_inverse=True)
+    remapped = inverse.reshape(-1)[triangles]
+    keep = (
+        (remapped[:, 0] != remapped[:, 1])
+        & (remapped[:, 1] != remapped[:, 2])
+        & (remapped[:, 0] != remapped[:, 2])
+    )
+    return inverse.reshape(-1), remapped[keep]
+
+
+def decimate_triangles(positions: np.ndarray, triangles: np.ndarray,
+                       target: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Cluster *positions* until at most *target* triangles remain.
+
+    Returns ``(vertex_indices, triangles)`` where ``vertex_indices`` selects
+    the kept original vertices (so every attribute can be gathered with it)
+    and ``triangles`` index into that selection. ``None`` when the primitive
+    cannot be reduced.
+    """
+    positions = positions.astype(np.float64)
+    lo = positions.min(axis=0)
+    extent = positions.max(axis=0) - lo
+    if not len(triangles) or extent.max() <= 0:
+        return None
+
+    # Largest grid whose clustering fits the budget.
+    low, high = 1, MAX_GRID
+    best = _cluster(positions, triangles, lo, extent, low)
+    while low < high:
+        mid = (low + high + 1) // 2
+        candidate = _cluster(positions, triangles, lo, extent, mid)
+        if len(candidate[1]) <= target:
+            low, best = mid, candidate
+        else:
+            high = mid - 1
+    inverse, clustered = best
+    if not len(clustered) or len(clustered) >= len(triangles):
+        return None
+
+    # Representative per cluster: the member nearest the cluster centroid.
+    clusters = int(inverse.max()) + 1
+    sizes = np.bincount(inverse, minlength=clusters)
+    centroids = np.stack(
+        [np.bincount(inverse, weights=positions[:, axis], minlength=clusters) for axis in range(3)], axis=1
+    ) / sizes[:, None]
+    distance = ((positions - centroids[inverse]) ** 2).sum(axis=1)
+    order = np.lexsort((distance, inverse))
+    firsts = np.concatenate(([0], np.flatnonzero(np.diff(inverse[order])) + 1))
+    representatives = order[firsts]
+
+    used = np.unique(clustered)
+    remap = np.full(clusters, -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    clustered = remap[clustered]
+
+    # Clustering often folds two faces onto the same three vertices.
+    _, first_seen = np.unique(np.sort(clustered, axis=1), axis=0, return_index=True)
+    clustered = clustered[np.sort(first_seen)]
+    return representatives[used], clustered
+
+
+# ---------------------------------------------------------------------------
+# GLB rebuilding
+# ---------------------------------------------------------------------------
+
+
+class _BinaryWriter:
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.length = 0
+        self.views: List[Dict[str, Any]] = []
+
+    def add_view(self, data: bytes, template: Optional[Dict[str, Any]] = None, target: Optional[int] = None) -> int:
+        padding = (-self.length) % 4
+        if padding:
+            self.chunks.append(b"\x00" * padding)
+            self.length += padding
+        view = {k: v for k, v in (template or {}).items() if k not in ("buffer", "byteOffset", "byteLength")}
+        view.update({"buffer": 0, "byteOffset": self.length, "byteLength": len(data)})
+        if target is not None:
+            view["target"] = target
+        self.chunks.append(data)
+        self.length += len(data)
+        self.views.append(view)
+        return len(self.views) - 1
+
+    def getvalue(self) -> bytes:
+        padding = (-self.length) % 4
+        return b"".join(self.chunks) + b"\x00" * padding
+
+
+def _accessor_refs(document: Dict[str, Any]) -> List[Tuple[Dict[str, Any], Any]]:
+    """(container, key) pairs for every accessor reference in the document."""
+    refs: List[Tuple[Dict[str, Any], Any]] = []
+    for mesh in document.get("meshes") or []:
+        for primitive in mesh.get("primitives") or []:
+            attributes = primitive.get("attributes") or {}
+            refs.extend((attributes, name) for name in attributes)
+            if "indices" in primitive:
+                refs.append((primitive, "indices"))
+            for target in primitive.get("targets") or []:
+                refs.extend((target, name) for name in target)
+    for animation in document.get("animations") or []:
+        for sampler in animation.get("samplers") or []:
+            refs.extend((sampler, key) for key in ("input", "output") if key in sampler)
+    for skin in document.get("skins") or []:
+        if "inverseBindMatrices" in skin:
+            refs.append((skin, "inverseBindMatrices"))
+    for node in document.get("nodes") or []:
+        instancing = (node.get("extensions") or {}).get("EXT_mesh_gpu_instancing") or {}
+        attributes = instancing.get("attributes") or {}
+        refs.extend((attributes, name) for name in attributes)
+    return refs
+
+
+def _check_supported(document: Dict[str, Any]) -> None:
+    used = set(document.get("extensionsUsed") or []) | set(document.get("extensionsRequired") or [])
+    blocked = used & UNSUPPORTED_EXTENSIONS
+    if blocked:
+        raise ValueError(f"Compressed geometry ({', '.join(sorted(blocked))}) cannot be decimated")
+    if any("uri" in buffer for buffer in document.get("buffers") or []):
+        raise ValueError("GLB references external buffers")
+
+
+def _triangles(document: Dict[str, Any], binary: memoryview, primitive: Dict[str, Any],
+               vertex_count: int) -> np.ndarray:
+    if "indices" in primitive:
+        indices = read_accessor(document, binary, primitive["indices"]).reshape(-1).astype(np.int64)
+    else:
+        indices = np.arange(vertex_count, dtype=np.int64)
+    return indices[: len(indices) - len(indices) % 3].reshape(-1, 3)
+
+
+def _decimable(primitive: Dict[str, Any]) -> bool:
+    return (
+        primitive.get("mode", TRIANGLES) == TRIANGLES
+        and "POSITION" in (primitive.get("attributes") or {})
+        and not primitive.get("targets")
+        and not primitive.get("extensions")
+    )
+
+
+def _new_accessor(template: Dict[str, Any], values: np.ndarray, view: int, with_bounds: bool) -> Dict[str, Any]:
+    accessor = {k: v for k, v in template.items() if k not in ("bufferView", "byteOffset", "sparse", "min", "max")}
+    accessor.update({"bufferView": view, "count": len(values)})
+    if with_bounds and len(values):
+        accessor["min"] = values.min(axis=0).tolist()
+        accessor["max"] = values.max(axis=0).tolist()
+    return accessor
+
+
+def decimate_document(document: Dict[str, Any], binary: memoryview, ratio: float,
+                      decoded: Optional[Dict[Tuple[int, int], Any]] = None) -> Tuple[Dict[str, Any], bytes, int]:
+    """Return ``(document, bin_chunk, triangle_count)`` for one LOD level.
+
+    *decoded* caches per-primitive ``(positions, triangles)`` so several
+    levels can be built from a single read of the source geometry.
+    """
+    _check_supported(document)
+    decoded = {} if decoded is None else decoded
+    result = copy.deepcopy(document)
+    accessors: List[Dict[str, Any]] = result.setdefault("accessors", [])
+    original_count = len(accessors)
+    pending: List[Tuple[int, np.ndarray, bool, Optional[int]]] = []  # (accessor slot, values, bounds, target)
+    triangle_total = 0
+
+    for mesh_index, mesh in enumerate(result.get("meshes") or []):
+        for primitive_index, primitive in enumerate(mesh.get("primitives") or []):
+            if not _decimable(primitive):
+                continue
+            key = (mesh_index, primitive_index)
+            if key not in decoded:
+                positions = read_accessor(document, binary, primitive["attributes"]["POSITION"])
+                decoded[key] = (positions, _triangles(document, binary, primitive, len(positions)))
+            positions, triangles = decoded[key]
+            if len(triangles) < MIN_TRIANGLES:
+                triangle_total += len(triangles)
+                continue
+
+            target = max(int(math.ceil(len(triangles) * ratio)), MIN_TRIANGLES)
+            simplified = decimate_triangles(positions, triangles, target)
+            if simplified is None:
+                triangle_total += len(triangles)
+                continue
+            keep, new_triangles = simplified
+            triangle_total += len(new_triangles)
+
+            attributes = primitive["attributes"]
+            for name, accessor_index in list(attributes.items()):
+                values = read_accessor(document, binary, accessor_index)[keep]
+                accessors.append(_new_accessor(document["accessors"][accessor_index], values, -1, True))
+                pending.append((len(accessors) - 1, values, True, ARRAY_BUFFER))
+                attributes[name] = len(accessors) - 1
+
+            index_type = UNSIGNED_SHORT if len(keep) < 0xFFFF else UNSIGNED_INT
+            index_values = new_triangles.reshape(-1, 1).astype(np.uint16 if index_type == UNSIGNED_SHORT else np.uint32)
+            accessors.append({"componentType": index_type, "type": "SCALAR", "count": len(index_values), "bufferView": -1})
+            pending.append((len(accessors) - 1, index_values, False, ELEMENT_ARRAY_BUFFER))
+            primitive["indices"] = len(accessors) - 1
+
+    # Drop accessors nothing refers to any more and renumber the rest.
+    refs = _accessor_refs(result)
+    referenced = sorted({container[key] for container, key in refs})
+    accessor_map = {old: new for new, old in enumerate(referenced)}
+    for container, key in refs:
+        container[key] = accessor_map[container[key]]
+
+    writer = _BinaryWriter()
+    view_map: Dict[int, int] = {}
+    old_views = document.get("bufferViews") or []
+
+    def copy_view(index: int) -> int:
+        if index not in view_map:
+            view = old_views[index]
+            start = view.get("byteOffset", 0)
+            view_map[index] = writer.add_view(bytes(binary[start:start + view["byteLength"]]), template=view)
+        return view_map[index]
+
+    pending_by_slot = {slot: (values, target) for slot, values, _, target in pending}
+    new_accessors = []
+    for old in referenced:
+        accessor = accessors[old]
+        if old in pending_by_slot:
+            values, target = pending_by_slot[old]
+            accessor["bufferView"] = writer.add_view(np.ascontiguousarray(values).astype(values.dtype.newbyteorder("<")).tobytes(), target=target)
+        elif old < original_count:
+            if "bufferView" in accessor:
+                accessor["bufferView"] = copy_view(accessor["bufferView"])
+            sparse = accessor.get("sparse")
+            if sparse:
+                sparse["indices"]["bufferView"] = copy_view(sparse["indices"]["bufferView"])
+                sparse["values"]["bufferView"] = copy_view(sparse["values"]["bufferView"])
+        new_accessors.append(accessor)
+    result["accessors"] = new_accessors
+
+    for image in result.get("images") or []:
+        if "bufferView" in image:
+            image["bufferView"] = copy_view(image["bufferView"])
+
+    binary_chunk = writer.getvalue()
+    result["bufferViews"] = writer.views
+    result["buffers"] = [{"byteLength": len(binary_chunk)}] if binary_chunk else []
+    if not result["bufferViews"]:
+        result.pop("bufferViews")
+    return result, binary_chunk, triangle_total
+
+
+def write_glb(path: Path | str, document: Dict[str, Any], binary: bytes) -> None:
+    payload = json.dumps(document, separators=(",", ":")).encode("utf-8")
+    payload += b" " * ((-len(payload)) % 4)
+    binary += b"\x00" * ((-len(binary)) % 4)
+
+    total = GLB_HEADER.size + GLB_CHUNK_HEADER.size + len(payload)
+    if binary:
+        total += GLB_CHUNK_HEADER.size + len(binary)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(GLB_HEADER.pack(GLB_MAGIC, 2, total))
+        fh.write(GLB_CHUNK_HEADER.pack(len(payload), CHUNK_TYPE_JSON))
+        fh.write(payload)
+        if binary:
+            fh.write(GLB_CHUNK_HEADER.pack(len(binary), CHUNK_TYPE_BIN))
+            fh.write(binary)
+    os.replace(tmp_path, path)
+
+
+def generate_lods(glb_file: Path | str, ratios: Sequence[float] = LOD_RATIOS) -> List[Path]:
+    """Write ``.lod<N>.glb`` variants for *glb_file* and return their paths.
+
+    Stale variants from a previous upload with the same name are removed
+    first. Raises ``ValueError`` for files that cannot be decimated.
+    """
+    remove_lods(glb_file)
+    written: List[Path] = []
+    decoded: Dict[Tuple[int, int], Any] = {}
+    with open_glb(glb_file) as (document, binary):
+        for level, ratio in enumerate(ratios, start=1):
+            lod_document, lod_binary, _ = decimate_document(document, binary, ratio, decoded)
+            target = lod_path(glb_file, level)
+            write_glb(target, lod_document, lod_binary)
+            written.append(target)
+    return written
+
+
+def cli(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate decimated LOD variants for a GLB file.")
+    parser.add_argument("glb", type=Path, help="Path to the GLB file")
+    parser.add_argument("--ratios", type=float, nargs="+", default=list(LOD_RATIOS),
+                        help="Triangle budget per level, as a fraction of the original")
+    args = parser.parse_args(argv)
+
+    for path in generate_lods(args.glb, args.ratios):
+        print(f"{path} ({path.stat().st_size / 1024 / 1024:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(cli())
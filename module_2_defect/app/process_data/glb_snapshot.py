@@ -5,14 +5,30 @@ from __future__ import annotations
 
 import argparse
 import json
+import mmap
+import struct
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-try:
-    from pygltflib import GLTF2  # type: ignore
-except ImportError:  # pragma: no cover - runtime dependency
-    GLTF2 = None
+import numpy as np
+
+GLB_MAGIC = b"glTF"
+GLB_HEADER = struct.Struct("<4sII")
+GLB_CHUNK_HEADER = struct.Struct("<II")
+CHUNK_TYPE_JSON = 0x4E4F534A
+CHUNK_TYPE_BIN = 0x004E4942
+
+COMPONENT_DTYPES = {
+    5120: np.int8,
+    5121: np.uint8,
+    5122: np.int16,
+    5123: np.uint16,
+    5125: np.uint32,
+    5126: np.float32,
+}
+TYPE_COMPONENTS = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT2": 4, "MAT3": 9, "MAT4": 16}
 
 
 @dataclass
@@ -23,7 +39,232 @@ class SnapshotRecord:
     label: str
     coordinates: Tuple[float, float, float]
     source_node: Optional[str]
-    element: Optional[str] = None  # Extracted from mesh/node name
+    element: Optional[str] = None  # Nearest building element, else mesh/node name prefix
+
+
+def _glb_json_span(view: Any, path: Path) -> Tuple[int, int]:
+    if len(view) < GLB_HEADER.size + GLB_CHUNK_HEADER.size:
+        raise ValueError(f"{path} is too small to be a GLB file")
+
+    magic, version, total_length = GLB_HEADER.unpack_from(view, 0)
+    if magic != GLB_MAGIC:
+        raise ValueError(f"{path} is not a GLB file (bad magic {magic!r})")
+    if version != 2:
+        raise ValueError(f"Unsupported GLB version {version} in {path}")
+
+    chunk_length, chunk_type = GLB_CHUNK_HEADER.unpack_from(view, GLB_HEADER.size)
+    if chunk_type != CHUNK_TYPE_JSON:
+        raise ValueError(f"First GLB chunk in {path} is not JSON")
+
+    start = GLB_HEADER.size + GLB_CHUNK_HEADER.size
+    end = start + chunk_length
+    if end > min(total_length, len(view)):
+        raise ValueError(f"Truncated JSON chunk in {path}")
+    return start, end
+
+
+def _glb_bin_span(view: Any, json_end: int) -> Optional[Tuple[int, int]]:
+    if json_end + GLB_CHUNK_HEADER.size > len(view):
+        return None
+    chunk_length, chunk_type = GLB_CHUNK_HEADER.unpack_from(view, json_end)
+    if chunk_type != CHUNK_TYPE_BIN:
+        return None
+    start = json_end + GLB_CHUNK_HEADER.size
+    return start, min(start + chunk_length, len(view))
+
+
+def read_gltf_json(glb_file: Path | str) -> Dict[str, Any]:
+    """Return the glTF JSON document without reading the binary chunk.
+
+    For ``.glb`` files only the 12-byte header and the JSON chunk are touched;
+    the file is memory-mapped so the BIN chunk is never paged in.
+    """
+    path = Path(glb_file)
+    with open(path, "rb") as fh:
+        if path.suffix.lower() == ".gltf":
+            return json.load(fh)
+
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            start, end = _glb_json_span(view, path)
+            return json.loads(view[start:end])
+
+
+@contextmanager
+def open_glb(glb_file: Path | str) -> Iterator[Tuple[Dict[str, Any], memoryview]]:
+    """Yield ``(document, binary)`` for a GLB with the BIN chunk memory-mapped.
+
+    Only the pages backing accessors that are actually read get loaded.
+    Arrays returned by :func:`read_accessor` are copies, so they stay valid
+    after the context exits. ``.gltf`` files yield an empty binary buffer.
+    """
+    path = Path(glb_file)
+    with open(path, "rb") as fh:
+        if path.suffix.lower() == ".gltf":
+            yield json.load(fh), memoryview(b"")
+            return
+
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            start, end = _glb_json_span(view, path)
+            document = json.loads(view[start:end])
+            bin_span = _glb_bin_span(view, end)
+            binary = memoryview(view)[bin_span[0]:bin_span[1]] if bin_span else memoryview(b"")
+            try:
+                yield document, binary
+            finally:
+                binary.release()
+
+
+def _buffer_view_array(document: Dict[str, Any], binary: memoryview, view_index: int, byte_offset: int,
+                       count: int, dtype: np.dtype, components: int) -> np.ndarray:
+    buffer_view = document["bufferViews"][view_index]
+    if buffer_view.get("buffer", 0) != 0:
+        raise ValueError("Only the embedded GLB buffer is supported")
+
+    element_size = dtype.itemsize * components
+    stride = buffer_view.get("byteStride") or element_size
+    start = buffer_view.get("byteOffset", 0) + byte_offset
+    if count == 0:
+        return np.zeros((0, components), dtype=dtype)
+
+    raw = np.frombuffer(binary, dtype=np.uint8, count=stride * (count - 1) + element_size, offset=start)
+    if stride != element_size:
+        raw = np.lib.stride_tricks.as_strided(raw, shape=(count, element_size), strides=(stride, 1))
+    return np.ascontiguousarray(raw).view(dtype).reshape(count, components).copy()
+
+
+def read_accessor(document: Dict[str, Any], binary: memoryview, accessor_index: int) -> np.ndarray:
+    """Decode one accessor into a ``(count, components)`` array (sparse-aware)."""
+    accessor = document["accessors"][accessor_index]
+    dtype = np.dtype(COMPONENT_DTYPES[accessor["componentType"]]).newbyteorder("<")
+    components = TYPE_COMPONENTS[accessor["type"]]
+    count = accessor["count"]
+
+    if "bufferView" in accessor:
+        values = _buffer_view_array(
+            document, binary, accessor["bufferView"], accessor.get("byteOffset", 0), count, dtype, components
+        )
+    else:
+        values = np.zeros((count, components), dtype=dtype)
+
+    sparse = accessor.get("sparse")
+    if sparse:
+        index_info = sparse["indices"]
+        index_dtype = np.dtype(COMPONENT_DTYPES[index_info["componentType"]]).newbyteorder("<")
+        indices = _buffer_view_array(
+            document, binary, index_info["bufferView"], index_info.get("byteOffset", 0), sparse["count"], index_dtype, 1
+        )[:, 0]
+        value_info = sparse["values"]
+        values[indices] = _buffer_view_array(
+            document, binary, value_info["bufferView"], value_info.get("byteOffset", 0), sparse["count"], dtype, components
+        )
+    return values
+
+
+def _node_field(node: Any, key: str) -> Any:
+    if isinstance(node, dict):
+        return node.get(key)
+    return getattr(node, key, None)
+
+
+def _quaternions_to_matrices(quats: np.ndarray) -> np.ndarray:
+    """Convert an (N, 4) array of glTF ``[x, y, z, w]`` quaternions to (N, 3, 3)."""
+    norms = np.linalg.norm(quats, axis=1, keepdims=True)
+    quats = np.divide(quats, norms, out=np.tile([0.0, 0.0, 0.0, 1.0], (len(quats), 1)), where=norms > 0)
+    x, y, z, w = quats.T
+
+    rot = np.empty((len(quats), 3, 3))
+    rot[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    rot[:, 0, 1] = 2 * (x * y - z * w)
+    rot[:, 0, 2] = 2 * (x * z + y * w)
+    rot[:, 1, 0] = 2 * (x * y + z * w)
+    rot[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    rot[:, 1, 2] = 2 * (y * z - x * w)
+    rot[:, 2, 0] = 2 * (x * z - y * w)
+    rot[:, 2, 1] = 2 * (y * z + x * w)
+    rot[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return rot
+
+
+def local_node_matrices(nodes: Sequence[Any]) -> np.ndarray:
+    """Return the (N, 4, 4) local transform of every node.
+
+    Nodes with an explicit ``matrix`` use it (glTF stores it column-major);
+    all others are composed as ``T * R * S`` in one batched operation.
+    """
+    count = len(nodes)
+    translations = np.zeros((count, 3))
+    rotations = np.tile([0.0, 0.0, 0.0, 1.0], (count, 1))
+    scales = np.ones((count, 3))
+    explicit: List[int] = []
+    explicit_values: List[Sequence[float]] = []
+
+    for idx, node in enumerate(nodes):
+        matrix = _node_field(node, "matrix")
+        if matrix is not None and len(matrix) == 16:
+            explicit.append(idx)
+            explicit_values.append(matrix)
+            continue
+        translation = _node_field(node, "translation")
+        if translation is not None and len(translation) == 3:
+            translations[idx] = translation
+        rotation = _node_field(node, "rotation")
+        if rotation is not None and len(rotation) == 4:
+            rotations[idx] = rotation
+        scale = _node_field(node, "scale")
+        if scale is not None and len(scale) == 3:
+            scales[idx] = scale
+
+    local = np.zeros((count, 4, 4))
+    local[:, :3, :3] = _quaternions_to_matrices(rotations) * scales[:, None, :]
+    local[:, :3, 3] = translations
+    local[:, 3, 3] = 1.0
+    if explicit:
+        local[explicit] = np.asarray(explicit_values, dtype=float).reshape(-1, 4, 4).transpose(0, 2, 1)
+    return local
+
+
+def node_parent_indices(nodes: Sequence[Any]) -> np.ndarray:
+    """Return each node's parent index, or -1 for scene roots."""
+    parents = np.full(len(nodes), -1, dtype=np.int64)
+    for idx, node in enumerate(nodes):
+        children = _node_field(node, "children") or []
+        for child in children:
+            if 0 <= child < len(nodes):
+                parents[child] = idx
+    return parents
+
+
+def world_node_matrices(nodes: Sequence[Any]) -> np.ndarray:
+    """Return the (N, 4, 4) world transform of every node.
+
+    Depths are found by vectorised pointer chasing up the parent array and
+    transforms are then propagated one depth level at a time, so the Python
+    loop runs once per level of the hierarchy rather than once per node.
+    """
+    local = local_node_matrices(nodes)
+    parents = node_parent_indices(nodes)
+    count = len(nodes)
+
+    depth = np.zeros(count, dtype=np.int64)
+    ancestor = parents.copy()
+    for _ in range(count + 1):
+        has_parent = ancestor >= 0
+        if not has_parent.any():
+            break
+        depth[has_parent] += 1
+        ancestor[has_parent] = parents[ancestor[has_parent]]
+    else:
+        raise ValueError("Node hierarchy contains a cycle")
+
+    world = local.copy()
+    order = np.argsort(depth, kind="stable")
+    sorted_depth = depth[order]
+    max_depth = int(sorted_depth[-1]) if count else 0
+    for level in range(1, max_depth + 1):
+        start, end = np.searchsorted(sorted_depth, [level, level + 1])
+        level_nodes = order[start:end]
+        world[level_nodes] = np.matmul(world[parents[level_nodes]], local[level_nodes])
+    return world
 
 
 def _as_dict(obj: Any) -> Optional[Dict[str, Any]]:
@@ -95,15 +336,20 @@ def _coerce_coordinates(snapshot: Dict[str, Any], translation: Optional[Sequence
     return None
 
 
-def extract_snapshots_from_nodes(nodes: Iterable[Any]) -> List[SnapshotRecord]:
+def extract_snapshots_from_nodes(nodes: Iterable[Any], world_matrices: Optional[np.ndarray] = None) -> List[SnapshotRecord]:
+    nodes = list(nodes)
+    if world_matrices is None:
+        world_matrices = world_node_matrices(nodes)
+    world_positions = world_matrices[:, :3, 3]
+
     snapshots: List[SnapshotRecord] = []
     for idx, node in enumerate(nodes):
-        node_name = getattr(node, "name", None)
-        snapshot = _snapshot_from_extras(getattr(node, "extras", None)) or _snapshot_from_name(node_name)
+        node_name = _node_field(node, "name")
+        snapshot = _snapshot_from_extras(_node_field(node, "extras")) or _snapshot_from_name(node_name)
         if not snapshot:
             continue
 
-        coords = _coerce_coordinates(snapshot, getattr(node, "translation", None))
+        coords = _coerce_coordinates(snapshot, world_positions[idx].tolist())
         if coords is None:
             continue
 
@@ -136,13 +382,30 @@ def extract_snapshots_from_nodes(nodes: Iterable[Any]) -> List[SnapshotRecord]:
     return snapshots
 
 
-def extract_snapshots(glb_file: Path | str) -> List[SnapshotRecord]:
-    if GLTF2 is None:
-        raise RuntimeError("pygltflib is not installed; run `pip install pygltflib`." )
-
-    gltf = GLTF2().load(str(glb_file))
-    nodes = gltf.nodes or []
-    return extract_snapshots_from_nodes(nodes)
+def extract_snapshots(glb_file: Path | str, attribute_elements: bool = True) -> List[SnapshotRecord]:
+    """Extract Snapshot records, attributing each to the nearest mesh element.
+
+    Element attribution uses a BVH over mesh bounds (see ``element_bvh``);
+    the node-name prefix is kept as a fallback when the file has no meshes.
+    """
+    document = read_gltf_json(glb_file)
+    nodes = document.get("nodes") or []
+    world_matrices = world_node_matrices(nodes)
+    records = extract_snapshots_from_nodes(nodes, world_matrices)
+    if not attribute_elements or not records:
+        return records
+
+    try:
+        from .element_bvh import ElementIndex
+    except ImportError:  # executed directly as a CLI script
+        from element_bvh import ElementIndex
+
+    index = ElementIndex.from_gltf(document, glb_file, world_matrices)
+    if len(index):
+        elements = index.nearest_elements([record.coordinates for record in records])
+        for record, element in zip(records, elements):
+            record.element = element or record.element
+    return records
 
 
 def cli(argv: Optional[Sequence[str]] = None) -> int:
@@ -0,0 +1,251 @@
+"""Matching of extracted report images to defects.
+
+Two rules apply, in priority order. An image whose file name contains a
+defect id goes to that defect. Otherwise it goes to a defect that shares a
+word with the file name. Defect ids are found in file names with one
+Aho-Corasick pass per name, and shared words are looked up in a
+word -> defects inverted index. Neither is a scan over every
+(image, defect) pair.
+
+``greedy`` mode hands each image, in order, to the first free defect that
+matches it; this is the long-standing behaviour. ``optimal`` mode instead
+maximises the total score over all matches. The score of a pair is
+``ID_MATCH_SCORE`` for an id match plus the number of shared words, and
+the assignment is solved with the Hungarian algorithm. In both modes,
+leftover images are paired with leftover defects in order. Results depend
+only on the order of the inputs.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+ASSIGNMENT_MODES = ("greedy", "optimal")
+
+# An id in the file name outweighs any number of shared words
+ID_MATCH_SCORE = 1000
+
+
+def tokenize(value: Optional[str]) -> Set[str]:
+    if not value:
+        return set()
+    return set(re.findall(r"[a-z0-9]+", value.lower()))
+
+
+class IdMatcher:
+    """Aho-Corasick automaton reporting which patterns occur in a text."""
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        # Nearest state along the fail chain that ends a pattern
+        self._out_link: List[int] = [0]
+
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._out_link.append(0)
+                state = nxt
+            self._out[state].append(value)
+        self._link()
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out_link[nxt] = self._fail[nxt] if self._out[self._fail[nxt]] else self._out_link[self._fail[nxt]]
+                queue.append(nxt)
+
+    def find(self, text: str) -> Set[int]:
+        """Values of every pattern occurring in *text*."""
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            hit = state if self._out[state] else self._out_link[state]
+            while hit:
+                found.update(self._out[hit])
+                hit = self._out_link[hit]
+        return found
+
+
+def _first_free(postings: List[int], cursor: int, taken: List[bool]) -> int:
+    while cursor < len(postings) and taken[postings[cursor]]:
+        cursor += 1
+    return cursor
+
+
+def _greedy(id_hits: List[Set[int]], image_tokens: List[Set[str]], index: Dict[str, List[int]],
+            image_ids: List[str], keys: List[str], taken: List[bool], used_images: Set[str],
+            assignments: Dict[str, str]) -> None:
+    def _assign(rank: int, image_id: str) -> None:
+        assignments[keys[rank]] = image_id
+        taken[rank] = True
+        used_images.add(image_id)
+
+    for image_id, hits in zip(image_ids, id_hits):
+        if not image_id or image_id in used_images:
+            continue
+        free = [rank for rank in hits if not taken[rank]]
+        if free:
+            _assign(min(free), image_id)
+
+    # Cursors only move forward: a defect that is taken stays taken
+    cursors = dict.fromkeys(index, 0)
+    for image_id, tokens in zip(image_ids, image_tokens):
+        if not image_id or image_id in used_images:
+            continue
+        best = None
+        for token in tokens:
+            postings = index.get(token)
+            if postings is None:
+                continue
+            cursor = cursors[token] = _first_free(postings, cursors[token], taken)
+            if cursor < len(postings) and (best is None or postings[cursor] < best):
+                best = postings[cursor]
+        if best is not None:
+            _assign(best, image_id)
+
+
+def _hungarian(cost: np.ndarray) -> np.ndarray:
+    """Column for each row minimising total cost; needs rows <= columns."""
+    rows, cols = cost.shape
+    u = np.zeros(rows + 1)
+    v = np.zeros(cols + 1)
+    owner = np.zeros(cols + 1, dtype=int)  # row (1-based) matched to each column
+    way = np.zeros(cols + 1, dtype=int)
+    for row in range(1, rows + 1):
+        owner[0] = row
+        col = 0
+        min_slack = np.full(cols + 1, np.inf)
+        used = np.zeros(cols + 1, dtype=bool)
+        while True:
+            used[col] = True
+            current = owner[col]
+            free = ~used[1:]
+            slack = cost[current - 1] - u[current] - v[1:]
+            better = free & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = col
+            candidates = np.where(free, min_slack[1:], np.inf)
+            next_col = int(np.argmin(candidates)) + 1
+            delta = candidates[next_col - 1]
+            visited = np.nonzero(used)[0]
+            u[owner[visited]] += delta
+            v[visited] -= delta
+            min_slack[1:][free] -= delta
+            col = next_col
+            if owner[col] == 0:
+                break
+        while col:
+            previous = way[col]
+            owner[col] = owner[previous]
+            col = previous
+
+    result = np.full(rows, -1, dtype=int)
+    matched = np.nonzero(owner[1:])[0]
+    result[owner[matched + 1] - 1] = matched
+    return result
+
+
+def _optimal(id_hits: List[Set[int]], image_tokens: List[Set[str]], index: Dict[str, List[int]],
+             image_ids: List[str], keys: List[str], taken: List[bool], used_images: Set[str],
+             assignments: Dict[str, str]) -> None:
+    scores: Dict[Tuple[int, int], int] = {}
+    seen_images: Set[str] = set()
+    for column, (image_id, hits, tokens) in enumerate(zip(image_ids, id_hits, image_tokens)):
+        if not image_id or image_id in seen_images:
+            continue
+        seen_images.add(image_id)
+        for rank in hits:
+            scores[rank, column] = scores.get((rank, column), 0) + ID_MATCH_SCORE
+        for token in tokens:
+            for rank in index.get(token, ()):
+                scores[rank, column] = scores.get((rank, column), 0) + 1
+    if not scores:
+        return
+
+    # Only defects and images with at least one candidate take part
+    row_ranks = sorted({rank for rank, _ in scores})
+    col_images = sorted({column for _, column in scores})
+    row_of = {rank: i for i, rank in enumerate(row_ranks)}
+    col_of = {column: j for j, column in enumerate(col_images)}
+    matrix = np.zeros((len(row_ranks), len(col_images)))
+    for (rank, column), score in scores.items():
+        matrix[row_of[rank], col_of[column]] = -score
+
+    transposed = matrix.shape[0] > matrix.shape[1]
+    solution = _hungarian(matrix.T if transposed else matrix)
+    pairs = [(j, i) if transposed else (i, j) for i, j in enumerate(solution) if j >= 0]
+    for i, j in sorted(pairs):
+        if matrix[i, j] < 0:
+            rank, image_id = row_ranks[i], image_ids[col_images[j]]
+            assignments[keys[rank]] = image_id
+            taken[rank] = True
+            used_images.add(image_id)
+
+
+def assign_images(defects: Sequence[Tuple[str, Set[str]]], images: Sequence[dict],
+                  mode: str = "greedy") -> Dict[str, str]:
+    """Map defect id -> image id.
+
+    *defects* are ``(defect id, words)`` pairs in display order and *images*
+    are extractor entries with ``id`` and ``file``.
+    """
+    if mode not in ASSIGNMENT_MODES:
+        raise ValueError(f"Unknown image assignment mode: {mode}")
+
+    # One slot per distinct id, ranked by first appearance
+    words_by_key: Dict[str, Set[str]] = {}
+    for defect_id, words in defects:
+        if defect_id:
+            words_by_key[defect_id] = words
+    keys = list(words_by_key)
+    taken = [False] * len(keys)
+
+    index: Dict[str, List[int]] = {}
+    for rank, key in enumerate(keys):
+        for word in words_by_key[key]:
+            index.setdefault(word, []).append(rank)
+    for postings in index.values():
+        postings.sort()
+
+    matcher = IdMatcher((key.lower(), rank) for rank, key in enumerate(keys))
+    image_ids = [str(image.get("id", "")) for image in images]
+    id_hits = [matcher.find((image.get("file") or "").lower()) for image in images]
+    image_tokens = [tokenize(image.get("file")) for image in images]
+
+    assignments: Dict[str, str] = {}
+    used_images: Set[str] = set()
+    solve = _optimal if mode == "optimal" else _greedy
+    solve(id_hits, image_tokens, index, image_ids, keys, taken, used_images, assignments)
+
+    remaining_images = [image_id for image_id in image_ids if image_id not in used_images]
+    remaining_defects = [defect_id for defect_id, _ in defects if defect_id not in assignments]
+    for image_id, defect_id in zip(remaining_images, remaining_defects):
+        if image_id and defect_id:
+            assignments[defect_id] = image_id
+            used_images.add(image_id)
+    return assignments
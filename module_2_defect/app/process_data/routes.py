@@ -3,7 +3,7 @@ import json
 import os
 import re
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from flask import (
     Blueprint,
@@ -18,19 +18,34 @@ from flask import (
     url_for,
 )
 
-from .glb_snapshot import SnapshotRecord, extract_snapshots
+from sqlalchemy import insert
 
-try:
-    from pygltflib import GLTF2
-except ImportError:  # pragma: no cover
-    GLTF2 = None
+from .glb_snapshot import SnapshotRecord
+from .image_matching import assign_images, tokenize
+from .snapshot_cache import get_snapshot_cache
 
 from app.extensions import db
-from app.models import Scan, Defect
+from app.jobs.runner import enqueue
+from app.models import Scan, Defect, DefectImage, Job
+from app.upload_data.metadata_store import (
+    add_upload_scan,
+    assign_image,
+    latest_upload_key,
+    load_upload,
+    set_initial_assignments,
+    unassign_image,
+)
 
 
 process_data_bp = Blueprint("process_data", __name__)
 
+# (search key, path) of the newest GLB; the key is the mtimes of the search
+# directories plus the newest upload, since a re-upload may reuse a file name.
+_latest_glb_lookup: Dict[str, Tuple[tuple, Optional[str]]] = {}
+
+# Decimated variants written next to uploads by the processing job
+_LOD_VARIANT = re.compile(r"\.lod\d+\.glb$", re.IGNORECASE)
+
 
 @dataclass
 class DefectRecord:
@@ -53,21 +68,43 @@ def _upload_root() -> str:
     return os.path.join(current_app.instance_path, "uploads", "upload_data")
 
 
-def _metadata_path() -> str:
-    return os.path.join(_upload_root(), "latest_upload.json")
-
-
 def _glb_search_directories() -> List[str]:
     return [_processed_root(), _upload_root()]
 
 
+def _glb_search_key() -> tuple:
+    key = []
+    for path in _glb_search_directories():
+        try:
+            key.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            key.append(None)
+    latest = latest_upload_key()
+    key.append(latest[0] if latest else None)
+    return tuple(key)
+
+
 def _load_glb_defect_file() -> Optional[str]:
+    search_key = _glb_search_key()
+    cached = _latest_glb_lookup.get(current_app.instance_path)
+    if cached and cached[0] == search_key:
+        return cached[1]
+
+    latest = _find_latest_glb_file()
+    _latest_glb_lookup[current_app.instance_path] = (search_key, latest)
+    return latest
+
+
+def _find_latest_glb_file() -> Optional[str]:
     candidates: List[str] = []
     for directory in _glb_search_directories():
         if not os.path.isdir(directory):
             continue
         for pattern in ("*.glb", "*.gltf"):
-            candidates.extend(glob.glob(os.path.join(directory, pattern)))
+            candidates.extend(
+                path for path in glob.glob(os.path.join(directory, pattern))
+                if not _LOD_VARIANT.search(path)
+            )
 
     if not candidates:
         return None
@@ -132,10 +169,7 @@ def _prepare_for_postgres(defects: List[DefectRecord]) -> List[dict]:
 
 
 def _parse_defects_from_glb(defect_filepath: str) -> List[DefectRecord]:
-    if GLTF2 is None:
-        raise RuntimeError("pygltflib is not installed; cannot parse GLB defects")
-
-    snapshots: List[SnapshotRecord] = extract_snapshots(defect_filepath)
+    snapshots: List[SnapshotRecord] = get_snapshot_cache(current_app).get(defect_filepath)
     defects: List[DefectRecord] = []
     for snapshot in snapshots:
         defects.append(
@@ -154,8 +188,19 @@ def _parse_defects_from_glb(defect_filepath: str) -> List[DefectRecord]:
     return defects
 
 
-def _load_defects() -> Tuple[List[DefectRecord], Optional[str], str]:
-    glb_file = _load_glb_defect_file()
+def _defect_glb_file(metadata: Optional[dict]) -> Optional[str]:
+    """GLB of the selected upload; the newest GLB on disk only when there is no upload."""
+    if metadata and metadata.get("glb_path"):
+        glb_path = metadata["glb_path"]
+        if os.path.exists(glb_path):
+            return glb_path
+        current_app.logger.warning("GLB of upload %s is missing: %s", metadata.get("id"), glb_path)
+        return None
+    return _load_glb_defect_file()
+
+
+def _load_defects(metadata: Optional[dict]) -> Tuple[List[DefectRecord], Optional[str], str]:
+    glb_file = _defect_glb_file(metadata)
     if glb_file:
         try:
             defects = _parse_defects_from_glb(glb_file)
@@ -176,23 +221,9 @@ def _load_defects() -> Tuple[List[DefectRecord], Optional[str], str]:
     return [], None, "none"
 
 
-def _load_latest_metadata() -> Optional[dict]:
-    metadata_file = _metadata_path()
-    if not os.path.exists(metadata_file):
-        return None
-    try:
-        with open(metadata_file, "r", encoding="utf-8") as fh:
-            return json.load(fh)
-    except (OSError, json.JSONDecodeError) as exc:
-        current_app.logger.error("Unable to load upload metadata: %s", exc)
-        return None
-
-
-def _save_latest_metadata(metadata: dict) -> None:
-    metadata_file = _metadata_path()
-    os.makedirs(os.path.dirname(metadata_file), exist_ok=True)
-    with open(metadata_file, "w", encoding="utf-8") as fh:
-        json.dump(metadata, fh, indent=2)
+def _load_upload_metadata() -> Optional[dict]:
+    """Metadata of the ``upload_id`` the request names, else of the newest upload."""
+    return load_upload(request.values.get("upload_id") or None)
 
 
 def _defect_assignments_map(metadata: Optional[dict]) -> Dict[str, str]:
@@ -203,13 +234,18 @@ def _defect_assignments_map(metadata: Optional[dict]) -> Dict[str, str]:
     return {str(defect_id): str(image_id) for defect_id, image_id in mapping.items() if image_id}
 
 
+def _distinct_images(metadata: dict) -> List[dict]:
+    """Extracted images minus repeats (``duplicate_of`` set by the PDF extractor)."""
+    return [image for image in metadata.get("images", []) if not image.get("duplicate_of")]
+
+
 def _image_entries(metadata: Optional[dict]) -> List[dict]:
     if not metadata:
         return []
     defect_map = _defect_assignments_map(metadata)
     image_to_defect = {image_id: defect_id for defect_id, image_id in defect_map.items()}
     entries: List[dict] = []
-    for image in metadata.get("images", []):
+    for image in _distinct_images(metadata):
         image_id = str(image.get("id"))
         entries.append(
             {
@@ -236,12 +272,6 @@ def _resolve_image(metadata: dict, image_id: str) -> Optional[Tuple[str, str]]:
     return None
 
 
-def _tokenize_text(value: Optional[str]) -> Set[str]:
-    if not value:
-        return set()
-    return set(re.findall(r"[a-z0-9]+", value.lower()))
-
-
 def _auto_assign_images(metadata: dict, defects: List[DefectRecord]) -> bool:
     if not metadata or not defects:
         return False
@@ -250,65 +280,28 @@ def _auto_assign_images(metadata: dict, defects: List[DefectRecord]) -> bool:
     if assignments:
         return False
 
-    images = metadata.get("images", [])
+    images = _distinct_images(metadata)
     if not images:
         return False
 
-    assigned = False
-    used_images: Set[str] = set()
-
-    def _assign(defect_id: str, image_id: str) -> None:
-        nonlocal assigned
-        assignments[defect_id] = image_id
-        used_images.add(image_id)
-        assigned = True
-
-    defect_tokens: Dict[str, Set[str]] = {}
-    for defect in defects:
-        key = str(defect.id)
-        defect_tokens[key] = (
-            _tokenize_text(defect.id)
-            | _tokenize_text(defect.description)
-            | _tokenize_text(defect.element)
-        )
-
-    for image in images:
-        image_id = str(image.get("id", ""))
-        if not image_id or image_id in used_images:
-            continue
-        filename = (image.get("file") or "").lower()
-        for defect in defects:
-            defect_id = str(defect.id)
-            if not defect_id or defect_id in assignments:
-                continue
-            if defect_id.lower() in filename:
-                _assign(defect_id, image_id)
-                break
-
-    for image in images:
-        image_id = str(image.get("id", ""))
-        if not image_id or image_id in used_images:
-            continue
-        image_tokens = _tokenize_text(image.get("file"))
-        if not image_tokens:
-            continue
-        for defect in defects:
-            defect_id = str(defect.id)
-            if not defect_id or defect_id in assignments:
-                continue
-            if defect_tokens.get(defect_id) and image_tokens & defect_tokens[defect_id]:
-                _assign(defect_id, image_id)
-                break
+    defect_words = [
+        (str(defect.id), tokenize(defect.id) | tokenize(defect.description) | tokenize(defect.element))
+        for defect in defects
+    ]
+    mode = current_app.config.get("IMAGE_ASSIGNMENT_MODE", "greedy")
+    assignments.update(assign_images(defect_words, images, mode=mode))
+    return bool(assignments)
 
-    remaining_images = [img for img in images if str(img.get("id", "")) not in used_images]
-    remaining_defects = [defect for defect in defects if str(defect.id) not in assignments]
-    for image, defect in zip(remaining_images, remaining_defects):
-        image_id = str(image.get("id", ""))
-        defect_id = str(defect.id)
-        if image_id and defect_id:
-            _assign(defect_id, image_id)
 
-    return assigned
+def _active_job(metadata: Optional[dict]) -> Optional[Job]:
+    """The processing job of the latest upload, while it is still queued/running."""
+    job_id = (metadata or {}).get("job_id")
+    if not job_id:
+        return None
+    job = db.session.get(Job, job_id)
+    if job is None or job.status not in ("queued", "running"):
+        return None
+    return job
 
 
 def _render_error(message: str):
@@ -325,62 +318,66 @@ def _render_error(message: str):
 @process_data_bp.route("/process-data", methods=["GET", "POST"])
 def process_defect_file():
     if request.method == "POST" and "save_to_db" in request.form:
-        defects, source_path, source_kind = _load_defects()
+        # Defects and image assignments both come from the selected upload
+        metadata = _load_upload_metadata()
+        defects, source_path, source_kind = _load_defects(metadata)
         if not defects:
             flash("No defects to save.", "error")
             return redirect(url_for("process_data.process_defect_file"))
 
-        # Load metadata for image assignments
-        metadata = _load_latest_metadata()
         defect_assignments = _defect_assignments_map(metadata) if metadata else {}
 
-        # Create a new scan
+        # Create the scan now; the defect rows are inserted by a background job
         scan_name = request.form.get("scan_name", f"Scan from {source_kind}")
-        glb_file = _load_glb_defect_file()  # Get the GLB path
+        glb_file = _defect_glb_file(metadata)
         model_path = os.path.basename(glb_file) if glb_file else None
         scan = Scan(name=scan_name, model_path=model_path)
         db.session.add(scan)
         db.session.commit()
+        if metadata:
+            # Later image assignments on this upload relink this scan's defects
+            add_upload_scan(metadata["id"], scan.id)
+
+        # Relative image path (from the upload_data folder) per assigned defect
+        image_paths: Dict[str, str] = {}
+        for defect_id_str, image_id in defect_assignments.items():
+            resolved = _resolve_image(metadata, image_id)
+            if resolved:
+                image_dir, filename = resolved
+                image_paths[defect_id_str] = os.path.join(os.path.basename(image_dir), filename)
+
+        job = enqueue(
+            current_app._get_current_object(),
+            "insert_defects",
+            {"scan_id": scan.id, "records": _prepare_for_postgres(defects), "image_paths": image_paths},
+        )
 
-        # Create defects with image assignments
-        for rec in _prepare_for_postgres(defects):
-            # Get image path for this defect if assigned
-            image_path = None
-            defect_id_str = str(rec["defect_id"])
-            if defect_id_str in defect_assignments and metadata:
-                image_id = defect_assignments[defect_id_str]
-                resolved = _resolve_image(metadata, image_id)
-                if resolved:
-                    image_dir, filename = resolved
-                    # Store relative path from upload_data folder
-                    image_path = os.path.join(os.path.basename(image_dir), filename)
-
-            defect = Defect(
-                scan_id=scan.id,
-                x=rec["x"],
-                y=rec["y"],
-                z=rec["z"],
-                element=rec.get("element"),
-                defect_type=rec.get("defect_type", "Unknown"),
-                severity=rec.get("severity", "Medium"),
-                description=rec.get("description", ""),
-                status="Reported",
-                image_path=image_path,
-            )
-            db.session.add(defect)
-        db.session.commit()
-
-        flash(f"Defects saved to database. Scan ID: {scan.id}", "success")
+        flash(f"Saving {len(defects)} defects in the background (job #{job.id}). Scan ID: {scan.id}", "success")
         return redirect(url_for("defects.visualize_scan", scan_id=scan.id))
 
     # GET logic
-    defects, source_path, source_kind = _load_defects()
-    metadata = _load_latest_metadata()
+    metadata = _load_upload_metadata()
+    processing_job = _active_job(metadata)
+    if processing_job is not None:
+        return render_template(
+            "process_data/process_result.html",
+            error=None,
+            processing_job=processing_job.to_dict(),
+            defects=[],
+            prepared_records=[],
+            image_entries=[],
+            defect_assignments={},
+            upload_metadata=metadata,
+        )
+
+    defects, source_path, source_kind = _load_defects(metadata)
     auto_assigned = False
     if metadata and defects:
         auto_assigned = _auto_assign_images(metadata, defects)
-        if auto_assigned:
-            _save_latest_metadata(metadata)
+        if auto_assigned and not set_initial_assignments(metadata["id"], _defect_assignments_map(metadata)):
+            # A concurrent request stored its assignments first; show those
+            metadata = load_upload(metadata["id"])
+            auto_assigned = False
     image_entries = _image_entries(metadata)
     defect_assignments = _defect_assignments_map(metadata)
 
@@ -390,7 +387,7 @@ def process_defect_file():
         )
 
     for entry in image_entries:
-        entry["url"] = url_for("process_data.serve_extracted_image", image_id=entry["id"])
+        entry["url"] = url_for("process_data.serve_extracted_image", image_id=entry["id"], upload_id=metadata["id"])
 
     prepared_records = _prepare_for_postgres(defects)
     current_app.logger.info(
@@ -427,8 +424,8 @@ def process_defect_file():
 
 @process_data_bp.route("/process-data.json", methods=["GET"])
 def process_defect_file_json():
-    defects, source_path, source_kind = _load_defects()
-    metadata = _load_latest_metadata()
+    metadata = _load_upload_metadata()
+    defects, source_path, source_kind = _load_defects(metadata)
     image_entries = _image_entries(metadata)
     defect_assignments = _defect_assignments_map(metadata)
 
@@ -436,7 +433,7 @@ def process_defect_file_json():
         return jsonify({"ok": False, "error": "No GLB/JSON defect file found.", "records": []}), 404
 
     for entry in image_entries:
-        entry["url"] = url_for("process_data.serve_extracted_image", image_id=entry["id"])
+        entry["url"] = url_for("process_data.serve_extracted_image", image_id=entry["id"], upload_id=metadata["id"])
 
     prepared_records = _prepare_for_postgres(defects)
     return jsonify(
@@ -453,7 +450,7 @@ def process_defect_file_json():
 
 @process_data_bp.route("/process-data/image/<image_id>", methods=["GET"])
 def serve_extracted_image(image_id: str):
-    metadata = _load_latest_metadata()
+    metadata = _load_upload_metadata()
     if not metadata:
         abort(404)
 
@@ -474,7 +471,7 @@ def serve_extracted_image(image_id: str):
 
 @process_data_bp.route("/process-data/assign-image", methods=["POST"])
 def assign_image_to_defect():
-    metadata = _load_latest_metadata()
+    metadata = _load_upload_metadata()
     if not metadata:
         flash("No upload metadata available. Upload a GLB/PDF first.", "error")
         return redirect(url_for("process_data.process_defect_file"))
@@ -487,8 +484,6 @@ def assign_image_to_defect():
         flash("Missing image selection.", "error")
         return redirect(url_for("process_data.process_defect_file"))
 
-    assignments = metadata.setdefault("assignments", {}).setdefault("defect_to_image", {})
-
     resolved = _resolve_image(metadata, image_id)
     if not resolved:
         flash("Selected image is no longer available.", "error")
@@ -499,15 +494,13 @@ def assign_image_to_defect():
     image_dir, image_filename = resolved
     image_dir_name = os.path.basename(image_dir)
     relative_image_path = f"{image_dir_name}/{image_filename}"
+    redirect_url = url_for("process_data.process_defect_file", upload_id=request.form.get("upload_id") or None)
 
     if action == "unassign":
-        removed = False
-        for defect_key, assigned_image in list(assignments.items()):
-            if assigned_image == image_id:
-                assignments.pop(defect_key)
-                removed = True
-                # Also update database - clear image_path for defects with this snapshot name
-                _update_defect_image_in_db(defect_key, None)
+        removed = unassign_image(metadata["id"], image_id)
+        # Also update database - clear image_path for defects with these snapshot names
+        for defect_key in removed:
+            _update_defect_image_in_db(metadata, defect_key, None)
         if removed:
             flash("Image unassigned from defect.", "success")
         else:
@@ -515,28 +508,46 @@ def assign_image_to_defect():
     else:
         if not defect_id:
             flash("Select a defect before assigning an image.", "error")
-            return redirect(url_for("process_data.process_defect_file"))
-
-        for defect_key, assigned_image in list(assignments.items()):
-            if defect_key == defect_id or assigned_image == image_id:
-                assignments.pop(defect_key)
-                # Clear old assignments in database
-                _update_defect_image_in_db(defect_key, None)
-        
-        assignments[defect_id] = image_id
+            return redirect(redirect_url)
+
+        replaced = assign_image(metadata["id"], defect_id, image_id)
+        if replaced is None:
+            flash(f"Defect {defect_id} was being linked by another request. Please try again.", "error")
+            return redirect(redirect_url)
+        # Clear old assignments in database
+        for defect_key in replaced:
+            _update_defect_image_in_db(metadata, defect_key, None)
         # Update database with the image path
-        _update_defect_image_in_db(defect_id, relative_image_path)
+        _update_defect_image_in_db(metadata, defect_id, relative_image_path)
         flash(f"Linked image to defect {defect_id}.", "success")
 
-    _save_latest_metadata(metadata)
-    return redirect(url_for("process_data.process_defect_file"))
+    return redirect(redirect_url)
 
 
-def _update_defect_image_in_db(snapshot_name: str, image_path: Optional[str]):
-    """Update defect image_path in database by matching snapshot name in description."""
-    # Find defects whose description contains this snapshot name
-    defects = Defect.query.filter(Defect.description.contains(snapshot_name)).all()
-    for defect in defects:
-        defect.image_path = image_path
-    if defects:
-        db.session.commit()
+def _update_defect_image_in_db(metadata: dict, snapshot_name: str, image_path: Optional[str]):
+    """Point the report image of the defects saved from *snapshot_name* at *image_path*.
+
+    Only the scans saved from this upload (``metadata['scan_ids']``) are
+    touched, since snapshot names repeat across scans. Defects are found by
+    the ``(scan_id, snapshot_id)`` index; photos added by hand (``source``
+    not ``'report'``) are left alone. ``None`` just removes the link.
+    """
+    scan_ids = metadata.get("scan_ids") or []
+    if not scan_ids:
+        return
+    defect_ids = [
+        row.id for row in db.session.query(Defect.id).filter(
+            Defect.scan_id.in_(scan_ids), Defect.snapshot_id == snapshot_name
+        )
+    ]
+    if not defect_ids:
+        return
+    DefectImage.query.filter(
+        DefectImage.defect_id.in_(defect_ids), DefectImage.source == "report"
+    ).delete(synchronize_session=False)
+    if image_path:
+        db.session.execute(
+            insert(DefectImage),
+            [{"defect_id": defect_id, "image_path": image_path, "source": "report"} for defect_id in defect_ids],
+        )
+    db.session.commit()
@@ -0,0 +1,201 @@
+"""Persistent cache of Snapshot records extracted from uploaded GLB files."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+
+from .glb_snapshot import SnapshotRecord, extract_snapshots
+
+CACHE_FORMAT_VERSION = 2
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _records_to_json(records: List[SnapshotRecord]) -> List[dict]:
+    return [asdict(record) for record in records]
+
+
+def _records_from_json(payload: List[dict]) -> List[SnapshotRecord]:
+    records: List[SnapshotRecord] = []
+    for entry in payload:
+        entry = dict(entry)
+        entry["coordinates"] = tuple(entry["coordinates"])
+        records.append(SnapshotRecord(**entry))
+    return records
+
+
+class SnapshotCache:
+    """Two-level (memory + disk) LRU cache of ``extract_snapshots`` results.
+
+    Entries are keyed on the absolute GLB path and validated against the
+    file's size and ``st_mtime_ns``, so a hit costs a single ``stat()``.
+    With ``verify_hash`` enabled a SHA-256 of the file content is also
+    compared on every hit, for deployments that copy files with preserved
+    timestamps.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 32, verify_hash: bool = False):
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, int(max_entries))
+        self.verify_hash = verify_hash
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry_path(self, path: str) -> str:
+        name = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.json")
+
+    def _is_fresh(self, entry: dict, path: str, stat: os.stat_result) -> bool:
+        if entry.get("version") != CACHE_FORMAT_VERSION:
+            return False
+        if entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+            return False
+        if self.verify_hash and entry.get("sha256") != file_digest(path):
+            return False
+        return True
+
+    def _read_disk(self, path: str) -> Optional[dict]:
+        try:
+            with open(self._entry_path(path), "r", encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return entry if entry.get("path") == path else None
+
+    def _write_disk(self, path: str, entry: dict) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target = self._entry_path(path)
+        # Unique per writer, so threads of one process never share a temp file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(entry, fh)
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._evict_disk()
+
+    def _touch_disk(self, path: str) -> None:
+        try:
+            os.utime(self._entry_path(path))
+        except OSError:
+            pass
+
+    def _evict_disk(self) -> None:
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+        except OSError:
+            return
+        if len(names) <= self.max_entries:
+            return
+
+        entries: List[Tuple[float, str]] = []
+        for name in names:
+            full_path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.path.getmtime(full_path), full_path))
+            except OSError:
+                continue
+        entries.sort()
+        for _, full_path in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(full_path)
+            except OSError:
+                pass
+
+    def _remember(self, path: str, entry: dict) -> None:
+        # Records are kept as a tuple and handed out as fresh lists, so a caller
+        # that sorts or appends to its result cannot change the cache
+        entry["records"] = tuple(entry["records"])
+        self._memory[path] = entry
+        self._memory.move_to_end(path)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, glb_path: str) -> List[SnapshotRecord]:
+        path = os.path.abspath(glb_path)
+        stat = os.stat(path)
+
+        with self._lock:
+            entry = self._memory.get(path)
+            if entry is not None and self._is_fresh(entry, path, stat):
+                self._memory.move_to_end(path)
+                return list(entry["records"])
+
+        disk_entry = self._read_disk(path)
+        if disk_entry is not None and self._is_fresh(disk_entry, path, stat):
+            records = _records_from_json(disk_entry["records"])
+            self._touch_disk(path)
+        else:
+            return self.store(path, extract_snapshots(path), stat)
+
+        with self._lock:
+            self._remember(path, {**disk_entry, "records": records})
+        return list(records)
+
+    def store(self, glb_path: str, records: List[SnapshotRecord],
+              stat: Optional[os.stat_result] = None) -> List[SnapshotRecord]:
+        """Cache *records* extracted elsewhere (e.g. by a background job).
+
+        *stat* must describe the file the records were extracted from; when it
+        is omitted the file is stat-ed now.
+        """
+        path = os.path.abspath(glb_path)
+        if stat is None:
+            stat = os.stat(path)
+        disk_entry = {
+            "version": CACHE_FORMAT_VERSION,
+            "path": path,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_digest(path) if self.verify_hash else None,
+            "records": _records_to_json(records),
+        }
+        self._write_disk(path, disk_entry)
+
+        with self._lock:
+            self._remember(path, {**disk_entry, "records": records})
+        return list(records)
+
+    def invalidate(self, glb_path: str) -> None:
+        path = os.path.abspath(glb_path)
+        with self._lock:
+            self._memory.pop(path, None)
+        try:
+            os.remove(self._entry_path(path))
+        except OSError:
+            pass
+
+
+_caches: Dict[str, SnapshotCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_snapshot_cache(app) -> SnapshotCache:
+    """Return the process-wide cache configured for *app*."""
+    cache_dir = app.config.get("SNAPSHOT_CACHE_DIR") or os.path.join(app.instance_path, "processed", "snapshot_cache")
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = SnapshotCache(
+                cache_dir,
+                max_entries=app.config.get("SNAPSHOT_CACHE_MAX_ENTRIES", 32),
+                verify_hash=app.config.get("SNAPSHOT_CACHE_VERIFY_HASH", False),
+            )
+            _caches[cache_dir] = cache
+        return cache
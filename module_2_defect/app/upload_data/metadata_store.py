@@ -0,0 +1,260 @@
+"""Per-upload metadata, stored in the ``uploads`` tables.
+
+This replaces the single ``latest_upload.json`` that every upload and every
+image assignment rewrote. Each upload is a row, and each image assignment
+is a row of its own, so an assignment is written without touching the rest
+of the upload.
+
+Readers get the metadata as the dict the JSON file used to hold. The most
+recently read uploads (``CACHE_MAX_ENTRIES``) are cached in-process per
+instance folder. A cached copy is checked against the row's ``revision``
+(one indexed single-row query) and dropped on every local write.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import Upload, UploadImageAssignment
+
+LEGACY_METADATA_FILENAME = "latest_upload.json"
+
+_COLUMNS = {"unit_no", "notes", "glb_path", "pdf_path", "image_dir", "job_id", "manifest", "images"}
+
+CACHE_MAX_ENTRIES = 32
+ASSIGN_ATTEMPTS = 3
+
+# (instance path, upload id) -> (revision, metadata dict), least recently used first
+_cache: "OrderedDict[Tuple[str, str], Tuple[int, dict]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(upload_id: str) -> Tuple[str, str]:
+    return current_app.instance_path, upload_id
+
+
+def _invalidate(upload_id: str) -> None:
+    with _cache_lock:
+        _cache.pop(_cache_key(upload_id), None)
+
+
+def _bump_revision(upload_id: str) -> bool:
+    updated = (
+        Upload.query.filter_by(id=upload_id)
+        .update({Upload.revision: Upload.revision + 1}, synchronize_session=False)
+    )
+    return bool(updated)
+
+
+def _copy(metadata: dict) -> dict:
+    # Callers may edit the assignments of the dict they get; the rest is read-only
+    copied = dict(metadata)
+    copied["assignments"] = {"defect_to_image": dict(metadata["assignments"]["defect_to_image"])}
+    return copied
+
+
+def latest_upload_key() -> Optional[Tuple[str, int]]:
+    """``(id, revision)`` of the newest upload, or ``None`` before the first."""
+    row = (
+        db.session.query(Upload.id, Upload.revision)
+        .order_by(Upload.created_at.desc(), Upload.id.desc())
+        .first()
+    )
+    return (row.id, row.revision) if row else None
+
+
+def load_upload(upload_id: Optional[str] = None) -> Optional[dict]:
+    """Metadata of *upload_id*, or of the newest upload when it is ``None``."""
+    if upload_id:
+        revision = db.session.query(Upload.revision).filter(Upload.id == upload_id).scalar()
+        if revision is None:
+            return None
+    else:
+        latest = latest_upload_key()
+        if latest is None:
+            return None
+        upload_id, revision = latest
+
+    key = _cache_key(upload_id)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+    if cached and cached[0] == revision:
+        return _copy(cached[1])
+
+    upload = db.session.get(Upload, upload_id)
+    if upload is None:
+        return None
+    metadata = upload.to_dict()
+    with _cache_lock:
+        _cache[key] = (upload.revision, metadata)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return _copy(metadata)
+
+
+def create_upload(upload_id: str, **fields) -> None:
+    upload = Upload(id=upload_id)
+    _apply(upload, fields)
+    db.session.add(upload)
+    db.session.commit()
+
+
+def _apply(upload: Upload, fields: dict) -> None:
+    extra = dict(upload.extra or {})
+    for name, value in fields.items():
+        if name in _COLUMNS:
+            setattr(upload, name, value)
+        elif name not in ("id", "created_at", "assignments"):
+            extra[name] = value
+    upload.extra = extra or None
+
+
+def update_upload(upload_id: str, updates) -> bool:
+    """Merge *updates* into one upload; ``False`` if it no longer exists.
+
+    The row is locked while ``extra`` is merged, so concurrent updates apply
+    one after the other, and the revision is bumped in SQL like
+    ``_bump_revision()`` does. *updates* may be a callable that builds the
+    dict from the locked ``Upload`` row.
+    """
+    upload = (
+        Upload.query.filter_by(id=upload_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    if upload is None:
+        db.session.rollback()
+        return False
+    _apply(upload, updates(upload) if callable(updates) else updates)
+    upload.revision = Upload.revision + 1
+    db.session.commit()
+    _invalidate(upload_id)
+    return True
+
+
+def add_upload_scan(upload_id: str, scan_id: int) -> bool:
+    """Record that *scan_id* was saved from the upload (``metadata['scan_ids']``)."""
+    return update_upload(
+        upload_id, lambda upload: {"scan_ids": [*(upload.extra or {}).get("scan_ids", []), scan_id]}
+    )
+
+
+def assign_image(upload_id: str, defect_key: str, image_id: str) -> Optional[List[str]]:
+    """Link *image_id* to *defect_key*, replacing any link either already had.
+
+    Returns the defect keys whose previous link was removed. A concurrent
+    assignment of the same defect makes the insert fail; it is retried
+    against the winner's row, and ``None`` is returned if it keeps losing.
+    """
+    for _ in range(ASSIGN_ATTEMPTS):
+        try:
+            return _assign_image(upload_id, defect_key, image_id)
+        except IntegrityError:
+            db.session.rollback()
+    return None
+
+
+def _assign_image(upload_id: str, defect_key: str, image_id: str) -> List[str]:
+    replaced = [
+        row.defect_key
+        for row in UploadImageAssignment.query.filter(
+            UploadImageAssignment.upload_id == upload_id,
+            db.or_(UploadImageAssignment.defect_key == defect_key, UploadImageAssignment.image_id == image_id),
+        )
+    ]
+    if replaced:
+        UploadImageAssignment.query.filter(
+            UploadImageAssignment.upload_id == upload_id,
+            UploadImageAssignment.defect_key.in_(replaced),
+        ).delete(synchronize_session=False)
+    db.session.add(UploadImageAssignment(upload_id=upload_id, defect_key=defect_key, image_id=image_id))
+    _bump_revision(upload_id)
+    db.session.commit()
+    _invalidate(upload_id)
+    return replaced
+
+
+def unassign_image(upload_id: str, image_id: str) -> List[str]:
+    """Remove every link to *image_id*; returns the defect keys it was linked to."""
+    removed = [
+        row.defect_key
+        for row in UploadImageAssignment.query.filter_by(upload_id=upload_id, image_id=image_id)
+    ]
+    if removed:
+        UploadImageAssignment.query.filter_by(upload_id=upload_id, image_id=image_id).delete(
+            synchronize_session=False
+        )
+        _bump_revision(upload_id)
+        db.session.commit()
+        _invalidate(upload_id)
+    return removed
+
+
+def set_initial_assignments(upload_id: str, mapping: Dict[str, str]) -> bool:
+    """Store *mapping* as the assignments of an upload that has none yet.
+
+    Returns ``False`` (and stores nothing) if another request got there first.
+    """
+    if not mapping or UploadImageAssignment.query.filter_by(upload_id=upload_id).first() is not None:
+        return False
+    db.session.add_all(
+        UploadImageAssignment(upload_id=upload_id, defect_key=defect_key, image_id=image_id)
+        for defect_key, image_id in mapping.items()
+    )
+    _bump_revision(upload_id)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    _invalidate(upload_id)
+    return True
+
+
+def import_legacy_metadata(upload_root: str) -> Optional[str]:
+    """Move an old ``latest_upload.json`` into the database, once.
+
+    The file is renamed to ``*.imported`` afterwards. Returns the imported
+    upload id.
+    """
+    path = os.path.join(upload_root, LEGACY_METADATA_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            metadata = json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        current_app.logger.warning("Could not read legacy upload metadata %s", path, exc_info=True)
+        return None
+
+    upload_id = metadata.get("id") or "upload_legacy"
+    if db.session.get(Upload, upload_id) is None:
+        upload = Upload(id=upload_id)
+        try:
+            upload.created_at = datetime.strptime(str(metadata.get("created_at")), "%Y%m%d%H%M%S")
+        except ValueError:
+            pass
+        _apply(upload, metadata)
+        mapping = (metadata.get("assignments") or {}).get("defect_to_image") or {}
+        upload.assignments = [
+            UploadImageAssignment(defect_key=str(defect_key), image_id=str(image_id))
+            for defect_key, image_id in mapping.items()
+            if image_id
+        ]
+        db.session.add(upload)
+        db.session.commit()
+    os.replace(path, f"{path}.imported")
+    return upload_id
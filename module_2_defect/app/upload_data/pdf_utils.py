@@ -1,18 +1,119 @@
-"""Helpers for extracting images from uploaded PDF defect reports."""
+"""Helpers for extracting images from uploaded PDF defect reports.
+
+Pages can be split into ranges and decoded in a process pool. Image bytes
+are hashed as they are decoded and every distinct image is written once;
+repeats (logos, headers, the same photo on several pages) are reported with
+``duplicate_of`` pointing at the first occurrence and share its file.
+"""
 
 from __future__ import annotations
 
+import hashlib
 import os
+import shutil
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 from pypdf import PdfReader
 
+# Page ranges per worker; more than one evens out pages of very different weight.
+SHARDS_PER_WORKER = 4
+
+
+def _image_format(image) -> str:
+    image_format = getattr(image, "image_format", None)
+    if not image_format:
+        image_format = Path(getattr(image, "name", "") or "").suffix.lstrip(".") or "png"
+    image_format = image_format.lower()
+    return "jpg" if image_format == "jpeg" else image_format
+
+
+def _image_size(image) -> Tuple[Optional[int], Optional[int]]:
+    width = getattr(image, "width", None)
+    height = getattr(image, "height", None)
+    if width is None and getattr(image, "image", None) is not None:
+        width, height = image.image.size
+    return width, height
+
+
+def _xobject_ref(page, key) -> Optional[Tuple[int, int]]:
+    """Indirect reference of a page-level image XObject, without decoding it."""
+    if not isinstance(key, str) or key.startswith("~"):
+        return None
+    try:
+        ref = page["/Resources"]["/XObject"].raw_get(key)
+    except (KeyError, TypeError, AttributeError):
+        return None
+    idnum = getattr(ref, "idnum", None)
+    return (idnum, ref.generation) if idnum is not None else None
+
+
+def _store_staged(staging_dir: str, digest: str, data: bytes) -> None:
+    path = os.path.join(staging_dir, digest)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return  # another page range found the same image first
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+
+
+def _extract_page_range(pdf_path: str, first: int, last: int, staging_dir: str) -> List[Dict[str, Any]]:
+    """Decode the images on pages ``first..last`` (1-based, inclusive).
+
+    Each distinct image is written to *staging_dir* under its SHA-256; an
+    XObject shared by several pages is only decoded once per range.
+    """
+    reader = PdfReader(pdf_path)
+    occurrences: List[Dict[str, Any]] = []
+    decoded: Dict[Tuple[int, int], Dict[str, Any]] = {}
+
+    for page_number in range(first, last + 1):
+        page = reader.pages[page_number - 1]
+        images = getattr(page, "images", []) or []
+        try:
+            keys = list(images.keys())
+        except AttributeError:
+            keys = [None] * len(images)
+
+        for image_index, key in enumerate(keys, start=1):
+            ref = _xobject_ref(page, key) if key is not None else None
+            info = decoded.get(ref) if ref is not None else None
+            if info is None:
+                image = images[key] if key is not None else images[image_index - 1]
+                data = image.data
+                digest = hashlib.sha256(data).hexdigest()
+                _store_staged(staging_dir, digest, data)
+                width, height = _image_size(image)
+                info = {"sha256": digest, "format": _image_format(image), "width": width, "height": height}
+                if ref is not None:
+                    decoded[ref] = info
+            occurrences.append({"page": page_number, "index": image_index, **info})
+    return occurrences
+
 
-def extract_pdf_images(pdf_path: str, output_dir: str) -> List[Dict[str, Any]]:
+def _page_ranges(page_count: int, shards: int) -> List[Tuple[int, int]]:
+    shards = max(1, min(shards, page_count))
+    size, extra = divmod(page_count, shards)
+    ranges = []
+    first = 1
+    for shard in range(shards):
+        last = first + size - 1 + (1 if shard < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+def extract_pdf_images(pdf_path: str, output_dir: str, workers: int = 1,
+                       executor: Optional[Executor] = None) -> List[Dict[str, Any]]:
     """Extract embedded images from *pdf_path* into *output_dir*.
 
-    Returns metadata for each saved image so the caller can build UI links.
+    Returns metadata for each image occurrence, in page order, so the caller
+    can build UI links. ``duplicate_of`` is the id of the first occurrence of
+    the same bytes (``None`` for that first one) and duplicates reuse its
+    ``file``. With ``workers > 1`` page ranges are decoded in parallel, on
+    *executor* if one is given (sized for ``workers``) or on a private pool.
     """
 
     pdf_path_obj = Path(pdf_path)
@@ -21,33 +122,58 @@ def extract_pdf_images(pdf_path: str, output_dir: str) -> List[Dict[str, Any]]:
 
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
+    staging_dir = output_path / f".staging-{os.getpid()}"
+    staging_dir.mkdir(exist_ok=True)
 
-    reader = PdfReader(str(pdf_path_obj))
-    extracted: List[Dict[str, Any]] = []
-    counter = 0
+    try:
+        page_count = len(PdfReader(str(pdf_path_obj)).pages)
+        if page_count == 0:
+            return []
 
-    for page_number, page in enumerate(reader.pages, start=1):
-        images = getattr(page, "images", []) or []
-        for image_index, image in enumerate(images, start=1):
-            counter += 1
-            image_format = (getattr(image, "image_format", "png") or "png").lower()
-            if image_format == "jpeg":
-                image_format = "jpg"
-
-            filename = f"page{page_number:02d}_img{image_index:02d}_{counter}.{image_format}"
-            filepath = output_path / filename
-
-            with open(filepath, "wb") as image_file:
-                image_file.write(image.data)
-
-            extracted.append(
-                {
-                    "id": f"img_{counter}",
-                    "file": filename,
-                    "page": page_number,
-                    "width": getattr(image, "width", None),
-                    "height": getattr(image, "height", None),
-                }
-            )
-
-    return extracted
+        if executor is not None:
+            occurrences = _extract_parallel(executor, str(pdf_path_obj), page_count, workers, str(staging_dir))
+        elif workers > 1:
+            from ..jobs.runner import process_pool
+
+            with process_pool(workers) as pool:
+                occurrences = _extract_parallel(pool, str(pdf_path_obj), page_count, workers, str(staging_dir))
+        else:
+            occurrences = _extract_page_range(str(pdf_path_obj), 1, page_count, str(staging_dir))
+
+        extracted: List[Dict[str, Any]] = []
+        first_seen: Dict[str, Dict[str, Any]] = {}
+        for counter, occurrence in enumerate(occurrences, start=1):
+            digest = occurrence["sha256"]
+            original = first_seen.get(digest)
+            if original is None:
+                filename = f"page{occurrence['page']:02d}_img{occurrence['index']:02d}_{counter}.{occurrence['format']}"
+                os.replace(staging_dir / digest, output_path / filename)
+            else:
+                filename = original["file"]
+
+            entry = {
+                "id": f"img_{counter}",
+                "file": filename,
+                "page": occurrence["page"],
+                "width": occurrence["width"],
+                "height": occurrence["height"],
+                "sha256": digest,
+                "duplicate_of": original["id"] if original else None,
+            }
+            if original is None:
+                first_seen[digest] = entry
+            extracted.append(entry)
+
+        return extracted
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _extract_parallel(executor: Executor, pdf_path: str, page_count: int, workers: int,
+                      staging_dir: str) -> List[Dict[str, Any]]:
+    ranges = _page_ranges(page_count, max(1, workers) * SHARDS_PER_WORKER)
+    futures = [executor.submit(_extract_page_range, pdf_path, first, last, staging_dir) for first, last in ranges]
+    occurrences: List[Dict[str, Any]] = []
+    for future in futures:  # ranges are in page order
+        occurrences.extend(future.result())
+    return occurrences
@@ -1,17 +1,20 @@
-import json
 import os
+import uuid
 from datetime import datetime
+from typing import Optional
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from werkzeug.utils import secure_filename
 
-from .pdf_utils import extract_pdf_images
+from ..jobs.runner import enqueue, get_job_runner
+from ..process_data.glb_lod import remove_lods
+from ..process_data.snapshot_cache import get_snapshot_cache
+from .metadata_store import create_upload
 
 upload_data_bp = Blueprint("upload_data", __name__)
 
 ALLOWED_GLB_EXT = {".glb"}
 ALLOWED_PDF_EXT = {".pdf"}
-METADATA_FILENAME = "latest_upload.json"
 
 def _allowed_file(filename: str, allowed_exts) -> bool:
     _, ext = os.path.splitext(filename.lower())
@@ -31,6 +34,7 @@ def upload_scan_data():
 
     try:
         glb_file = request.files.get("glb_model")
+        pdf_file = request.files.get("pdf_report")
         unit_no = request.form.get("unit_no", "")
         notes = request.form.get("notes", "")
 
@@ -42,46 +46,74 @@ def upload_scan_data():
             flash("Invalid 3D model file type. Only .glb is allowed.", "error")
             return redirect(request.url)
 
+        if pdf_file and pdf_file.filename and not _allowed_file(pdf_file.filename, ALLOWED_PDF_EXT):
+            flash("Invalid report file type. Only .pdf is allowed.", "error")
+            return redirect(request.url)
+
         upload_root = os.path.join(current_app.instance_path, "uploads", "upload_data")
         os.makedirs(upload_root, exist_ok=True)
 
         timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        upload_id = f"upload_{timestamp}"
+        # Suffixed so two uploads in the same second get their own records
+        upload_id = f"upload_{timestamp}_{uuid.uuid4().hex[:6]}"
 
         glb_name = secure_filename(glb_file.filename)
         glb_path = os.path.join(upload_root, glb_name)
         glb_file.save(glb_path)
-
-        _persist_latest_upload_metadata(
-            upload_root,
-            {
-                "id": upload_id,
-                "created_at": timestamp,
-                "unit_no": unit_no,
-                "glb_path": glb_path,
-                "notes": notes,
-            },
+        get_snapshot_cache(current_app).invalidate(glb_path)
+        remove_lods(glb_path)
+
+        pdf_path = None
+        if pdf_file and pdf_file.filename:
+            pdf_path = os.path.join(upload_root, f"{upload_id}_{secure_filename(pdf_file.filename)}")
+            pdf_file.save(pdf_path)
+
+        job = _start_automated_data_processing(upload_root, upload_id, glb_path, pdf_path, unit_no, notes)
+
+        create_upload(
+            upload_id,
+            unit_no=unit_no,
+            glb_path=glb_path,
+            pdf_path=pdf_path,
+            notes=notes,
+            job_id=job.id,
         )
+        # Started only now so the job never races the metadata it updates
+        get_job_runner(current_app._get_current_object()).start(job.id)
 
-        _start_automated_data_processing(glb_path, unit_no, notes)
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({
+                "upload_id": upload_id,
+                "job_id": job.id,
+                "status_url": url_for("jobs.job_status", job_id=job.id),
+            }), 202
 
-        flash("Scan data uploaded successfully. Automated processing has started.", "success")
+        flash(f"Scan data uploaded successfully. Automated processing has started (job #{job.id}).", "success")
         return redirect(url_for("upload_data.upload_scan_data"))
     except Exception as e:
         current_app.logger.error("Error during upload: %s", str(e))
         flash(f"An error occurred during upload: {str(e)}", "error")
         return redirect(request.url)
 
-def _start_automated_data_processing(glb_path: str, unit_no: str, notes: str) -> None:
+def _start_automated_data_processing(upload_root: str, upload_id: str, glb_path: str,
+                                     pdf_path: Optional[str], unit_no: str, notes: str):
     current_app.logger.info("Starting automated processing for:")
     current_app.logger.info("GLB: %s", glb_path)
     current_app.logger.info("Unit No: %s", unit_no)
+    if pdf_path:
+        current_app.logger.info("PDF: %s", pdf_path)
     if notes:
         current_app.logger.info("Notes: %s", notes)
-    # TODO: implement real processing here
-
+    return enqueue(
+        current_app._get_current_object(),
+        "process_upload",
+        {
+            "upload_root": upload_root,
+            "upload_id": upload_id,
+            "glb_path": glb_path,
+            "pdf_path": pdf_path,
+            "image_dir": os.path.join(upload_root, f"{upload_id}_images"),
+        },
+        start=False,
+    )
 
-def _persist_latest_upload_metadata(upload_root: str, payload: dict) -> None:
-    metadata_path = os.path.join(upload_root, METADATA_FILENAME)
-    with open(metadata_path, "w", encoding="utf-8") as fh:
-        json.dump(payload, fh, indent=2)
\ No newline at end of file
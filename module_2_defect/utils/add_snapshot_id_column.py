@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Migration script to add defects.snapshot_id (indexed with scan_id) and defect_images.source.
+Run this once to update an existing database; new databases get both from
+db.create_all().
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.extensions import db
+
+MIGRATIONS = [
+    ("defects", "snapshot_id", "ALTER TABLE defects ADD COLUMN snapshot_id VARCHAR(255)"),
+    ("defect_images", "source", "ALTER TABLE defect_images ADD COLUMN source VARCHAR(20)"),
+]
+
+
+def add_snapshot_id_column():
+    """Add the columns and the (scan_id, snapshot_id) index if they don't exist"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            with db.engine.connect() as conn:
+                for table, column, statement in MIGRATIONS:
+                    if column in {col["name"] for col in inspector.get_columns(table)}:
+                        print(f"✓ '{table}.{column}' already exists")
+                        continue
+                    print(f"Adding '{table}.{column}'...")
+                    conn.execute(db.text(statement))
+                    print(f"✓ Added '{table}.{column}'")
+
+                conn.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_defects_scan_snapshot ON defects (scan_id, snapshot_id)"
+                ))
+                # Superseded by the composite index: lookups are always per scan
+                conn.execute(db.text("DROP INDEX IF EXISTS ix_defects_snapshot_id"))
+                conn.commit()
+                print("✓ Index ix_defects_scan_snapshot is in place")
+                print("\nDefects saved before this migration have no snapshot_id; "
+                      "re-save the scan to link report images to them.")
+        except Exception as e:
+            print(f"Error migrating database: {e}")
+
+
+if __name__ == '__main__':
+    add_snapshot_id_column()
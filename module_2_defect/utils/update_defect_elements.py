@@ -1,77 +1,98 @@
 #!/usr/bin/env python3
 """
-Update existing defects with element data from GLB snapshot names
+Update existing defects with the building element nearest to their coordinates.
+
+Each scan's GLB is indexed once (a BVH over mesh bounds, read from the GLB
+JSON chunk) and all of that scan's defects are resolved in a single batch.
+Pass --all to re-attribute defects that already have an element.
 """
 import sqlite3
 import os
 import sys
-import json
+from collections import defaultdict
 
 # Add parent directory to path
 sys.path.insert(0, '/usr/src/app')
 
 try:
-    from pygltflib import GLTF2
-    from app.process_data.glb_snapshot import extract_snapshots
+    from app.process_data.element_bvh import ElementIndex
 except ImportError:
-    print("Error: pygltflib not installed")
+    print("Error: numpy is not installed")
     sys.exit(1)
 
 # Get the database path
 script_dir = os.path.dirname(os.path.abspath(__file__))
 db_path = os.path.join(script_dir, 'instance', 'ldms.db')
-metadata_path = os.path.join(script_dir, 'instance', 'uploads', 'upload_data', 'latest_upload.json')
-
-def update_defects_from_glb():
-    # Load upload metadata
-    if not os.path.exists(metadata_path):
-        print(f"Metadata not found at {metadata_path}")
-        return
-    
-    with open(metadata_path, 'r') as f:
-        metadata = json.load(f)
-    
-    glb_path = metadata.get('glb_path')
-    if not glb_path or not os.path.exists(glb_path):
-        print(f"GLB file not found: {glb_path}")
-        return
-    
-    # Extract snapshots with element data
-    print(f"Extracting snapshots from {glb_path}...")
-    snapshots = extract_snapshots(glb_path)
-    
-    # Create mapping from snapshot ID to element
-    snapshot_map = {}
-    for snap in snapshots:
-        snapshot_map[snap.snapshot_id] = snap.element
-    
-    print(f"Found {len(snapshots)} snapshots with element data")
-    
-    # Update database
+glb_search_dirs = [
+    os.path.join(script_dir, 'instance', 'processed', 'module1'),
+    os.path.join(script_dir, 'instance', 'uploads', 'upload_data'),
+]
+
+
+def _latest_upload_glb(cursor):
+    try:
+        cursor.execute("SELECT glb_path FROM uploads ORDER BY created_at DESC LIMIT 1")
+    except sqlite3.OperationalError:  # database predates the uploads table
+        return None
+    row = cursor.fetchone()
+    glb_path = row[0] if row else None
+    return glb_path if glb_path and os.path.exists(glb_path) else None
+
+
+def _resolve_glb(model_path):
+    if not model_path:
+        return None
+    if os.path.isabs(model_path) and os.path.exists(model_path):
+        return model_path
+    for directory in glb_search_dirs:
+        candidate = os.path.join(directory, os.path.basename(model_path))
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def update_defects_from_glb(overwrite=False):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    
-    # Get all defects
-    cursor.execute("SELECT id, description FROM defects WHERE element IS NULL")
-    defects = cursor.fetchall()
-    
-    updated = 0
-    for defect_id, description in defects:
-        # Try to extract snapshot ID from description
-        if 'Snapshot' in description:
-            parts = description.split('/')
-            if len(parts) >= 2:
-                snapshot_id = parts[-1]
-                element = snapshot_map.get(snapshot_id)
-                if element:
-                    cursor.execute("UPDATE defects SET element = ? WHERE id = ?", (element, defect_id))
-                    updated += 1
-                    print(f"  Updated defect {defect_id}: element = {element}")
-    
+    fallback_glb = _latest_upload_glb(cursor)
+
+    query = "SELECT d.id, d.scan_id, d.x, d.y, d.z, s.model_path FROM defects d JOIN scans s ON s.id = d.scan_id"
+    if not overwrite:
+        query += " WHERE d.element IS NULL"
+    cursor.execute(query)
+
+    by_glb = defaultdict(list)
+    skipped = 0
+    for defect_id, scan_id, x, y, z, model_path in cursor.fetchall():
+        glb_path = _resolve_glb(model_path) or fallback_glb
+        if not glb_path:
+            skipped += 1
+            continue
+        by_glb[glb_path].append((defect_id, (x, y, z)))
+
+    updates = []
+    for glb_path, rows in by_glb.items():
+        print(f"Indexing mesh bounds in {glb_path}...")
+        index = ElementIndex.from_glb(glb_path)
+        if not len(index):
+            print("  No mesh primitives found, skipping")
+            skipped += len(rows)
+            continue
+
+        elements = index.nearest_elements([coords for _, coords in rows])
+        for (defect_id, _), element in zip(rows, elements):
+            if element:
+                updates.append((element, defect_id))
+        print(f"  Resolved {len(rows)} defects against {len(index)} mesh primitives")
+
+    cursor.executemany("UPDATE defects SET element = ? WHERE id = ?", updates)
     conn.commit()
     conn.close()
-    
-    print(f"\n✓ Updated {updated} defects with element data")
+
+    print(f"\n✓ Updated {len(updates)} defects with element data")
+    if skipped:
+        print(f"  {skipped} defects skipped (no GLB found for their scan)")
+
 
 if __name__ == '__main__':
-    update_defects_from_glb()
+    update_defects_from_glb(overwrite='--all' in sys.argv[1:])
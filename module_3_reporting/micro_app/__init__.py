@@ -19,7 +19,10 @@ def create_app():
 
     try:
         from app.module3.extensions import db
+        from app.db import sqlalchemy_engine_options, register_pool_metrics
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlalchemy_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
         db.init_app(app)
+        register_pool_metrics(app, db)
         print("Database initialized successfully", file=sys.stderr)
     except Exception as e:
         print(f"Failed to initialize database: {e}", file=sys.stderr)
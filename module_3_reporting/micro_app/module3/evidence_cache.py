@@ -0,0 +1,135 @@
+import os
+import math
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+# Evidence photos are drawn into a 200x100 pt box (see generate_report_api);
+# 200 dpi is plenty for print and keeps each embedded JPEG to tens of KB.
+EVIDENCE_BOX = (200, 100)
+PRINT_DPI = 200
+JPEG_QUALITY = 85
+# Flask's default instance folder of micro_app, whatever the working directory
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CACHE_DIR = os.environ.get("EVIDENCE_CACHE_DIR", os.path.join(SERVICE_ROOT, "instance", "evidence"))
+# Least recently used files go first once the cache outgrows either cap
+CACHE_MAX_BYTES = int(os.environ.get("EVIDENCE_CACHE_MAX_MB", 512)) * 1024 * 1024
+CACHE_MAX_AGE = int(os.environ.get("EVIDENCE_CACHE_MAX_DAYS", 30)) * 86400
+PRUNE_INTERVAL = 60  # seconds between scans of the cache folder
+WORKERS = int(os.environ.get("EVIDENCE_WORKERS", min(8, (os.cpu_count() or 1) + 2)))
+
+_executor = None
+_executor_lock = threading.Lock()
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+# =========================
+# UTILITIES
+# =========================
+def _target_pixels(box=EVIDENCE_BOX, dpi=PRINT_DPI):
+    return tuple(int(math.ceil(side * dpi / 72.0)) for side in box)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _render(source_path, cache_path, target):
+    with Image.open(source_path) as im:
+        im.draft("RGB", target)  # JPEG: let the decoder downscale
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail(target, Image.LANCZOS)
+        if im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info:
+            rgba = im.convert("RGBA")
+            im = Image.new("RGB", rgba.size, (255, 255, 255))
+            im.paste(rgba, mask=rgba.getchannel("A"))
+        elif im.mode != "RGB":
+            im = im.convert("RGB")
+
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        im.save(tmp_path, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        os.replace(tmp_path, cache_path)
+
+
+def _prune(now=None):
+    """Evict files unused for ``CACHE_MAX_AGE``, then the oldest over ``CACHE_MAX_BYTES``."""
+    global _last_prune
+    now = time.time() if now is None else now
+    if now - _last_prune < PRUNE_INTERVAL or not _prune_lock.acquire(blocking=False):
+        return
+    try:
+        _last_prune = now
+        entries = []
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                if entry.name.endswith(".jpg") and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if total <= CACHE_MAX_BYTES and now - mtime <= CACHE_MAX_AGE:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+    finally:
+        _prune_lock.release()
+
+
+# =========================
+# EVIDENCE IMAGES
+# =========================
+def evidence_image(source_path, box=EVIDENCE_BOX, dpi=PRINT_DPI):
+    """Path of a print-resolution JPEG of *source_path*, built on first use.
+
+    Cached files are keyed by the SHA-256 of the source and the pixel size,
+    so the same photo shared by several defects (or reports) is decoded
+    once, and passing the returned path to ``drawImage`` lets reportlab embed
+    it once per document.
+    """
+    width, height = _target_pixels(box, dpi)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cache_path = os.path.join(CACHE_DIR, f"{_file_sha256(source_path)}_{width}x{height}.jpg")
+    try:
+        os.utime(cache_path)  # Mark as recently used for _prune()
+    except FileNotFoundError:
+        _render(source_path, cache_path, (width, height))
+        _prune()
+    return cache_path
+
+
+def _safe_evidence_image(source_path):
+    try:
+        return evidence_image(source_path)
+    except Exception as e:
+        print(f"[evidence] Could not prepare {source_path}: {e}")
+        return None
+
+
+def prefetch_evidence(source_paths):
+    """Start preparing evidence images in the background.
+
+    Returns ``{source_path: Future}``; each future yields the cached JPEG
+    path, or ``None`` if the source is missing or unreadable.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="evidence")
+
+    futures = {}
+    for path in source_paths:
+        if path and path not in futures and os.path.exists(path):
+            futures[path] = _executor.submit(_safe_evidence_image, path)
+    return futures
@@ -1,7 +1,6 @@
 from flask import Blueprint, send_file, request, current_app, jsonify
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
 from io import BytesIO
 from datetime import datetime
 import os
@@ -17,9 +16,17 @@ from .ai_translate_cached import translate_defects_cached
 
 # We need this to build the inner defect lists
 from .report_data import build_defect_list
+from .evidence_cache import prefetch_evidence
 
 routes = Blueprint("routes", __name__)
 
+# Uploaded defect photos, as mounted from the main app's container
+MAIN_STATIC_ROOT = "/usr/src/app_main/app/static/"
+
+
+def _evidence_source(image_path):
+    return os.path.join(MAIN_STATIC_ROOT, image_path.lstrip('/')) if image_path else None
+
 def draw_justified_line(pdf, text, x, y, max_width, font_name, font_size):
     words = text.split()
     if len(words) <= 1:
@@ -122,6 +129,9 @@ def generate_report_api(report_type):
                 "image_path": defect_image_path
             })
 
+        # Downscale evidence photos in the background while the AI text is generated
+        evidence_futures = prefetch_evidence([_evidence_source(d["image_path"]) for d in defects])
+
         # Calculate stats
         stats = {
             "total": len(defects),
@@ -384,7 +394,8 @@ def generate_report_api(report_type):
         pdf.setFont("Helvetica", 9)
 
         evidence_dir = os.path.join(current_app.root_path, "evidence")
-        
+        evidence = {path: future.result() for path, future in evidence_futures.items()}
+
         for i, defect in enumerate(defects, 1):
             if y < 260:
                 draw_footer(pdf, width, labels)
@@ -413,8 +424,8 @@ def generate_report_api(report_type):
             # Evidence
             # Use real uploaded image paths for accurate images
             if defect.get('image_path'):
-                image_path = os.path.join("/usr/src/app_main/app/static/", defect['image_path'].lstrip('/'))
-                if os.path.exists(image_path):
+                image_path = _evidence_source(defect['image_path'])
+                if image_path in evidence:
                     if y < 180:
                         draw_footer(pdf, width, labels)
                         pdf.showPage()
@@ -422,8 +433,12 @@ def generate_report_api(report_type):
                     pdf.setFont("Helvetica-Oblique", 8)
                     pdf.drawString(70, y, f"{labels['evidence']}")
                     try:
-                        # Constrain the image to a bounding box of 200x100 to prevent overlap
-                        pdf.drawImage(ImageReader(image_path), 140, y - 110, width=200, height=100, preserveAspectRatio=True)
+                        if not evidence[image_path]:
+                            raise ValueError("unreadable image")
+                        # Constrain the image to a bounding box of 200x100 to prevent overlap.
+                        # A file path (not an ImageReader) lets reportlab embed the pre-scaled
+                        # JPEG as-is and only once per document.
+                        pdf.drawImage(evidence[image_path], 140, y - 110, width=200, height=100, preserveAspectRatio=True)
                         y -= 125
                     except Exception:
                         pdf.drawString(140, y, ": Image Not Found")
@@ -0,0 +1,30 @@
+"""/metrics/db-pool on the reporting service, which has no LoginManager."""
+import importlib
+import os
+import sys
+
+import pytest
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_ROOT = os.path.dirname(SERVICE_ROOT)
+
+
+@pytest.fixture
+def reporting_app(monkeypatch):
+    monkeypatch.setenv("DB_POOL_METRICS", "1")
+    monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    monkeypatch.setenv("PYTHONPATH_MAIN", MAIN_ROOT)
+    monkeypatch.syspath_prepend(SERVICE_ROOT)
+    # micro_app builds its app at import time, under the environment above
+    for name in [name for name in sys.modules if name == "micro_app" or name.startswith("micro_app.")]:
+        monkeypatch.delitem(sys.modules, name)
+    return importlib.import_module("micro_app").app
+
+
+def test_pool_metrics_registered(reporting_app):
+    assert "/metrics/db-pool" in {rule.rule for rule in reporting_app.url_map.iter_rules()}
+
+
+def test_pool_metrics_without_login_manager(reporting_app):
+    response = reporting_app.test_client().get("/metrics/db-pool")
+    assert response.status_code == 404